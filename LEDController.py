@@ -1,6 +1,8 @@
+import bisect
 import platform
 import config
 import math
+import scheduler
 import utilities
 
 value = platform.platform()
@@ -15,37 +17,213 @@ else:
 
 
 class LEDController(object):
+    _tables = {}  # (PWM range, steps) -> gamma table, built once and shared between controllers
+
     def __init__(self):
         self._pi = GPIOLib.pi()
         self._pin = config.LED_pin
+        self._range = config.LED_PWM_range
+        self._table = LEDController._gamma_table(self._range, config.LED_gamma_steps)
+        self._dither_error = 0.0
+
+        # fade running on the daemon, see start_ramp
+        self._ramp_segments = []
+        self._ramp_script = None
+        self._ramp_job = None
+
+        # last duty cycle written to the daemon, so unchanged values aren't sent again
+        self._shadow = None
+        self.writes = 0
+        self.skipped_writes = 0
+        self._resync_job = None
+
+        self._pi.set_PWM_range(self._pin, self._range)
         self.value_raw = 0
 
+        if config.LED_resync_interval:
+            self._resync_job = scheduler.get_scheduler().call_every(
+                config.LED_resync_interval, self.resync
+            )
+
     def __del__(self):
+        if self._resync_job is not None:
+            self._resync_job.cancel()
+        self.cancel_ramp()
         self.value_raw = 0
         self._pi.stop()
 
     @property
     def value_raw(self):
-        return self._pi.read(self._pin)
+        # the last value written, no round trip to the daemon
+        return self._shadow
 
     @value_raw.setter
     def value_raw(self, value):
+        if value == self._shadow:
+            self.skipped_writes += 1
+            return
         self._pi.set_PWM_dutycycle(self._pin, value)
+        self._shadow = value
+        self.writes += 1
+
+    def resync(self):
+        """
+        Re-read the duty cycle from the daemon, in case something else changed it
+        :return: None
+        """
+        self._shadow = self._pi.get_PWM_dutycycle(self._pin)
 
     @property
     def value(self):
-        return LEDController._inverse_scale(self.value_raw)
+        return self._inverse_scale(self.value_raw)
 
     @value.setter
     def value(self, input):
-        self.value_raw = LEDController._scale(input)
+        self.value_raw = self._quantize(input, self._table[self._table_index(input)])
+
+    def visible_step(self, percent):
+        """
+        Get the smallest brightness change from percent that changes the duty cycle
+        :param percent: brightness [0,100]
+        :return: percent
+        """
+        steps = len(self._table) - 1
+        index = self._table_index(percent)
+        next_index = bisect.bisect_left(self._table, int(self._table[index]) + 1)
+        return max(1, next_index - index) * 100 / steps
+
+    def _table_index(self, percent):
+        steps = len(self._table) - 1
+        index = int(round(percent * steps / 100))
+        return min(steps, max(0, index))
+
+    @property
+    def ramp_running(self):
+        return self._ramp_script is not None
+
+    def start_ramp(self, percentages, interval=1):
+        """
+        Hand a fade to the pigpio daemon, which steps through it without Python's involvement
+        Long fades are uploaded as a script per config.LED_ramp_segment_steps changes, the next
+        uploaded when the previous finishes. Replaces any ramp already running.
+        :param percentages: brightness [0,100] for each step
+        :param interval: seconds each step is held for
+        :return: None
+        """
+        self.cancel_ramp()
+
+        steps = []  # [duty, milliseconds], equal neighbouring duties merged
+        for percent in percentages:
+            duty = int(self._table[self._table_index(percent)])
+            if len(steps) > 0 and steps[-1][0] == duty:
+                steps[-1][1] += int(interval * 1000)
+            else:
+                steps.append([duty, int(interval * 1000)])
+
+        segment_steps = config.LED_ramp_segment_steps
+        self._ramp_segments = [
+            steps[i : i + segment_steps] for i in range(0, len(steps), segment_steps)
+        ]
+        self._run_next_ramp_segment()
+
+    def cancel_ramp(self):
+        """
+        Stop a ramp started by start_ramp, leaving the LED at its current brightness
+        :return: None
+        """
+        if self._ramp_job is not None:
+            self._ramp_job.cancel()
+            self._ramp_job = None
+        self._ramp_segments = []
+        if self._ramp_script is not None:
+            self._pi.stop_script(self._ramp_script)
+            self._finish_ramp_script()
+
+    def _run_next_ramp_segment(self):
+        segment = self._ramp_segments.pop(0)
+        self._ramp_script = self._pi.store_script(self._ramp_script_text(self._pin, segment))
+        self._pi.run_script(self._ramp_script)
+        duration = sum(milliseconds for duty, milliseconds in segment) / 1000
+        self._ramp_job = scheduler.get_scheduler().call_later(duration, self._check_ramp)
+
+    def _check_ramp(self):
+        status, params = self._pi.script_status(self._ramp_script)
+        if status in (GPIOLib.PI_SCRIPT_INITING, GPIOLib.PI_SCRIPT_RUNNING):
+            self._ramp_job.reschedule(0.05)
+            return
+
+        self._finish_ramp_script()
+        if len(self._ramp_segments) > 0:
+            self._run_next_ramp_segment()
+        else:
+            self._ramp_job = None
+
+    def _finish_ramp_script(self):
+        self._pi.delete_script(self._ramp_script)
+        self._ramp_script = None
+        self.resync()  # the daemon has been changing the duty cycle
+
+    @staticmethod
+    def _ramp_script_text(pin, steps):
+        """
+        :param steps: [duty, milliseconds] pairs
+        :return: pigpio script setting each duty and waiting
+        """
+        commands = []
+        for duty, milliseconds in steps:
+            commands.append("pwm {0} {1}".format(pin, duty))
+            while milliseconds > 0:
+                wait = min(milliseconds, 60000)  # longest mils pigpio accepts
+                commands.append("mils {0}".format(wait))
+                milliseconds -= wait
+        return " ".join(commands)
+
+    def _quantize(self, percent, duty):
+        """
+        Get the whole duty cycle to write for a fractional one from the gamma table
+        Below config.LED_dither_below percent, alternates between the steps either side of duty so
+        the average over successive sets matches it (error diffusion)
+        """
+        whole = int(duty)
+        if percent < config.LED_dither_below:
+            self._dither_error += duty - whole
+            if self._dither_error >= 1:
+                self._dither_error -= 1
+                whole += 1
+        else:
+            self._dither_error = 0.0
+        return whole
+
+    def _inverse_scale(self, value_raw):
+        # lowest percentage that gives value_raw
+        steps = len(self._table) - 1
+        index = bisect.bisect_left(self._table, value_raw)
+        return min(steps, index) * 100 / steps
+
+    @classmethod
+    def _gamma_table(cls, pwm_range, steps):
+        """
+        Get the duty cycle (unrounded) for each of steps + 1 evenly spaced percentages
+        :param pwm_range: PWM range the duty cycles are out of
+        :param steps: number of steps between 0% and 100%
+        :return: list of duty cycles
+        """
+        key = (pwm_range, steps)
+        if key not in cls._tables:
+            cls._tables[key] = [cls._curve(i * 100 / steps, pwm_range) for i in range(steps + 1)]
+        return cls._tables[key]
 
     @classmethod
-    def _scale(cls, percent):
+    def _curve(cls, percent, pwm_range=255):
         # this is a scaling based on desired percentage to 8 bit power for linear brightness
         scaled = 0.0127 * (percent ** 2) + 1.3027 * percent - 2
-        scaled = scaled // 1
+        if pwm_range != 255:
+            scaled = scaled * pwm_range / 255
 
         scaled = max(0, scaled)  # remove negatives
-        scaled = min(255, scaled)  # remove high
+        scaled = min(pwm_range, scaled)  # remove high
         return scaled
+
+    @classmethod
+    def _scale(cls, percent, pwm_range=255):
+        return cls._curve(percent, pwm_range) // 1
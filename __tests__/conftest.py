@@ -17,3 +17,11 @@ def temp_db(tmp_path):
     db_file = tmp_path / "db.sqlite"
     db = database.DB(str(db_file))
     yield db
+
+
+@pytest.fixture()
+def temp_sqlite_db(tmp_path):
+    db_file = tmp_path / "db.sqlite"
+    db = database.DB(str(db_file), backend="sqlite")
+    yield db
+    db._close()
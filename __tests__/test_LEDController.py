@@ -1,7 +1,10 @@
+import LEDController as LEDControllerModule
 from LEDController import LEDController
+import utilities
 
 import pytest
 import logging
+import time
 
 
 FORMAT = "[%(funcName)20s] %(message)s"
@@ -31,6 +34,130 @@ def test_led_controller_sets_led(value):
     assert expected == controller.value_raw
 
 
+@pytest.fixture()
+def mock_controller(mocker):
+    mocker.patch.object(LEDControllerModule, "GPIOLib", utilities._MockController)
+    controller = LEDController()
+    yield controller
+
+
+def test_led_controller_same_value__skips_write(mock_controller, mocker):
+    spy = mocker.spy(mock_controller._pi, "set_PWM_dutycycle")
+
+    mock_controller.value = 50
+    mock_controller.value = 50
+
+    assert spy.call_count == 1
+    assert mock_controller.skipped_writes == 1
+
+
+def test_led_controller_value_raw__reads_without_daemon(mock_controller, mocker):
+    mock_controller.value = 50
+    spy = mocker.spy(mock_controller._pi, "read")
+
+    assert LEDController._scale(50) == mock_controller.value_raw
+    spy.assert_not_called()
+
+
+def test_led_controller_changed_externally__resync__writes_again(mock_controller, mocker):
+    mock_controller.value = 50
+    mock_controller._pi.set_PWM_dutycycle(mock_controller._pin, 0)  # something else turned it off
+
+    mock_controller.resync()
+    mock_controller.value = 50
+
+    assert LEDController._scale(50) == mock_controller._pi.values[mock_controller._pin]
+
+
+@pytest.mark.parametrize("value", test_output_percentages)
+def test_gamma_table_at_percentage__matches_scale(value):
+    table = LEDController._gamma_table(255, 1000)
+
+    assert LEDController._scale(value) == table[value * 10] // 1
+
+
+def test_gamma_table__never_decreases():
+    table = LEDController._gamma_table(40000, 1000)
+
+    assert all(low <= high for low, high in zip(table, table[1:]))
+    assert table[-1] == 40000
+
+
+def test_led_controller_high_range__dim_end_has_more_steps(mock_controller, mocker):
+    mocker.patch("config.LED_PWM_range", 10000)
+    controller = LEDController()
+    values = set()
+
+    for tenths in range(10, 30):
+        controller.value = tenths / 10
+        values.add(controller.value_raw)
+
+    assert len(values) > len({LEDController._scale(tenths / 10) for tenths in range(10, 30)})
+
+
+def test_led_controller_dithering__averages_to_fractional_duty(mock_controller, mocker):
+    mocker.patch("config.LED_dither_below", 10)
+    duty = mock_controller._table[25]  # 2.5%
+    written = []
+
+    for _ in range(100):
+        mock_controller.value = 2.5
+        written.append(mock_controller.value_raw)
+
+    assert len(set(written)) == 2
+    assert sum(written) / len(written) == pytest.approx(duty, abs=0.01)
+
+
+@pytest.mark.parametrize("value", [0, 20, 50, 100])
+def test_led_controller_set_value__value_reads_back(mock_controller, value):
+    mock_controller.value = value
+
+    assert mock_controller.value == pytest.approx(value, abs=1)
+
+
+def wait_for_ramp(controller, timeout=2):
+    end = time.monotonic() + timeout
+    while controller.ramp_running and time.monotonic() < end:
+        time.sleep(0.01)
+
+
+def test_ramp_script_text__sets_and_waits_each_step():
+    text = LEDController._ramp_script_text(18, [[10, 1000], [20, 90000]])
+
+    assert text == "pwm 18 10 mils 1000 pwm 18 20 mils 60000 mils 30000"
+
+
+def test_led_controller_start_ramp__daemon_reaches_last_value(mock_controller):
+    mock_controller.start_ramp([0, 50, 100], interval=0.01)
+
+    wait_for_ramp(mock_controller)
+
+    assert not mock_controller.ramp_running
+    assert LEDController._scale(100) == mock_controller.value_raw
+    assert mock_controller._pi.scripts == {}
+
+
+def test_led_controller_long_ramp__runs_in_segments(mock_controller, mocker):
+    mocker.patch("config.LED_ramp_segment_steps", 2)
+    store = mocker.spy(mock_controller._pi, "store_script")
+
+    mock_controller.start_ramp([0, 20, 40, 60, 80], interval=0.01)
+    wait_for_ramp(mock_controller)
+
+    assert store.call_count == 3
+    assert LEDController._scale(80) == mock_controller.value_raw
+
+
+def test_led_controller_cancel_ramp__stops_daemon_fade(mock_controller):
+    mock_controller.start_ramp([0, 50, 100], interval=60)
+
+    mock_controller.cancel_ramp()
+
+    assert not mock_controller.ramp_running
+    assert mock_controller._pi.scripts == {}
+    assert 0 == mock_controller.value_raw
+
+
 if __name__ == "__main__":
     import argparse
 
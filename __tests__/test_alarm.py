@@ -1,3 +1,4 @@
+import copy
 import unittest
 from unittest.mock import patch
 from datetime import datetime
@@ -202,3 +203,126 @@ def test__disabled_alarm__stays_off(default_alarm, freezer):
     brighness = default_alarm.get_desired_brightness()
 
     assert brighness == 0
+
+
+@pytest.mark.parametrize(
+    "current_time, expected_window",
+    (
+        (
+            datetime(2006, 1, 1, 0, 0),
+            (datetime(2006, 1, 1, 5, 30), datetime(2006, 1, 1, 6, 30)),
+        ),  # later today
+        (
+            datetime(2006, 1, 1, 6, 10),
+            (datetime(2006, 1, 1, 5, 30), datetime(2006, 1, 1, 6, 30)),
+        ),  # still in after wakeup on time
+        (
+            datetime(2006, 1, 1, 6, 30),
+            (datetime(2006, 1, 8, 5, 30), datetime(2006, 1, 8, 6, 30)),
+        ),  # finished for today, give me next week
+    ),
+)
+def test__current_time__alarm_next_window__returns_expected_window(
+    current_time, expected_window, default_alarm, freezer
+):
+    freezer.move_to(current_time)
+
+    window = default_alarm.next_window()
+
+    assert expected_window == window
+
+
+def test__disabled_alarm__next_window__returns_None(default_alarm, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 0, 0))
+    default_alarm.active = False
+
+    window = default_alarm.next_window()
+
+    assert window is None
+
+
+def test__alarm_with_observer__change_target_time__notifies_observer(default_alarm, mocker):
+    observer = mocker.Mock()
+    default_alarm.add_observer(observer)
+
+    default_alarm.set_time(7, 15)
+
+    observer.assert_called_with(default_alarm)
+    assert observer.call_count == 2
+
+
+def test__alarm_with_removed_observer__change_target_day__does_not_notify(default_alarm, mocker):
+    observer = mocker.Mock()
+    default_alarm.add_observer(observer)
+    default_alarm.remove_observer(observer)
+
+    default_alarm.add_target_day(Days.MONDAY)
+
+    observer.assert_not_called()
+
+
+def test__alarm_with_observer__set_same_time__does_not_notify(default_alarm, mocker):
+    observer = mocker.Mock()
+    default_alarm.set_time(7, 15)
+    default_alarm.add_observer(observer)
+
+    default_alarm.set_time(7, 15)
+
+    observer.assert_not_called()
+
+
+def test__clean_alarm__change_target_hour__only_target_hour_dirty(default_alarm):
+    default_alarm.mark_clean()
+
+    default_alarm.target_hour = (default_alarm.target_hour + 1) % 24
+
+    assert {"target_hour"} == default_alarm.dirty_fields
+
+
+def test__clean_alarm__set_same_values__nothing_dirty(default_alarm):
+    default_alarm.mark_clean()
+
+    default_alarm.set_time(default_alarm.target_hour, default_alarm.target_minute)
+    default_alarm.active = default_alarm.active
+
+    assert set() == default_alarm.dirty_fields
+
+
+def test__clean_alarm__copy__all_fields_dirty(default_alarm):
+    default_alarm.mark_clean()
+
+    copied = copy.deepcopy(default_alarm)
+
+    assert set(default_alarm.to_dict()) == copied.dirty_fields
+
+
+@pytest.mark.parametrize(
+    "current_time",
+    (
+        datetime(2006, 1, 1, 0, 0),
+        datetime(2006, 1, 1, 5, 45),
+        datetime(2006, 1, 1, 6, 10),
+        datetime(2006, 1, 3, 12, 0),
+    ),
+)
+def test__current_time__alarm_evaluate__matches_individual_properties(
+    current_time, default_alarm, freezer
+):
+    freezer.move_to(current_time)
+
+    state = default_alarm.evaluate(current_time)
+
+    assert state.alarm is default_alarm
+    assert state.passed_today == default_alarm.alarm_passed_today
+    assert state.next_day == default_alarm.next_day
+    assert state.target_datetime == default_alarm.target_datetime
+    assert state.brightness == default_alarm.get_desired_brightness()
+    assert state.window == default_alarm.next_window()
+
+
+def test__alarm_without_days__evaluate__is_off():
+    state = Alarm().evaluate(datetime(2006, 1, 1, 6, 0))
+
+    assert state.brightness == 0
+    assert state.next_day is None
+    assert state.window is None
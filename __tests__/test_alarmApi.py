@@ -0,0 +1,160 @@
+import json
+
+import pytest
+
+import alarmApi
+import database
+from alarm import Alarm
+import utilities
+
+
+@pytest.fixture()
+def api(temp_db):
+    yield alarmApi.AlarmAPI(temp_db)
+
+
+def request(api, method, path, body=None, query=None):
+    body = b"" if body is None else json.dumps(body).encode("utf-8")
+    return api.handle(method, path, query or {}, body)
+
+
+def body_of(response):
+    return json.loads(response.body.decode("utf-8"))
+
+
+def test__alarm_in_db__get_alarms__lists_it(api, temp_db):
+    alarm = database.DBAlarm(Alarm())
+    alarm.target_days = utilities.Days.MONDAY
+    alarm.set_time(6, 30)
+    temp_db.add_alarm(alarm)
+
+    response = request(api, "GET", "/api/alarms")
+
+    assert 200 == response.code
+    assert [
+        {
+            "id": str(alarm.id),
+            "target_days": int(utilities.Days.MONDAY),
+            "target_hour": 6,
+            "target_minute": 30,
+            "active": True,
+        }
+    ] == body_of(response)["alarms"]
+
+
+def test__get_alarms_twice__reuses_snapshot(api, temp_db, mocker):
+    temp_db.add_alarm(Alarm())
+    first = request(api, "GET", "/api/alarms")
+    get_alarms = mocker.spy(temp_db, "get_alarms")
+
+    second = request(api, "GET", "/api/alarms")
+
+    get_alarms.assert_not_called()
+    assert first.etag == second.etag
+
+
+def test__alarm_changed__get_alarms__new_etag(api, temp_db):
+    alarm = database.DBAlarm(Alarm())
+    temp_db.add_alarm(alarm)
+    first = request(api, "GET", "/api/alarms")
+
+    alarm.target_hour = 7
+    temp_db.add_alarm(alarm)
+    second = request(api, "GET", "/api/alarms")
+
+    assert first.etag != second.etag
+    assert 7 == body_of(second)["alarms"][0]["target_hour"]
+
+
+def test__get_config_action__returns_snapshot(api):
+    response = request(api, "GET", "/", query={"action": [alarmApi.actionModes.requestConfig]})
+
+    assert request(api, "GET", "/api/alarms").body == response.body
+
+
+def test__post_alarm__creates_alarm(api, temp_db):
+    response = request(api, "POST", "/api/alarms", {"target_hour": 5, "target_days": 1})
+
+    assert 201 == response.code
+    stored = temp_db.get_alarms()
+    assert [(str(stored[0].id), 5)] == [(body_of(response)["id"], stored[0].target_hour)]
+    assert "/api/alarms/" + body_of(response)["id"] == response.headers["Location"]
+
+
+@pytest.mark.parametrize(
+    "body",
+    (
+        {"target_hour": 24},
+        {"target_minute": "5"},
+        {"target_days": 128},
+        {"active": 1},
+        [1, 2],
+    ),
+)
+def test__invalid_alarm__post_alarm__bad_request(api, temp_db, body):
+    response = request(api, "POST", "/api/alarms", body)
+
+    assert 400 == response.code
+    assert [] == temp_db.get_alarms()
+
+
+def test__alarm__put_alarm__changes_only_given_fields(api, temp_db):
+    alarm = database.DBAlarm(Alarm())
+    alarm.set_time(6, 30)
+    temp_db.add_alarm(alarm)
+
+    response = request(api, "PUT", "/api/alarms/{0}".format(alarm.id), {"active": False})
+
+    assert 200 == response.code
+    stored = temp_db.get_alarm(alarm.id)
+    assert (6, 30, False) == (stored.target_hour, stored.target_minute, stored.active)
+
+
+def test__alarm__delete_alarm__removes_it(api, temp_db):
+    alarm = database.DBAlarm(Alarm())
+    temp_db.add_alarm(alarm)
+
+    response = request(api, "DELETE", "/api/alarms/{0}".format(alarm.id))
+
+    assert 204 == response.code
+    assert [] == temp_db.get_alarms()
+
+
+@pytest.mark.parametrize("method", ("GET", "PUT", "DELETE"))
+def test__unknown_alarm__request__not_found(api, method):
+    response = request(api, method, "/api/alarms/12", {})
+
+    assert 404 == response.code
+
+
+def test__set_config_with_one_invalid__stores_nothing(api, temp_db):
+    response = request(
+        api,
+        "POST",
+        "/",
+        {"alarms": [{"target_hour": 6}, {"target_hour": 25}]},
+        query={"action": [alarmApi.actionModes.postConfig]},
+    )
+
+    assert 400 == response.code
+    assert [] == temp_db.get_alarms()
+
+
+def test__set_config__creates_and_updates(api, temp_db):
+    alarm = database.DBAlarm(Alarm())
+    temp_db.add_alarm(alarm)
+
+    response = request(
+        api,
+        "POST",
+        "/",
+        {"alarms": [{"id": str(alarm.id), "target_hour": 6}, {"target_hour": 7}]},
+        query={"action": [alarmApi.actionModes.postConfig]},
+    )
+
+    assert 200 == response.code
+    assert [6, 7] == [alarm["target_hour"] for alarm in body_of(response)["alarms"]]
+
+
+def test__other_path__handle__returns_None(api):
+    assert request(api, "GET", "/index.html") is None
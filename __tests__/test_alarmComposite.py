@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+from alarm import Alarm
+from alarmComposite import AlarmComposite
+from utilities import Days
+
+
+@pytest.fixture()
+def composite():
+    yield AlarmComposite()
+
+
+def make_alarm(days, hour, minute=0):
+    alarm = Alarm()
+    alarm.add_target_day(days)
+    alarm.target_hour = hour
+    alarm.target_minute = minute
+    return alarm
+
+
+def test__alarm_changed__target_hour__follows_nearest(composite, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 6, 0))  # 6:00, Sunday, Jan 1st, 2006
+    alarm1 = make_alarm(Days.ALL, 7)
+    alarm2 = make_alarm(Days.ALL, 8)
+    composite.add_alarms(alarm1, alarm2)
+    assert 7 == composite.target_hour
+
+    alarm2.target_hour = 6
+    alarm2.target_minute = 30
+    assert 6 == composite.target_hour
+
+    alarm2.remove_target_day(Days.ALL)
+    assert 7 == composite.target_hour
+
+
+def test__removed_alarm_changed__target_hour__ignores_it(composite, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 6, 0))
+    alarm1 = make_alarm(Days.ALL, 7)
+    alarm2 = make_alarm(Days.ALL, 8)
+    composite.add_alarms(alarm1, alarm2)
+
+    composite.remove_alarm(alarm1)
+    alarm1.target_hour = 6
+
+    assert 8 == composite.target_hour
+
+
+def test__nearest_alarm_fired__next_day__moves_to_next_occurrence(composite, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 6, 0))
+    composite.add_alarms(make_alarm(Days.SUNDAY, 7), make_alarm(Days.MONDAY, 8))
+    assert Days.SUNDAY == composite.next_day
+
+    freezer.move_to(datetime(2006, 1, 1, 7, 1))
+
+    assert Days.MONDAY == composite.next_day
+
+
+def test__empty_composite__next_window__returns_None(composite):
+    assert composite.next_window() is None
+
+
+def test__alarm_without_days__next_window__returns_None(composite):
+    composite.add_alarm(Alarm())
+
+    assert composite.next_window() is None
+
+
+def test__two_alarms__next_window__returns_soonest(composite, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 6, 0))
+    composite.add_alarms(make_alarm(Days.MONDAY, 7), make_alarm(Days.SUNDAY, 8))
+
+    assert datetime(2006, 1, 1, 7, 30) == composite.next_window()[0]
+
+
+def test__inactive_alarm__next_window__skips_it(composite, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 6, 0))
+    inactive = make_alarm(Days.SUNDAY, 7)
+    inactive.active = False
+    composite.add_alarms(inactive, make_alarm(Days.MONDAY, 7))
+
+    assert datetime(2006, 1, 2, 6, 30) == composite.next_window()[0]
+
+
+def test__empty_composite__evaluate__returns_nothing(composite):
+    state = composite.evaluate()
+
+    assert 0 == state.brightness
+    assert state.nearest_alarm is None
+    assert state.window is None
+    assert [] == state.alarm_states
+
+
+def test__two_alarms__evaluate__matches_individual_queries(composite, freezer):
+    now = datetime(2006, 1, 1, 6, 0)
+    freezer.move_to(now)
+    alarm1 = make_alarm(Days.MONDAY, 5)
+    alarm2 = make_alarm(Days.SUNDAY, 6, 20)
+    composite.add_alarms(alarm1, alarm2)
+
+    state = composite.evaluate(now)
+
+    assert alarm2 is state.nearest_alarm
+    assert composite.next_day == state.next_day
+    assert alarm2.target_datetime == state.target_datetime
+    assert composite.get_desired_brightness() == state.brightness
+    assert composite.next_window() == state.window
+    assert [alarm1, alarm2] == [alarm_state.alarm for alarm_state in state.alarm_states]
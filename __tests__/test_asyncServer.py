@@ -0,0 +1,245 @@
+import asyncio
+import json
+
+import pytest
+
+import alarmApi
+import asyncServer
+import liveState
+import staticFiles
+
+
+@pytest.fixture()
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture()
+def alarm_server(loop, temp_db):
+    alarm_server = asyncServer.AsyncAlarmServer(
+        port=0, api=alarmApi.AlarmAPI(temp_db), loop=loop, max_connections=2
+    )
+    loop.run_until_complete(alarm_server.start())
+    yield alarm_server
+    loop.run_until_complete(alarm_server.stop())
+
+
+async def read_response(reader):
+    status = (await reader.readline()).decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if line == "":
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    body = await reader.readexactly(int(headers.get("Content-Length", 0)))
+    return int(status[1]), headers, body
+
+
+async def request(reader, writer, method, path, headers=(), body=b""):
+    lines = ["{0} {1} HTTP/1.1".format(method, path), "Host: localhost"]
+    lines.extend("{0}: {1}".format(name, value) for name, value in headers)
+    lines.append("Content-Length: {0}".format(len(body)))
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+    return await read_response(reader)
+
+
+def test__two_requests__one_connection__both_answered(loop, alarm_server):
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        created = await request(
+            reader, writer, "POST", "/api/alarms", body=json.dumps({"target_hour": 6}).encode()
+        )
+        listed = await request(reader, writer, "GET", "/api/alarms")
+        writer.close()
+        return created, listed
+
+    created, listed = loop.run_until_complete(client())
+
+    assert 201 == created[0]
+    assert "keep-alive" == created[1]["Connection"]
+    assert 200 == listed[0]
+    assert [6] == [alarm["target_hour"] for alarm in json.loads(listed[2].decode())["alarms"]]
+
+
+def test__matching_etag__get_alarms__not_modified(loop, alarm_server):
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        first = await request(reader, writer, "GET", "/api/alarms")
+        second = await request(
+            reader, writer, "GET", "/api/alarms", headers=[("If-None-Match", first[1]["ETag"])]
+        )
+        writer.close()
+        return second
+
+    code, _, body = loop.run_until_complete(client())
+
+    assert 304 == code
+    assert b"" == body
+
+
+def test__connection_close__answers_then_closes(loop, alarm_server):
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        response = await request(
+            reader, writer, "GET", "/nothing", headers=[("Connection", "close")]
+        )
+        rest = await reader.read()
+        writer.close()
+        return response, rest
+
+    response, rest = loop.run_until_complete(client())
+
+    assert 404 == response[0]
+    assert "close" == response[1]["Connection"]
+    assert b"" == rest
+
+
+def test__body_too_large__rejected(loop, alarm_server, mocker):
+    mocker.patch("config.server_max_body", 10)
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        response = await request(reader, writer, "POST", "/api/alarms", body=b"x" * 11)
+        writer.close()
+        return response
+
+    assert 413 == loop.run_until_complete(client())[0]
+
+
+@pytest.mark.parametrize("length", ["abc", "-1", ""])
+def test__bad_content_length__bad_request(loop, alarm_server, length):
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        writer.write(
+            "POST /api/alarms HTTP/1.1\r\nHost: localhost\r\nContent-Length: {0}\r\n\r\n".format(
+                length
+            ).encode("latin-1")
+        )
+        response = await read_response(reader)
+        rest = await reader.read()
+        writer.close()
+        return response, rest
+
+    (code, headers, _), rest = loop.run_until_complete(client())
+
+    assert 400 == code
+    assert "close" == headers["Connection"]
+    assert b"" == rest
+
+
+def test__headers_never_finished__connection_closed_after_timeout(loop, alarm_server):
+    alarm_server.keep_alive_timeout = 0.1
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        writer.write(b"GET /api/alarms HTTP/1.1\r\nHost: localhost\r\n")
+        rest = await asyncio.wait_for(reader.read(), 1)
+        writer.close()
+        return rest
+
+    assert b"" == loop.run_until_complete(client())
+
+
+def test__max_connections_open__next_connection_waits(loop, alarm_server):
+    async def client():
+        idle = [
+            await asyncio.open_connection("127.0.0.1", alarm_server.port)
+            for _ in range(alarm_server.max_connections)
+        ]
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        waiting = asyncio.ensure_future(request(reader, writer, "GET", "/api/alarms"))
+        await asyncio.sleep(0.1)
+        answered_while_full = waiting.done()
+
+        idle[0][1].close()  # frees a slot
+        code, _, _ = await asyncio.wait_for(waiting, 1)
+        for _, idle_writer in idle[1:]:
+            idle_writer.close()
+        writer.close()
+        return answered_while_full, code
+
+    answered_while_full, code = loop.run_until_complete(client())
+
+    assert not answered_while_full
+    assert 200 == code
+
+
+def test__live_state__get_events__streams_until_stopped(loop, temp_db):
+    live = liveState.LiveState()
+    live.publish("brightness", 10)
+    alarm_server = asyncServer.AsyncAlarmServer(
+        port=0, api=alarmApi.AlarmAPI(temp_db), loop=loop, live=live
+    )
+    loop.run_until_complete(alarm_server.start())
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        writer.write(b"GET /api/events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        head = await reader.readuntil(b"\r\n\r\n")
+        first = await reader.readuntil(b"\n\n")
+        live.publish("brightness", 20)
+        second = await reader.readuntil(b"\n\n")
+        writer.close()
+        return head, first, second
+
+    head, first, second = loop.run_until_complete(client())
+    loop.run_until_complete(alarm_server.stop())
+
+    assert b"Content-Type: text/event-stream" in head
+    assert b"Connection: close" in head
+    assert b"event: brightness\ndata: 10\n\n" == first
+    assert b"event: brightness\ndata: 20\n\n" == second
+    assert 0 == live.subscriber_count
+
+
+def test__streams_open_on_every_slot__request__still_answered(loop, alarm_server, mocker):
+    alarm_server.live = liveState.LiveState()
+    run_in_executor = mocker.spy(loop, "run_in_executor")
+
+    async def client():
+        streams = []
+        for _ in range(alarm_server.max_connections + 1):
+            reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+            writer.write(b"GET /api/events HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            await reader.readuntil(b"\r\n\r\n")
+            streams.append(writer)
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        code, _, _ = await asyncio.wait_for(request(reader, writer, "GET", "/api/alarms"), 1)
+        for stream in streams + [writer]:
+            stream.close()
+        return code
+
+    assert 200 == loop.run_until_complete(client())
+    run_in_executor.assert_not_called()  # streams wait on the loop, not a thread each
+
+
+def test__static_file__get_twice__sent_on_one_connection(loop, temp_db, tmp_path):
+    (tmp_path / "style.css").write_bytes(b"body { color: red; }")
+    alarm_server = asyncServer.AsyncAlarmServer(
+        port=0, loop=loop, static=staticFiles.StaticFiles(str(tmp_path))
+    )
+    loop.run_until_complete(alarm_server.start())
+
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", alarm_server.port)
+        first = await request(reader, writer, "GET", "/static/style.css")
+        second = await request(
+            reader,
+            writer,
+            "GET",
+            "/static/style.css",
+            headers=[("If-Modified-Since", first[1]["Last-Modified"])],
+        )
+        writer.close()
+        return first, second
+
+    first, second = loop.run_until_complete(client())
+    loop.run_until_complete(alarm_server.stop())
+
+    assert (200, b"body { color: red; }") == (first[0], first[2])
+    assert "text/css" == first[1]["Content-Type"]
+    assert 304 == second[0]
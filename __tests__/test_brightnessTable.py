@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from alarm import Alarm
+from alarmComposite import AlarmComposite
+from brightnessTable import BrightnessTable, minute_of_week
+import config
+from utilities import Days
+
+
+def make_alarm(days, hour, minute):
+    alarm = Alarm()
+    alarm.add_target_day(days)
+    alarm.set_time(hour, minute)
+    return alarm
+
+
+@pytest.mark.parametrize(
+    "current_time, expected",
+    (
+        (datetime(2006, 1, 1, 0, 0), 0),  # Sunday midnight
+        (datetime(2006, 1, 1, 6, 30), 6 * 60 + 30),
+        (datetime(2006, 1, 7, 23, 59), 7 * 24 * 60 - 1),  # Saturday, last minute of the week
+    ),
+)
+def test__datetime__minute_of_week__returns_minutes_since_sunday(current_time, expected):
+    assert expected == minute_of_week(current_time)
+
+
+@pytest.mark.parametrize(
+    "days, hour, minute",
+    (
+        (Days.SUNDAY, 6, 0),
+        (Days.MONDAY | Days.WEDNESDAY, 7, 45),
+        (Days.ALL, 12, 15),
+    ),
+)
+def test__alarm__table_lookup__matches_alarm_brightness_each_minute(days, hour, minute):
+    alarm = make_alarm(days, hour, minute)
+    table = BrightnessTable()
+    table.update(alarm)
+
+    current = datetime(2006, 1, 1, 0, 0)
+    while current < datetime(2006, 1, 8):
+        assert alarm.get_desired_brightness(current) == table.lookup(current), current
+        current += timedelta(minutes=1)
+
+
+@pytest.mark.parametrize("second", (0, 1, 30, 59))
+def test__alarm__table_lookup_within_last_minutes__matches_alarm_brightness(second):
+    alarm = make_alarm(Days.SUNDAY, 6, 0)
+    table = BrightnessTable()
+    table.update(alarm)
+
+    for minute in (config.after_wakeup_on_time - 1, config.after_wakeup_on_time):
+        now = datetime(2006, 1, 1, 6, minute, second)
+        assert alarm.get_desired_brightness(now) == table.lookup(now), now
+        assert alarm.evaluate(now).brightness == table.lookup(now), now
+
+
+def test__fading_alarm__table_lookup_between_minutes__interpolates():
+    table = BrightnessTable()
+    table.update(make_alarm(Days.SUNDAY, 6, 0))
+    minute_step = 100 / config.wakeup_time
+
+    start = table.lookup(datetime(2006, 1, 1, 5, 50, 0))
+    middle = table.lookup(datetime(2006, 1, 1, 5, 50, 30))
+
+    assert middle == pytest.approx(start + minute_step / 2)
+
+
+def test__overlapping_alarms__table_lookup__returns_greatest():
+    early = make_alarm(Days.SUNDAY, 6, 0)
+    late = make_alarm(Days.SUNDAY, 6, 10)
+    table = BrightnessTable()
+    table.update(early)
+    table.update(late)
+
+    now = datetime(2006, 1, 1, 5, 55)
+
+    assert early.get_desired_brightness(now) == table.lookup(now)
+
+
+def test__alarm_changed__table_update__moves_contribution():
+    alarm = make_alarm(Days.SUNDAY, 6, 0)
+    table = BrightnessTable()
+    table.update(alarm)
+
+    alarm.set_time(9, 0)
+    table.update(alarm)
+
+    assert 0 == table.lookup(datetime(2006, 1, 1, 6, 0))
+    assert 100 == table.lookup(datetime(2006, 1, 1, 9, 0))
+
+
+def test__alarm_removed__table_lookup__returns_off():
+    alarm = make_alarm(Days.SUNDAY, 6, 0)
+    table = BrightnessTable()
+    table.update(alarm)
+
+    table.remove(alarm)
+
+    assert 0 == table.lookup(datetime(2006, 1, 1, 6, 0))
+
+
+def test__composite_alarm_disabled__get_desired_brightness__returns_off():
+    alarm = make_alarm(Days.SUNDAY, 6, 0)
+    composite = AlarmComposite()
+    composite.add_alarm(alarm)
+    now = datetime(2006, 1, 1, 6, 0)
+    assert 100 == composite.get_desired_brightness(now)
+
+    alarm.active = False
+
+    assert 0 == composite.get_desired_brightness(now)
+
+
+def test__wakeup_time_changed__composite_get_desired_brightness__rebuilds_table(mocker):
+    composite = AlarmComposite()
+    composite.add_alarm(make_alarm(Days.SUNDAY, 6, 0))
+    now = datetime(2006, 1, 1, 5, 45)
+    assert 0 < composite.get_desired_brightness(now)
+
+    mocker.patch("config.wakeup_time", 10)
+
+    assert 0 == composite.get_desired_brightness(now)
+
+
+@pytest.mark.parametrize(
+    "current_time, expected",
+    (
+        (datetime(2006, 1, 1, 5, 45, 20), datetime(2006, 1, 1, 5, 45, 20)),  # fading now
+        (datetime(2006, 1, 1, 6, 10, 20), datetime(2006, 1, 1, 6, 30)),  # on, turns off
+        (datetime(2006, 1, 1, 6, 30), datetime(2006, 1, 1, 6, 30)),  # last instant on
+        (datetime(2006, 1, 1, 7, 0), datetime(2006, 1, 8, 5, 30)),  # off, next week's fade
+    ),
+)
+def test__alarm__table_next_change__returns_when_brightness_moves(current_time, expected):
+    table = BrightnessTable()
+    table.update(make_alarm(Days.SUNDAY, 6, 0))
+
+    assert expected == table.next_change(current_time)
+
+
+def test__fading_alarm__table_slope__returns_percent_per_second():
+    table = BrightnessTable()
+    table.update(make_alarm(Days.SUNDAY, 6, 0))
+
+    slope = table.slope(datetime(2006, 1, 1, 5, 45, 20))
+
+    assert slope == pytest.approx(100 / (config.wakeup_time * 60))
+    assert 0 == table.slope(datetime(2006, 1, 1, 6, 10))
+
+
+@pytest.mark.parametrize(
+    "now",
+    (
+        datetime(2006, 1, 1, 5, 45, 20),  # fading
+        datetime(2006, 1, 1, 6, 30),  # last instant on
+        datetime(2006, 1, 1, 6, 30, 30),  # just turned off
+    ),
+)
+def test__composite__evaluate__brightness_matches_table(now):
+    composite = AlarmComposite()
+    composite.add_alarms(make_alarm(Days.SUNDAY, 6, 0), make_alarm(Days.SUNDAY, 6, 10))
+
+    assert composite.get_desired_brightness(now) == composite.evaluate(now).brightness
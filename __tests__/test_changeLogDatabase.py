@@ -0,0 +1,175 @@
+import fcntl
+import json
+
+import pytest
+
+from changeLogDatabase import ChangeLogDatabase
+import utilities
+
+
+@pytest.fixture()
+def db_path(tmp_path):
+    yield str(tmp_path / "db.json")
+
+
+def open_db(db_path):
+    return ChangeLogDatabase(db_path, compact_interval=0, fsync=False)
+
+
+def read_log(db_path):
+    with open(db_path + ".log") as log:
+        return [json.loads(line) for line in log]
+
+
+def test__insert__appends_one_record(db_path):
+    db = open_db(db_path)
+
+    db.table("Alarms").insert({"id": 1, "target_days": utilities.Days.MONDAY})
+
+    assert [("insert", {"id": 1, "target_days": "{Days}:" + str(int(utilities.Days.MONDAY))})] == [
+        (record["op"], record["values"]) for record in read_log(db_path)
+    ]
+
+
+def test__update__appends_only_changed_fields(db_path):
+    db = open_db(db_path)
+    table = db.table("Alarms")
+    doc_id = table.insert({"id": 1, "target_hour": 6, "target_minute": 0})
+
+    table.update({"target_hour": 7}, doc_ids=[doc_id])
+
+    assert {"target_hour": 7} == read_log(db_path)[-1]["values"]
+
+
+def test__changes__reopen__replays_log(db_path):
+    db = open_db(db_path)
+    table = db.table("Alarms")
+    first = table.insert({"id": 1, "target_days": utilities.Days.MONDAY, "target_hour": 6})
+    second = table.insert({"id": 2, "target_hour": 8})
+    table.update({"target_hour": 7}, doc_ids=[first])
+    table.remove(doc_ids=[second])
+
+    reopened = open_db(db_path)
+
+    documents = reopened.table("Alarms").all()
+    assert [{"id": 1, "target_days": utilities.Days.MONDAY, "target_hour": 7}] == documents
+    assert [first] == [document.doc_id for document in documents]
+
+
+def test__compact__empties_log_and_keeps_contents(db_path):
+    db = open_db(db_path)
+    table = db.table("Alarms")
+    doc_id = table.insert({"id": 1, "target_hour": 6})
+    table.update({"target_hour": 7}, doc_ids=[doc_id])
+
+    db.compact()
+
+    assert [] == read_log(db_path)
+    assert [{"id": 1, "target_hour": 7}] == open_db(db_path).table("Alarms").all()
+
+
+def test__compacted__insert_after__does_not_reuse_doc_id(db_path):
+    db = open_db(db_path)
+    table = db.table("Alarms")
+    first = table.insert({"id": 1})
+    db.compact()
+
+    second = open_db(db_path).table("Alarms").insert({"id": 2})
+
+    assert second > first
+
+
+def test__log_not_truncated_after_snapshot__reopen__skips_records_in_snapshot(db_path):
+    db = open_db(db_path)
+    table = db.table("Alarms")
+    doc_id = table.insert({"id": 1, "target_hour": 6})
+    with open(db_path + ".log") as log:
+        old_log = log.read()
+    db.compact()
+    with open(db_path + ".log", "w") as log:
+        log.write(old_log)  # as if the truncate was lost in a crash
+    table.update({"target_hour": 7}, doc_ids=[doc_id])
+
+    reopened = open_db(db_path)
+
+    assert [{"id": 1, "target_hour": 7}] == reopened.table("Alarms").all()
+
+
+def test__crash_mid_append__reopen__drops_partial_record(db_path):
+    db = open_db(db_path)
+    db.table("Alarms").insert({"id": 1})
+    with open(db_path + ".log", "a") as log:
+        log.write('{"seq": 2, "table": "Alarms", "op": "ins')
+
+    reopened = open_db(db_path)
+    reopened.table("Alarms").insert({"id": 3})
+
+    assert [{"id": 1}, {"id": 3}] == open_db(db_path).table("Alarms").all()
+
+
+def test__compact_interval__compacts_on_scheduler(db_path, mocker):
+    call_every = mocker.patch("scheduler.Scheduler.call_every")
+
+    db = ChangeLogDatabase(db_path, compact_interval=60, fsync=False)
+
+    call_every.assert_called_once_with(60, db.compact)
+
+
+def test__two_processes__both_insert__doc_ids_and_sequence_not_reused(db_path):
+    first = open_db(db_path)
+    second = open_db(db_path)
+
+    first_doc_id = first.table("Alarms").insert({"id": 1})
+    second_doc_id = second.table("Alarms").insert({"id": 2})
+
+    assert first_doc_id != second_doc_id
+    assert [1, 2] == [record["seq"] for record in read_log(db_path)]
+    assert [{"id": 1}, {"id": 2}] == open_db(db_path).table("Alarms").all()
+
+
+def test__two_processes__compact__keeps_other_process_changes(db_path):
+    first = open_db(db_path)
+    second = open_db(db_path)
+    first.table("Alarms").insert({"id": 1})
+    second.table("Alarms").insert({"id": 2})
+
+    first.compact()
+
+    assert [] == read_log(db_path)
+    assert [{"id": 1}, {"id": 2}] == open_db(db_path).table("Alarms").all()
+
+
+def test__other_process_compacted__insert__starts_from_its_snapshot(db_path):
+    first = open_db(db_path)
+    second = open_db(db_path)
+    first.table("Alarms").insert({"id": 1})
+    second.table("Alarms").insert({"id": 2})
+    second.compact()
+    second.table("Alarms").insert({"id": 3})
+
+    first.table("Alarms").insert({"id": 4})
+
+    expected = [{"id": 1}, {"id": 2}, {"id": 3}, {"id": 4}]
+    assert expected == first.table("Alarms").all()
+    assert expected == open_db(db_path).table("Alarms").all()
+
+
+def test__two_processes__reload__picks_up_other_changes(db_path):
+    first = open_db(db_path)
+    second = open_db(db_path)
+    doc_id = first.table("Alarms").insert({"id": 1, "target_hour": 6})
+    second.table("Alarms").update({"target_hour": 7}, doc_ids=[doc_id])
+
+    first.reload()
+
+    assert [{"id": 1, "target_hour": 7}] == first.table("Alarms").all()
+
+
+def test__file_lock__held_while_changing(db_path, mocker):
+    flock = mocker.patch("changeLogDatabase.fcntl.flock")
+    db = open_db(db_path)
+    flock.reset_mock()
+
+    db.table("Alarms").insert({"id": 1})
+
+    assert [fcntl.LOCK_EX, fcntl.LOCK_UN] == [call[0][1] for call in flock.call_args_list]
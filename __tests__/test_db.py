@@ -1,9 +1,15 @@
 import pathlib
+import threading
+import time as timer
+from datetime import time
 
 import pytest
 
+import config
 import database
+import fileWatcher
 from alarm import Alarm
+from configObserver import ConfigObserver
 import utilities
 
 
@@ -76,3 +82,538 @@ def test__alarm__db_close_and_repone__returns_same_data(temp_db):
     expected_alarm = database.DBAlarm(alarm)
     expected_alarm.id = expected_id
     assert expected_alarm == reloaded_alarm
+
+
+def test__alarm_inserted__remove_alarm__removes_it(temp_db):
+    alarm = database.DBAlarm(Alarm())
+    alarm2 = database.DBAlarm(alarm)
+    alarm2.id = alarm.id + 1
+    temp_db.add_alarm(alarm)
+    temp_db.add_alarm(alarm2)
+
+    temp_db.remove_alarm(alarm)
+
+    assert [alarm2.id] == [stored.id for stored in temp_db.get_alarms()]
+
+
+def test__alarm_inserted__db_close_and_reopen__update_does_not_insert(temp_db):
+    alarm = database.DBAlarm(Alarm())
+    alarm.target_hour = 6
+    temp_db.add_alarm(alarm)
+    temp_db._close()
+    temp_db._open()
+
+    alarm.target_hour = 7
+    temp_db.add_alarm(alarm)
+
+    alarms = temp_db.get_alarms()
+    assert len(alarms) == 1
+    assert alarms[0].target_hour == 7
+
+
+def test__alarm_inserted__add_alarm__does_not_scan_table(temp_db, mocker):
+    alarm = database.DBAlarm(Alarm())
+    temp_db.add_alarm(alarm)
+    search = mocker.spy(temp_db.table, "search")
+
+    temp_db.add_alarm(alarm)
+
+    search.assert_not_called()
+
+
+def test__write_behind_disabled__db_close_and_reopen__returns_same_data(tmp_path):
+    db = database.DB(str(tmp_path / "db.json"), write_behind=False)
+    alarm = Alarm()
+    alarm.target_hour = 6
+    db.add_alarm(alarm)
+
+    db._close()
+    db._open()
+
+    assert [6] == [stored.target_hour for stored in db.get_alarms()]
+
+
+def test__write_behind__add_alarm_and_flush__written_to_disk(tmp_path):
+    db_path = str(tmp_path / "db.json")
+    db = database.DB(db_path, write_behind=True)
+    alarm = Alarm()
+    alarm.target_hour = 6
+    db.add_alarm(alarm)
+
+    db.flush()
+
+    assert [6] == [stored.target_hour for stored in database.DB(db_path).get_alarms()]
+
+
+def test__write_behind__add_alarm_and_close__written_and_exit_handler_dropped(tmp_path, mocker):
+    unregister = mocker.patch("storage.atexit.unregister")
+    db_path = str(tmp_path / "db.json")
+    db = database.DB(db_path, write_behind=True)
+    alarm = Alarm()
+    alarm.target_hour = 6
+    db.add_alarm(alarm)
+
+    db.close()
+
+    unregister.assert_called_once_with(db.db.storage.flush)
+    assert [6] == [stored.target_hour for stored in database.DB(db_path).get_alarms()]
+
+
+def test__sqlite__db_close_and_reopen__returns_same_data(temp_sqlite_db):
+    alarm = Alarm()
+    alarm.target_days = utilities.Days.MONDAY | utilities.Days.FRIDAY
+    alarm.target_hour = 6
+    alarm.target_minute = 5
+    alarm.active = False
+    temp_sqlite_db.add_alarm(alarm)
+    expected_id = temp_sqlite_db.get_alarms()[0].id
+
+    temp_sqlite_db._close()
+    temp_sqlite_db._open()
+
+    expected_alarm = database.DBAlarm(alarm)
+    expected_alarm.id = expected_id
+    assert [expected_alarm] == temp_sqlite_db.get_alarms()
+
+
+def test__sqlite__re_inserting_alarm__performs_update(temp_sqlite_db):
+    alarm = database.DBAlarm(Alarm())
+    alarm.target_days = utilities.Days.MONDAY
+    temp_sqlite_db.add_alarm(alarm)
+    alarm.target_days = utilities.Days.SUNDAY
+
+    temp_sqlite_db.add_alarm(alarm)
+
+    assert [utilities.Days.SUNDAY] == [stored.target_days for stored in temp_sqlite_db.get_alarms()]
+
+
+def test__sqlite__alarm_inserted__remove_alarm__removes_it(temp_sqlite_db):
+    alarm = database.DBAlarm(Alarm())
+    alarm2 = database.DBAlarm(alarm)
+    alarm2.id = alarm.id + 1
+    temp_sqlite_db.add_alarm(alarm)
+    temp_sqlite_db.add_alarm(alarm2)
+
+    temp_sqlite_db.remove_alarm(alarm)
+
+    assert [alarm2.id] == [stored.id for stored in temp_sqlite_db.get_alarms()]
+
+
+def test__sqlite__open__uses_wal_and_indexes(temp_sqlite_db):
+    journal_mode = temp_sqlite_db.db.query("PRAGMA journal_mode")[0][0]
+    indexes = temp_sqlite_db.db.query('PRAGMA index_list("Alarms")')
+
+    assert "wal" == journal_mode
+    assert {"Alarms_id", "Alarms_days", "Alarms_time", "Alarms_active"} == {
+        index[1] for index in indexes
+    }
+
+
+def test__unknown_backend__open__raises(tmp_path):
+    with pytest.raises(Exception):
+        database.DB(str(tmp_path / "db"), backend="csv")
+
+
+def test__log_backend__db_close_and_reopen__returns_same_data(tmp_path):
+    db = database.DB(str(tmp_path / "db.json"), backend="log")
+    alarm = database.DBAlarm(Alarm())
+    alarm.target_days = utilities.Days.MONDAY
+    db.add_alarm(alarm)
+    alarm.target_hour = 6
+    db.add_alarm(alarm)
+
+    db._close()
+    db._open()
+
+    assert [alarm] == db.get_alarms()
+
+
+def test__alarm_inserted__change_one_field__updates_only_that_field(temp_db, mocker):
+    alarm = Alarm()
+    temp_db.add_alarm(alarm)
+    update = mocker.spy(temp_db.table, "update")
+
+    alarm.target_hour = 6
+    temp_db.add_alarm(alarm)
+
+    assert {"target_hour": 6} == update.call_args[0][0]
+    assert 6 == temp_db.get_alarms()[0].target_hour
+
+
+def test__alarm_inserted__add_unchanged_alarm__does_not_write(temp_db, mocker):
+    alarm = database.DBAlarm(Alarm())
+    temp_db.add_alarm(alarm)
+    update = mocker.spy(temp_db.table, "update")
+
+    temp_db.add_alarm(alarm)
+
+    update.assert_not_called()
+
+
+def test__loaded_alarm__change_and_add__updates_only_changed_field(temp_db, mocker):
+    temp_db.add_alarm(database.DBAlarm(Alarm()))
+    loaded = temp_db.get_alarms()[0]
+    update = mocker.spy(temp_db.table, "update")
+
+    loaded.active = False
+    temp_db.add_alarm(loaded)
+
+    assert {"active": False} == update.call_args[0][0]
+
+
+def test__id_allocator__allocate_many__all_unique():
+    allocator = database.IdAllocator()
+
+    ids = [allocator.allocate() for _ in range(1000)]
+
+    assert len(ids) == len(set(ids))
+    assert all(0 < value < 2**63 for value in ids)
+
+
+def test__id_allocator__reserved_id__not_allocated(mocker):
+    allocator = database.IdAllocator()
+    allocator.reserve(5)
+    mocker.patch.object(allocator._random, "getrandbits", side_effect=[5, 5, 6])
+
+    assert 6 == allocator.allocate()
+
+
+def test__db_with_alarm__open__reserves_stored_id(tmp_path, mocker):
+    db_path = str(tmp_path / "db.json")
+    alarm = database.DBAlarm(Alarm(), id=12345)
+    database.DB(db_path, write_behind=False).add_alarm(alarm)
+    reserve = mocker.spy(database.DBAlarm.ids, "reserve")
+
+    database.DB(db_path, write_behind=False)
+
+    reserve.assert_called_with(12345)
+
+
+def test__alarm__db_alarm_twice__same_id():
+    alarm = Alarm()
+
+    assert database.DBAlarm(alarm).id == database.DBAlarm(alarm).id
+
+
+def test__two_alarms__db_alarm__different_ids():
+    assert database.DBAlarm(Alarm()).id != database.DBAlarm(Alarm()).id
+
+
+def test__documents__from_documents__builds_clean_alarms():
+    documents = [
+        {
+            "id": 7,
+            "_value": 0,
+            "target_days": utilities.Days.MONDAY,
+            "target_hour": 6,
+            "target_minute": 30,
+            "active": False,
+        }
+    ]
+
+    alarms = database.DBAlarm.from_documents(documents)
+
+    assert [documents[0]] == [alarm.to_dict() for alarm in alarms]
+    assert set() == alarms[0].dirty_fields
+
+
+def test__document_missing_fields__from_documents__uses_defaults():
+    alarm = database.DBAlarm.from_documents([{"id": 7, "target_hour": 6}])[0]
+
+    assert dict(Alarm().to_dict(), id=7, target_hour=6) == alarm.to_dict()
+
+
+def test__loaded_alarm__has_no_instance_dict(temp_db):
+    temp_db.add_alarm(Alarm())
+
+    alarm = temp_db.get_alarms()[0]
+
+    assert not hasattr(alarm, "__dict__")
+
+
+@pytest.fixture(params=database.DB.BACKENDS)
+def backend(request):
+    yield request.param
+
+
+@pytest.fixture()
+def backend_db(tmp_path, backend):
+    db = database.DB(str(tmp_path / "db"), write_behind=False, backend=backend)
+    yield db
+    db._close()
+
+
+def add(db, days, hour, minute, active=True):
+    alarm = database.DBAlarm(Alarm())
+    alarm.target_days = days
+    alarm.set_time(hour, minute)
+    alarm.active = active
+    db.add_alarm(alarm)
+    return alarm.id
+
+
+def test__alarms__alarms_on__returns_alarms_on_any_of_the_days_in_time_order(backend_db):
+    Days = utilities.Days
+    late = add(backend_db, Days.MONDAY, 9, 0)
+    early = add(backend_db, Days.TUESDAY | Days.FRIDAY, 6, 0)
+    add(backend_db, Days.SUNDAY, 7, 0)
+
+    alarms = backend_db.alarms_on(Days.MONDAY | Days.FRIDAY)
+
+    assert [early, late] == [alarm.id for alarm in alarms]
+
+
+def test__alarms__alarms_between__returns_alarms_in_window(backend_db):
+    add(backend_db, utilities.Days.MONDAY, 5, 59)
+    six = add(backend_db, utilities.Days.MONDAY, 6, 0)
+    half_six = add(backend_db, utilities.Days.MONDAY, 6, 30)
+    add(backend_db, utilities.Days.MONDAY, 7, 0)
+
+    alarms = backend_db.alarms_between(time(6, 0), time(7, 0))
+
+    assert [six, half_six] == [alarm.id for alarm in alarms]
+
+
+def test__alarms__alarms_between_past_midnight__wraps(backend_db):
+    morning = add(backend_db, utilities.Days.MONDAY, 0, 30)
+    add(backend_db, utilities.Days.MONDAY, 12, 0)
+    night = add(backend_db, utilities.Days.MONDAY, 23, 0)
+
+    alarms = backend_db.alarms_between(time(22, 0), time(1, 0))
+
+    assert [night, morning] == [alarm.id for alarm in alarms]
+
+
+def test__alarms__active_alarms__returns_only_active(backend_db):
+    active = add(backend_db, utilities.Days.MONDAY, 6, 0)
+    add(backend_db, utilities.Days.MONDAY, 7, 0, active=False)
+
+    assert [active] == [alarm.id for alarm in backend_db.active_alarms()]
+
+
+def test__alarm_deactivated__active_alarms__not_returned(backend_db):
+    alarm = database.DBAlarm(Alarm())
+    backend_db.add_alarm(alarm)
+
+    alarm.active = False
+    backend_db.add_alarm(alarm)
+
+    assert [] == backend_db.active_alarms()
+
+
+def test__alarm_time_changed__alarms_between__uses_new_time(backend_db):
+    alarm = database.DBAlarm(Alarm())
+    alarm.set_time(6, 0)
+    backend_db.add_alarm(alarm)
+
+    alarm.set_time(8, 0)
+    backend_db.add_alarm(alarm)
+
+    assert [] == backend_db.alarms_between(time(5, 0), time(7, 0))
+    assert [alarm.id] == [stored.id for stored in backend_db.alarms_between(time(7, 0), time(9, 0))]
+
+
+def test__alarm_removed__alarms_on__not_returned(backend_db):
+    alarm = database.DBAlarm(Alarm())
+    alarm.target_days = utilities.Days.MONDAY
+    backend_db.add_alarm(alarm)
+
+    backend_db.remove_alarm(alarm)
+
+    assert [] == backend_db.alarms_on(utilities.Days.ALL)
+
+
+class RecordingObserver(ConfigObserver):
+    def __init__(self):
+        ConfigObserver.__init__(self)
+        self.events = []
+
+    def alarm_added(self, alarm):
+        self.events.append(("added", alarm.id))
+
+    def alarm_deleted(self, id):
+        self.events.append(("deleted", id))
+
+    def alarm_changed(self, alarm):
+        self.events.append(("changed", alarm.id))
+
+
+@pytest.fixture()
+def observer(backend_db):
+    observer = RecordingObserver()
+    backend_db.add_observer(observer)
+    yield observer
+
+
+def test__observer__add_change_and_remove_alarm__publishes_events(backend_db, observer):
+    alarm = database.DBAlarm(Alarm())
+
+    backend_db.add_alarm(alarm)
+    alarm.target_hour = 6
+    backend_db.add_alarm(alarm)
+    backend_db.add_alarm(alarm)  # nothing changed
+    backend_db.remove_alarm(alarm)
+
+    assert [("added", alarm.id), ("changed", alarm.id), ("deleted", alarm.id)] == observer.events
+
+
+def test__not_config_observer__add_observer__raises(temp_db):
+    with pytest.raises(Exception):
+        temp_db.add_observer(object())
+
+
+def test__changed_by_other_db__reload__publishes_differences(tmp_path, backend_db, observer):
+    kept = database.DBAlarm(Alarm())
+    changed = database.DBAlarm(Alarm())
+    deleted = database.DBAlarm(Alarm())
+    for alarm in (kept, changed, deleted):
+        backend_db.add_alarm(alarm)
+    backend_db.flush()
+    other = database.DB(str(tmp_path / "db"), write_behind=False, backend=backend_db._backend)
+    added = database.DBAlarm(Alarm())
+    other.add_alarm(added)
+    changed.target_hour = 6
+    other.add_alarm(changed)
+    other.remove_alarm(deleted)
+    other._close()
+    observer.events = []
+
+    backend_db.reload()
+
+    assert [
+        ("deleted", deleted.id),
+        ("added", added.id),
+        ("changed", changed.id),
+    ] == observer.events
+    assert {kept.id, changed.id, added.id} == {alarm.id for alarm in backend_db.get_alarms()}
+
+
+def test__unchanged__reload__publishes_nothing(backend_db, observer):
+    backend_db.add_alarm(database.DBAlarm(Alarm()))
+    observer.events = []
+
+    backend_db.reload()
+
+    assert [] == observer.events
+
+
+def test__write_behind_pending__other_db_adds_alarm__reload_keeps_both(tmp_path, mocker):
+    mocker.patch.object(config, "db_watch_delay", 60)  # reload by hand, not from the watcher
+    db_path = str(tmp_path / "db.json")
+    db = database.DB(db_path, write_behind=True)  # creating the table is a pending write
+    db.watch()
+    observer = RecordingObserver()
+    db.add_observer(observer)
+    local = database.DBAlarm(Alarm())
+    db.add_alarm(local)
+    other = database.DB(db_path, write_behind=False)
+    added = database.DBAlarm(Alarm())
+    other.add_alarm(added)
+
+    db.reload()
+    db.flush()
+    db.stop_watching()
+
+    assert [("added", local.id), ("added", added.id)] == observer.events
+    assert {local.id, added.id} == {alarm.id for alarm in db.get_alarms()}
+    assert {local.id, added.id} == {alarm.id for alarm in database.DB(db_path).get_alarms()}
+
+
+@pytest.mark.skipif(not fileWatcher.available(), reason="needs inotify")
+def test__watching__other_db_adds_alarm__observer_notified(tmp_path, mocker):
+    mocker.patch.object(config, "db_watch_delay", 0)
+    db_path = str(tmp_path / "db.json")
+    db = database.DB(db_path, write_behind=False)
+    added = threading.Event()
+    observer = RecordingObserver()
+    mocker.patch.object(observer, "alarm_added", side_effect=lambda alarm: added.set())
+    db.add_observer(observer)
+    db.watch()
+
+    database.DB(db_path, write_behind=False).add_alarm(Alarm())
+
+    assert added.wait(2)
+    db.stop_watching()
+
+
+def test__reloading_while_another_thread_writes__all_alarms_kept(backend_db):
+    alarms = [database.DBAlarm(Alarm()) for _ in range(30)]
+    errors = []
+
+    def write():
+        try:
+            for alarm in alarms:
+                backend_db.add_alarm(alarm)
+        except Exception as error:
+            errors.append(error)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    while writer.is_alive():
+        backend_db.reload()
+    writer.join()
+
+    assert [] == errors
+    assert {alarm.id for alarm in alarms} == {alarm.id for alarm in backend_db.get_alarms()}
+
+
+class LockingObserver(RecordingObserver):
+    # takes a lock of its own in each event, as AlarmAPI does
+    def __init__(self):
+        RecordingObserver.__init__(self)
+        self.lock = threading.Lock()
+
+    def alarm_added(self, alarm):
+        with self.lock:
+            RecordingObserver.alarm_added(self, alarm)
+
+
+def test__observer_with_lock__change_on_other_thread__no_deadlock(backend_db):
+    observer = LockingObserver()
+    backend_db.add_observer(observer)
+    alarm = database.DBAlarm(Alarm())
+
+    with observer.lock:
+        writer = threading.Thread(target=backend_db.add_alarm, args=(alarm,))
+        writer.start()
+        writer.join(0.1)
+        # the writer is waiting on the observer's lock, the DB must still be usable
+        assert [alarm.id] == [stored.id for stored in backend_db.get_alarms()]
+    writer.join(1)
+
+    assert [("added", alarm.id)] == observer.events
+
+
+@pytest.mark.skipif(not fileWatcher.available(), reason="needs inotify")
+def test__watching__own_writes__not_reloaded(tmp_path, backend, mocker):
+    mocker.patch.object(config, "db_watch_delay", 0.05)
+    db = database.DB(str(tmp_path / "db"), write_behind=False, backend=backend)
+    reload = mocker.spy(db, "_reload")
+    db.watch()
+
+    for _ in range(3):
+        db.add_alarm(Alarm())
+    timer.sleep(0.3)
+    own_reloads = reload.call_count
+    database.DB(str(tmp_path / "db"), write_behind=False, backend=backend).add_alarm(Alarm())
+    timer.sleep(0.3)
+    db.stop_watching()
+
+    assert 0 == own_reloads
+    assert 1 == reload.call_count
+    assert 4 == len(db.get_alarms())
+
+
+@pytest.mark.skipif(not fileWatcher.available(), reason="needs inotify")
+def test__watching_write_behind__own_flush__not_reloaded(tmp_path, mocker):
+    mocker.patch.object(config, "db_watch_delay", 0.05)
+    db = database.DB(str(tmp_path / "db.json"), write_behind=True)
+    reload = mocker.spy(db, "_reload")
+    db.watch()
+
+    db.add_alarm(Alarm())
+    db.flush()
+    timer.sleep(0.3)
+    db.stop_watching()
+
+    assert 0 == reload.call_count
@@ -0,0 +1,80 @@
+from datetime import datetime
+import time
+
+import pytest
+
+from alarm import Alarm
+from alarmComposite import AlarmComposite
+import config
+from fadeEngine import FadeEngine
+import LEDController as LEDControllerModule
+from LEDController import LEDController
+import utilities
+from utilities import Days
+
+
+@pytest.fixture()
+def engine(mocker):
+    mocker.patch.object(LEDControllerModule, "GPIOLib", utilities._MockController)
+    alarm = Alarm()
+    alarm.add_target_day(Days.SUNDAY)
+    alarm.set_time(6, 0)
+    composite = AlarmComposite()
+    composite.add_alarm(alarm)
+    yield FadeEngine(composite, LEDController())
+
+
+def test__fading__frame__sets_led(engine):
+    now = datetime(2006, 1, 1, 5, 50)
+
+    engine.frame(now)
+
+    assert engine._led.value == pytest.approx(engine._alarms.get_desired_brightness(now), abs=1)
+
+
+def test__fading__frame__waits_for_one_visible_step(engine):
+    now = datetime(2006, 1, 1, 5, 50, 10)
+    brightness = engine._alarms.get_desired_brightness(now)
+    expected = engine._led.visible_step(brightness) / engine._alarms.brightness_slope(now)
+
+    delay = engine.frame(now)
+
+    assert delay == pytest.approx(expected)
+
+
+def test__fast_fade_fine_steps__frame__capped_at_max_rate(engine, mocker):
+    mocker.patch("config.wakeup_time", 1)
+    mocker.patch("config.LED_PWM_range", 40000)
+    mocker.patch("config.LED_gamma_steps", 10000)
+    fine_engine = FadeEngine(engine._alarms, LEDController())
+    now = datetime(2006, 1, 1, 5, 59, 10)
+
+    delay = fine_engine.frame(now)
+
+    assert delay == pytest.approx(1 / config.fade_max_rate)
+
+
+def test__flat_brightness__frame__waits_until_next_change(engine):
+    delay = engine.frame(datetime(2006, 1, 1, 6, 10))  # on, until the after wakeup on time ends
+
+    assert delay == (config.after_wakeup_on_time - 10) * 60
+
+
+def test__no_alarms__frame__never_wakes(mocker):
+    mocker.patch.object(LEDControllerModule, "GPIOLib", utilities._MockController)
+    composite = AlarmComposite()
+    composite.add_alarm(Alarm())
+    engine = FadeEngine(composite, LEDController())
+
+    assert engine.frame(datetime(2006, 1, 1, 6, 0)) is None
+
+
+def test__frame_late__frame__counts_missed(engine, mocker):
+    now = datetime(2006, 1, 1, 5, 50)
+    engine.frame(now)
+    engine._frame_due = time.monotonic() - 1  # pretend this frame started a second late
+
+    engine.frame(now)
+
+    assert engine.frames == 2
+    assert engine.missed_frames == 1
@@ -0,0 +1,40 @@
+import os
+import threading
+
+import pytest
+
+import fileWatcher
+
+pytestmark = pytest.mark.skipif(not fileWatcher.available(), reason="needs inotify")
+
+
+@pytest.fixture()
+def changed():
+    yield threading.Event()
+
+
+@pytest.fixture()
+def watcher(tmp_path, changed):
+    watcher = fileWatcher.FileWatcher(str(tmp_path / "alarms.json"), changed.set)
+    yield watcher
+    watcher.stop()
+
+
+def test__watched_file__written__calls_back(tmp_path, watcher, changed):
+    (tmp_path / "alarms.json").write_text("{}")
+
+    assert changed.wait(2)
+
+
+def test__watched_file__replaced_by_rename__calls_back(tmp_path, watcher, changed):
+    (tmp_path / "new").write_text("{}")
+
+    os.replace(str(tmp_path / "new"), str(tmp_path / "alarms.json"))
+
+    assert changed.wait(2)
+
+
+def test__other_file__written__does_not_call_back(tmp_path, watcher, changed):
+    (tmp_path / "other.json").write_text("{}")
+
+    assert not changed.wait(0.2)
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+
+from liveState import LiveState, format_event
+
+
+def test__subscribe__starts_with_current_values():
+    live = LiveState()
+    live.publish("brightness", 10)
+    live.publish("next_alarm", None)
+
+    with live.subscribe() as subscription:
+        assert ("brightness", 10) == subscription.get(0)
+        assert ("next_alarm", None) == subscription.get(0)
+        assert subscription.get(0) is None
+
+
+def test__same_value_published__not_sent_again():
+    live = LiveState()
+    with live.subscribe() as subscription:
+        live.publish("brightness", 10)
+        live.publish("brightness", 10)
+
+        assert ("brightness", 10) == subscription.get(0)
+        assert subscription.get(0) is None
+
+
+def test__many_subscribers__each_gets_every_change():
+    live = LiveState()
+    subscriptions = [live.subscribe() for _ in range(3)]
+
+    live.publish("brightness", 10)
+    live.publish("brightness", 20)
+
+    for subscription in subscriptions:
+        assert [("brightness", 10), ("brightness", 20)] == [
+            subscription.get(0),
+            subscription.get(0),
+        ]
+        subscription.close()
+
+
+def test__buffer_full__drops_older_value_of_same_event():
+    live = LiveState()
+    with live.subscribe(buffer_size=2) as subscription:
+        live.publish("brightness", 10)
+        live.publish("next_alarm", "7:00")
+        live.publish("brightness", 20)
+
+        assert [("next_alarm", "7:00"), ("brightness", 20)] == [
+            subscription.get(0),
+            subscription.get(0),
+        ]
+        assert 1 == subscription.dropped
+
+
+def test__closed__unsubscribed_and_wakes_waiting_reader():
+    live = LiveState()
+    subscription = live.subscribe()
+    results = []
+    reader = threading.Thread(target=lambda: results.append(subscription.get(5)))
+    reader.start()
+
+    subscription.close()
+    reader.join(1)
+
+    assert [None] == results
+    assert 0 == live.subscriber_count
+    assert [] == list(subscription)
+
+
+def test__iterate__quiet__yields_keep_alive_comment():
+    live = LiveState()
+    with live.subscribe() as subscription:
+        subscription.keep_alive = 0
+
+        assert b": keep-alive\n\n" == next(subscription)
+
+
+def test__format_event__event_and_json_data():
+    assert b'event: next_alarm\ndata: {"id":"1"}\n\n' == format_event("next_alarm", {"id": "1"})
+
+
+def test__published_from_other_thread__get_async__wakes_loop():
+    live = LiveState()
+    loop = asyncio.new_event_loop()
+
+    async def wait():
+        with live.subscribe() as subscription:
+            waiting = asyncio.ensure_future(subscription.get_async(1))
+            await asyncio.sleep(0.01)
+            threading.Thread(target=live.publish, args=("brightness", 10)).start()
+            return await waiting
+
+    assert ("brightness", 10) == loop.run_until_complete(wait())
+    loop.close()
+
+
+def test__quiet__async_iteration__yields_keep_alive():
+    live = LiveState()
+    loop = asyncio.new_event_loop()
+    subscription = live.subscribe()
+    subscription.keep_alive = 0.01
+
+    assert b": keep-alive\n\n" == loop.run_until_complete(subscription.__anext__())
+    subscription.close()
+    loop.close()
+
+
+def test__closed_while_waiting__get_async__returns_None():
+    live = LiveState()
+    loop = asyncio.new_event_loop()
+    subscription = live.subscribe()
+    loop.call_later(0.01, subscription.close)
+
+    assert loop.run_until_complete(subscription.get_async(1)) is None
+    loop.close()
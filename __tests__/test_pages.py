@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from alarm import Alarm
+import pages
+import utilities
+
+
+@pytest.fixture()
+def module_directory(tmp_path):
+    yield str(tmp_path / "templates")
+
+
+def make_alarm(hour, days=utilities.Days.MONDAY):
+    alarm = Alarm()
+    alarm.add_target_day(days)
+    alarm.target_hour = hour
+    return alarm
+
+
+def test__created__templates_compiled_to_module_directory(temp_db, module_directory):
+    pages.Pages(temp_db, module_directory=module_directory)
+
+    assert "index.html.py" in os.listdir(module_directory)
+
+
+def test__compiled_before__created__loads_module_without_compiling(
+    temp_db, module_directory, mocker
+):
+    pages.Pages(temp_db, module_directory=module_directory)
+    compile_module = mocker.patch("mako.template._compile_module_file")
+
+    reopened = pages.Pages(temp_db, module_directory=module_directory)
+
+    compile_module.assert_not_called()
+    assert 200 == reopened.page("index.html").code
+
+
+def test__index__lists_alarms(temp_db, module_directory):
+    temp_db.add_alarm(make_alarm(6, utilities.Days.MONDAY | utilities.Days.FRIDAY))
+
+    body = pages.Pages(temp_db, module_directory=module_directory).page("index.html").body
+
+    assert b"<td>06:00</td>" in body
+    assert b"<td>Mon Fri</td>" in body
+
+
+def test__page_twice__rendered_once(temp_db, module_directory, mocker):
+    ui = pages.Pages(temp_db, module_directory=module_directory)
+    render = mocker.spy(ui._templates["index.html"], "render")
+
+    first = ui.page("index.html")
+    second = ui.page("index.html")
+
+    assert 1 == render.call_count
+    assert first.body is second.body
+    assert first.etag == second.etag
+
+
+def test__alarm_added__page_rendered_again(temp_db, module_directory):
+    ui = pages.Pages(temp_db, module_directory=module_directory)
+    before = ui.page("index.html")
+
+    temp_db.add_alarm(make_alarm(7))
+    after = ui.page("index.html")
+
+    assert before.etag != after.etag
+    assert b"<td>07:00</td>" in after.body
+
+
+def test__unknown_page__none(temp_db, module_directory):
+    assert pages.Pages(temp_db, module_directory=module_directory).page("nothing.html") is None
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from repeatedTimer import RepeatedTimer
+import scheduler
+
+
+@pytest.fixture()
+def test_scheduler():
+    s = scheduler.Scheduler()
+    yield s
+    s.stop()
+
+
+def test__call_later__runs_once_on_scheduler_thread(test_scheduler):
+    ran = threading.Event()
+    threads = []
+
+    def job():
+        threads.append(threading.current_thread())
+        ran.set()
+
+    test_scheduler.call_later(0.01, job)
+
+    assert ran.wait(1)
+    time.sleep(0.05)
+    assert threads == [test_scheduler._thread]
+
+
+def test__call_later_cancelled__does_not_run(test_scheduler):
+    ran = threading.Event()
+
+    job = test_scheduler.call_later(0.05, ran.set)
+    job.cancel()
+
+    assert not ran.wait(0.2)
+
+
+def test__call_later_rescheduled_sooner__runs_at_new_time(test_scheduler):
+    ran = threading.Event()
+
+    job = test_scheduler.call_later(60, ran.set)
+    job.reschedule(0)
+
+    assert ran.wait(1)
+
+
+def test__call_every__runs_repeatedly_without_new_threads(test_scheduler):
+    threads = set()
+    count = [0]
+    done = threading.Event()
+
+    def job():
+        threads.add(threading.current_thread())
+        count[0] += 1
+        if count[0] == 5:
+            done.set()
+
+    test_scheduler.call_every(0.01, job)
+
+    assert done.wait(1)
+    assert threads == {test_scheduler._thread}
+
+
+def test__multiple_jobs__run_in_deadline_order(test_scheduler):
+    order = []
+    done = threading.Event()
+
+    test_scheduler.call_later(0.06, done.set)
+    test_scheduler.call_later(0.04, order.append, "second")
+    test_scheduler.call_later(0.02, order.append, "first")
+
+    assert done.wait(1)
+    assert order == ["first", "second"]
+
+
+def test__job_raises__scheduler_keeps_running(test_scheduler):
+    ran = threading.Event()
+
+    def bad_job():
+        raise Exception("oops")
+
+    test_scheduler.call_later(0, bad_job)
+    test_scheduler.call_later(0.01, ran.set)
+
+    assert ran.wait(1)
+
+
+@pytest.mark.parametrize(
+    "deadline, now, interval, expected",
+    (
+        (10.0, 10.5, 1.0, 11.0),  # on time, next interval
+        (10.0, 11.5, 1.0, 12.0),  # fell behind by one, skip it
+        (10.0, 13.2, 1.0, 14.0),  # fell behind by several, skip them all
+    ),
+)
+def test__next_deadline__keeps_phase(deadline, now, interval, expected, mocker):
+    mocker.patch("time.monotonic", return_value=now)
+
+    assert expected == scheduler.Scheduler._next_deadline(deadline, interval)
+
+
+def test__repeated_timer__stop__stops_calling(test_scheduler):
+    count = [0]
+
+    def job():
+        count[0] += 1
+
+    timer = RepeatedTimer(0.01, job, scheduler=test_scheduler)
+    time.sleep(0.1)
+    timer.stop()
+    stopped_count = count[0]
+    time.sleep(0.05)
+
+    assert stopped_count > 0
+    assert count[0] == stopped_count
+    assert not timer.is_running
+
+
+def test__event_loop_scheduler__runs_jobs_on_loop_in_order():
+    loop = asyncio.new_event_loop()
+    loop_scheduler = scheduler.EventLoopScheduler(loop)
+    calls = []
+
+    loop_scheduler.call_later(0.03, calls.append, "second")
+    loop_scheduler.call_later(0.01, calls.append, "first")
+    cancelled = loop_scheduler.call_later(0.02, calls.append, "cancelled")
+    cancelled.cancel()
+    loop.run_until_complete(asyncio.sleep(0.1))
+    loop.close()
+
+    assert ["first", "second"] == calls
+
+
+def test__event_loop_scheduler__call_every__repeats_until_cancelled():
+    loop = asyncio.new_event_loop()
+    loop_scheduler = scheduler.EventLoopScheduler(loop)
+    calls = []
+
+    job = loop_scheduler.call_every(0.01, calls.append, None)
+    loop.run_until_complete(asyncio.sleep(0.055))
+    job.cancel()
+    count = len(calls)
+    loop.run_until_complete(asyncio.sleep(0.03))
+    loop.close()
+
+    assert count >= 3
+    assert count == len(calls)
+
+
+def test__thread_scheduler_running__use_event_loop__raises(mocker):
+    mocker.patch("scheduler._shared", scheduler.Scheduler())
+
+    with pytest.raises(Exception):
+        scheduler.use_event_loop(asyncio.new_event_loop())
+    scheduler._shared.stop()
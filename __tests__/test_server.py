@@ -0,0 +1,254 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+import alarmApi
+import LEDController as LEDControllerModule
+import liveState
+import pages
+import server
+import staticFiles
+import utilities
+from viewModel import ViewModel
+
+
+@pytest.fixture()
+def alarm_server(temp_db):
+    alarm_server = server.AlarmServer(port=0, api=alarmApi.AlarmAPI(temp_db))
+    yield alarm_server
+    alarm_server.stop_server()
+
+
+@pytest.fixture()
+def connection(alarm_server):
+    connection = http.client.HTTPConnection("127.0.0.1", alarm_server.httpd.server_address[1])
+    yield connection
+    connection.close()
+
+
+def test__get_alarms__returns_json_with_etag(connection):
+    connection.request("GET", "/api/alarms")
+    response = connection.getresponse()
+
+    assert 200 == response.status
+    assert "application/json" == response.getheader("Content-Type")
+    assert response.getheader("ETag") is not None
+    assert [] == json.loads(response.read().decode("utf-8"))["alarms"]
+
+
+def test__matching_etag__get_alarms__not_modified(connection):
+    connection.request("GET", "/api/alarms")
+    first = connection.getresponse()
+    first.read()
+    connection.close()
+
+    connection.request("GET", "/api/alarms", headers={"If-None-Match": first.getheader("ETag")})
+    response = connection.getresponse()
+
+    assert 304 == response.status
+    assert b"" == response.read()
+
+
+def test__post_alarm__created(connection):
+    connection.request("POST", "/api/alarms", body=json.dumps({"target_hour": 6}))
+    response = connection.getresponse()
+
+    assert 201 == response.status
+    assert 6 == json.loads(response.read().decode("utf-8"))["target_hour"]
+
+
+def test__unknown_path__not_found(connection):
+    connection.request("GET", "/nothing")
+    response = connection.getresponse()
+
+    assert 404 == response.status
+
+
+def test__live_state__get_events__streams_changes(temp_db):
+    live = liveState.LiveState()
+    live.publish("brightness", 10)
+    alarm_server = server.AlarmServer(port=0, api=alarmApi.AlarmAPI(temp_db), live=live)
+    connection = http.client.HTTPConnection("127.0.0.1", alarm_server.httpd.server_address[1])
+    try:
+        connection.request("GET", "/api/events")
+        response = connection.getresponse()
+        first = response.fp.readline() + response.fp.readline() + response.fp.readline()
+        live.publish("brightness", 20)
+        second = response.fp.readline() + response.fp.readline() + response.fp.readline()
+
+        assert 200 == response.status
+        assert "text/event-stream" == response.getheader("Content-Type")
+        assert b"event: brightness\ndata: 10\n\n" == first
+        assert b"event: brightness\ndata: 20\n\n" == second
+    finally:
+        connection.close()
+        alarm_server.stop_server()
+
+
+def test__pages__get_root__renders_index(temp_db, tmp_path):
+    ui = pages.Pages(temp_db, module_directory=str(tmp_path / "templates"))
+    alarm_server = server.AlarmServer(port=0, api=alarmApi.AlarmAPI(temp_db), pages=ui)
+    connection = http.client.HTTPConnection("127.0.0.1", alarm_server.httpd.server_address[1])
+    try:
+        connection.request("GET", "/")
+        response = connection.getresponse()
+
+        assert 200 == response.status
+        assert "text/html; charset=utf-8" == response.getheader("Content-Type")
+        assert b"<title>Sunrise Alarm</title>" in response.read()
+    finally:
+        connection.close()
+        alarm_server.stop_server()
+
+
+@pytest.fixture()
+def static_server(temp_db, tmp_path):
+    (tmp_path / "style.css").write_bytes(b"body { color: red; }")
+    alarm_server = server.AlarmServer(
+        port=0, api=alarmApi.AlarmAPI(temp_db), static=staticFiles.StaticFiles(str(tmp_path))
+    )
+    yield alarm_server
+    alarm_server.stop_server()
+
+
+def test__static_file__get__sent_with_validators(static_server):
+    connection = http.client.HTTPConnection("127.0.0.1", static_server.httpd.server_address[1])
+    connection.request("GET", "/static/style.css")
+    response = connection.getresponse()
+
+    assert 200 == response.status
+    assert "text/css" == response.getheader("Content-Type")
+    assert response.getheader("Last-Modified") is not None
+    assert b"body { color: red; }" == response.read()
+    connection.close()
+
+
+def test__static_file__if_modified_since__not_modified(static_server):
+    connection = http.client.HTTPConnection("127.0.0.1", static_server.httpd.server_address[1])
+    connection.request("GET", "/static/style.css")
+    first = connection.getresponse()
+    first.read()
+    connection.close()
+
+    connection.request(
+        "GET", "/static/style.css", headers={"If-Modified-Since": first.getheader("Last-Modified")}
+    )
+    response = connection.getresponse()
+
+    assert 304 == response.status
+    assert b"" == response.read()
+    connection.close()
+
+
+def test__static_file_missing__not_found(static_server):
+    connection = http.client.HTTPConnection("127.0.0.1", static_server.httpd.server_address[1])
+    connection.request("GET", "/static/missing.css")
+
+    assert 404 == connection.getresponse().status
+    connection.close()
+
+
+def test__live_state__get_status__returns_latest_values(temp_db):
+    live = liveState.LiveState()
+    live.publish("brightness", 10)
+    live.publish("next_alarm", None)
+    alarm_server = server.AlarmServer(port=0, api=alarmApi.AlarmAPI(temp_db), live=live)
+    connection = http.client.HTTPConnection("127.0.0.1", alarm_server.httpd.server_address[1])
+    try:
+        connection.request("GET", "/api/status")
+        response = connection.getresponse()
+
+        assert 200 == response.status
+        assert {"brightness": 10, "next_alarm": None} == json.loads(response.read().decode())
+    finally:
+        connection.close()
+        alarm_server.stop_server()
+
+
+def test__run__serves_view_model_db_and_live_state(temp_db, mocker):
+    view_model = mocker.patch("viewModel.ViewModel").return_value
+    view_model.db = temp_db
+    view_model.live = liveState.LiveState()
+    alarm_server = mocker.patch("server.AlarmServer")
+
+    server.run(port=0)
+
+    arguments = alarm_server.call_args[1]
+    assert view_model.live is arguments["live"]
+    assert temp_db is arguments["api"]._db
+    alarm_server.return_value.worker.join.assert_called_once_with()
+
+
+def test__view_model_served__concurrent_posts_while_reloading__all_stored(
+    tmp_path, monkeypatch, mocker
+):
+    mocker.patch.object(LEDControllerModule, "GPIOLib", utilities._MockController)
+    monkeypatch.chdir(tmp_path)  # the ViewModel's DB is alarms.json
+    view_model = ViewModel()
+    alarm_server = server.AlarmServer(
+        port=0, api=alarmApi.AlarmAPI(view_model.db), live=view_model.live
+    )
+    port = alarm_server.httpd.server_address[1]
+    posting = threading.Event()
+    errors = []
+
+    def post(count):
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        try:
+            for _ in range(count):
+                connection.request("POST", "/api/alarms", body=json.dumps({"target_hour": 6}))
+                response = connection.getresponse()
+                response.read()
+                if response.status != 201:
+                    errors.append(response.status)
+        finally:
+            connection.close()
+
+    def reload():
+        while posting.is_set():
+            view_model.db.reload()
+
+    posting.set()
+    reloader = threading.Thread(target=reload)
+    reloader.start()
+    posters = [threading.Thread(target=post, args=(5,)) for _ in range(4)]
+    try:
+        for poster in posters:
+            poster.start()
+        for poster in posters:
+            poster.join()
+    finally:
+        posting.clear()
+        reloader.join()
+        alarm_server.stop_server()
+
+    stored = {alarm.id for alarm in view_model.db.get_alarms()}
+    for _ in range(100):
+        if len(view_model.alarms.alarms) == 20:
+            break  # applied by the scheduler's update
+        time.sleep(0.01)
+    view_model.db.stop_watching()
+    view_model._update_job.cancel()
+
+    assert [] == errors
+    assert 20 == len(stored)
+    assert stored == {alarm.id for alarm in view_model.alarms.alarms}
+
+
+@pytest.mark.parametrize("length", ["abc", "-1"])
+def test__bad_content_length__post__bad_request(connection, length):
+    connection.putrequest("POST", "/api/alarms")
+    connection.putheader("Content-Length", length)
+    connection.endheaders()
+
+    assert 400 == connection.getresponse().status
+
+
+@pytest.mark.parametrize(
+    "value, expected", [(None, 0), ("12", 12), (" 3 ", 3), ("-1", None), ("x", None)]
+)
+def test__content_length__parse__length_or_None(value, expected):
+    assert expected == server.parse_content_length(value)
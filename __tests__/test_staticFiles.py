@@ -0,0 +1,85 @@
+import gzip
+import mimetypes
+import os
+
+import pytest
+
+from server import FileBody
+import staticFiles
+
+
+@pytest.fixture()
+def static_dir(tmp_path):
+    (tmp_path / "app.js").write_bytes(b"console.log('hi');")
+    (tmp_path / "sub").mkdir()
+    yield tmp_path
+
+
+def test__file__response_has_length_type_and_validators(static_dir):
+    response = staticFiles.StaticFiles(str(static_dir)).response("app.js")
+
+    assert isinstance(response.body, FileBody)
+    assert str(static_dir / "app.js") == response.body.path
+    assert 18 == len(response.body)
+    assert mimetypes.guess_type("app.js")[0] == response.content_type
+    assert response.etag is not None
+    assert os.stat(str(static_dir / "app.js")).st_mtime == response.last_modified
+
+
+@pytest.mark.parametrize("path", ["missing.js", "sub", "../secret", "/../secret", "sub/../../x"])
+def test__not_a_file_in_directory__none(static_dir, path):
+    (static_dir.parent / "secret").write_bytes(b"secret")
+
+    assert staticFiles.StaticFiles(str(static_dir)).response(path) is None
+
+
+def test__gz_variant__accepts_gzip__serves_variant(static_dir):
+    (static_dir / "app.js.gz").write_bytes(gzip.compress(b"console.log('hi');"))
+    static = staticFiles.StaticFiles(str(static_dir))
+
+    plain = static.response("app.js", "identity")
+    compressed = static.response("app.js", "gzip, deflate")
+
+    assert "Content-Encoding" not in plain.headers
+    assert "gzip" == compressed.headers["Content-Encoding"]
+    assert str(static_dir / "app.js.gz") == compressed.body.path
+    assert plain.content_type == compressed.content_type
+    assert plain.etag != compressed.etag
+    assert "Accept-Encoding" == plain.headers["Vary"] == compressed.headers["Vary"]
+
+
+def test__gz_variant_older_than_file__not_served(static_dir):
+    (static_dir / "app.js.gz").write_bytes(gzip.compress(b"old"))
+    os.utime(str(static_dir / "app.js.gz"), (1000, 1000))
+
+    response = staticFiles.StaticFiles(str(static_dir)).response("app.js", "gzip")
+
+    assert "Content-Encoding" not in response.headers
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [(None, False), ("gzip", True), ("br;q=1, gzip;q=0.5", True), ("gzip;q=0", False), ("*", True)],
+)
+def test__accepts_gzip(accept_encoding, expected):
+    assert expected == staticFiles._accepts_gzip(accept_encoding)
+
+
+def test__file_changed__within_recheck_interval__cached_metadata(static_dir):
+    static = staticFiles.StaticFiles(str(static_dir), recheck_interval=60)
+    before = static.response("app.js")
+
+    (static_dir / "app.js").write_bytes(b"longer than it was before")
+
+    assert before.etag == static.response("app.js").etag
+
+
+def test__file_changed__after_recheck_interval__new_metadata(static_dir):
+    static = staticFiles.StaticFiles(str(static_dir), recheck_interval=0)
+    before = static.response("app.js")
+
+    (static_dir / "app.js").write_bytes(b"longer than it was before")
+    after = static.response("app.js")
+
+    assert before.etag != after.etag
+    assert 25 == len(after.body)
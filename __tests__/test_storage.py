@@ -0,0 +1,204 @@
+import json
+import time
+
+import pytest
+from tinydb import TinyDB
+
+import config
+import database
+from alarm import Alarm
+import storage
+import utilities
+
+
+@pytest.fixture()
+def db_path(tmp_path):
+    yield str(tmp_path / "db.json")
+
+
+@pytest.fixture()
+def write_behind_db(db_path):
+    middleware = storage.WriteBehindMiddleware(
+        storage.AtomicJSONStorage, flush_delay=60, flush_count=3
+    )
+    db = TinyDB(db_path, storage=middleware)
+    db.table("Alarms")
+    middleware.flush()  # start with the empty tables on disk
+    yield db, middleware
+    db.close()
+
+
+def read_file(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def test__atomic_storage__write__replaces_file_without_temp(db_path, tmp_path):
+    atomic = storage.AtomicJSONStorage(db_path)
+
+    atomic.write({"a": 1})
+    atomic.write({"b": 2})
+
+    assert {"b": 2} == read_file(db_path)
+    assert [p.name for p in tmp_path.iterdir()] == ["db.json"]
+
+
+def test__atomic_storage_missing_file__read__returns_None(db_path):
+    assert storage.AtomicJSONStorage(db_path).read() is None
+
+
+def test__write_behind__insert__holds_write(write_behind_db, db_path):
+    db, middleware = write_behind_db
+
+    db.table("Alarms").insert({"id": 1})
+
+    assert middleware.pending == 1
+    assert [{"id": 1}] == db.table("Alarms").all()
+    assert {} == read_file(db_path)["Alarms"]
+
+
+def test__write_behind__flush_count_reached__writes(write_behind_db, db_path):
+    db, middleware = write_behind_db
+    table = db.table("Alarms")
+
+    for value in range(3):
+        table.insert({"id": value})
+
+    assert middleware.pending == 0
+    assert 3 == len(read_file(db_path)["Alarms"])
+
+
+def test__write_behind__flush__writes_pending(write_behind_db, db_path):
+    db, middleware = write_behind_db
+    db.table("Alarms").insert({"id": 1})
+
+    middleware.flush()
+
+    assert {"1": {"id": 1}} == read_file(db_path)["Alarms"]
+
+
+def test__write_behind__flush_delay_passed__writes(db_path):
+    middleware = storage.WriteBehindMiddleware(
+        storage.AtomicJSONStorage, flush_delay=0.01, flush_count=100
+    )
+    db = TinyDB(db_path, storage=middleware)
+    db.table("Alarms").insert({"id": 1})
+
+    for _ in range(100):
+        if middleware.pending == 0:
+            break
+        time.sleep(0.01)
+
+    assert middleware.pending == 0
+    assert {"1": {"id": 1}} == read_file(db_path)["Alarms"]
+    db.close()
+
+
+def test__write_behind__reload__keeps_pending_and_other_changes(write_behind_db, db_path):
+    db, middleware = write_behind_db
+    db.table("Alarms").insert({"id": 1})
+    storage.AtomicJSONStorage(db_path).write({"Alarms": {"1": {"id": 2}, "2": {"id": 3}}})
+
+    middleware.reload()
+
+    assert middleware.pending == 1
+    assert {"_default": {}, "Alarms": {"1": {"id": 2}, "2": {"id": 3}, "3": {"id": 1}}} == (
+        middleware.read()
+    )
+    assert {"Alarms": {"1": {"id": 2}, "2": {"id": 3}}} == read_file(db_path)
+
+
+def test__write_behind__reload__pending_remove_kept(write_behind_db, db_path):
+    db, middleware = write_behind_db
+    table = db.table("Alarms")
+    table.insert({"id": 1})
+    middleware.flush()
+    table.remove(doc_ids=[1])
+    storage.AtomicJSONStorage(db_path).write({"Alarms": {"1": {"id": 1}, "2": {"id": 2}}})
+
+    middleware.reload()
+
+    assert {"2": {"id": 2}} == middleware.read()["Alarms"]
+
+
+def test__write_behind__nothing_pending__reload__reads_storage(write_behind_db, db_path):
+    db, middleware = write_behind_db
+    storage.AtomicJSONStorage(db_path).write({"Alarms": {"1": {"id": 2}}})
+
+    middleware.reload()
+
+    assert {"Alarms": {"1": {"id": 2}}} == middleware.read()
+
+
+def test__write_behind__close__writes_pending(write_behind_db, db_path):
+    db, middleware = write_behind_db
+    db.table("Alarms").insert({"id": 1})
+
+    db.close()
+
+    assert {"1": {"id": 1}} == read_file(db_path)["Alarms"]
+
+
+def test__binary_storage__write_and_read__round_trips(db_path):
+    binary = storage.BinaryAlarmStorage(db_path)
+    data = {
+        "_default": {},
+        "Alarms": {
+            "1": {
+                "id": -5,
+                "target_days": utilities.Days.MONDAY | utilities.Days.FRIDAY,
+                "target_hour": 6,
+                "target_minute": 45,
+                "active": False,
+                "_value": 0,
+            }
+        },
+    }
+
+    binary.write(data)
+
+    assert data == binary.read()
+
+
+def test__binary_storage__write__fixed_width_records(db_path):
+    binary = storage.BinaryAlarmStorage(db_path)
+    alarms = {str(doc_id): {"id": doc_id} for doc_id in range(1, 101)}
+
+    binary.write({"Alarms": alarms})
+
+    header = storage.BinaryAlarmStorage.HEADER.size + storage.BinaryAlarmStorage.TABLE_HEADER.size
+    assert header + len("Alarms") + 100 * 18 == len(open(db_path, "rb").read())
+
+
+def test__binary_storage__unknown_field__raises(db_path):
+    binary = storage.BinaryAlarmStorage(db_path)
+
+    with pytest.raises(Exception):
+        binary.write({"Alarms": {"1": {"id": 1, "name": "work"}}})
+
+
+def test__binary_storage__other_version__raises(db_path):
+    binary = storage.BinaryAlarmStorage(db_path)
+    binary.write({"Alarms": {}})
+    with open(db_path, "r+b") as handle:
+        handle.seek(4)
+        handle.write(bytes([storage.BinaryAlarmStorage.VERSION + 1]))
+
+    with pytest.raises(Exception):
+        binary.read()
+
+
+@pytest.mark.parametrize("write_behind", [True, False])
+def test__binary_format__db_close_and_reopen__returns_same_data(db_path, mocker, write_behind):
+    mocker.patch.object(config, "db_format", "binary")
+    db = database.DB(db_path, write_behind=write_behind)
+    alarm = database.DBAlarm(Alarm())
+    alarm.target_days = utilities.Days.SATURDAY
+    alarm.target_hour = 23
+    alarm.target_minute = 59
+    db.add_alarm(alarm)
+
+    db._close()
+    db._open()
+
+    assert [alarm] == db.get_alarms()
@@ -94,6 +94,38 @@ class TestConvertDaysFlagToWeekday(unittest.TestCase):
     # can it handle multiple days??
 
 
+class TestWeekdayBitsMatchDaysFlags(unittest.TestCase):
+    def test_each_weekday(self):
+        for weekday in range(7):
+            self.assertEqual(int(convert_weekday_to_days_flag(weekday)), WEEKDAY_BITS[weekday])
+            self.assertEqual(convert_weekday_to_days_flag(weekday), WEEKDAY_FLAGS[weekday])
+
+
+class TestDaysUntilNext(unittest.TestCase):
+    """
+    For reference:
+        Sun - 0
+        Mon - 1
+        ...
+        Sat - 6
+    """
+
+    def test_no_days_is_0(self):
+        self.assertEqual(0, DAYS_UNTIL_NEXT[0][3])
+
+    def test_tomorrow_is_1(self):
+        self.assertEqual(1, DAYS_UNTIL_NEXT[int(Days.MONDAY)][0])
+
+    def test_wraps_past_saturday(self):
+        self.assertEqual(2, DAYS_UNTIL_NEXT[int(Days.MONDAY)][6])
+
+    def test_only_today_is_next_week(self):
+        self.assertEqual(7, DAYS_UNTIL_NEXT[int(Days.WEDNESDAY)][3])
+
+    def test_multiple_days_yields_nearest(self):
+        self.assertEqual(2, DAYS_UNTIL_NEXT[int(Days.MONDAY | Days.FRIDAY)][3])
+
+
 # endregion
 
 
@@ -0,0 +1,278 @@
+from datetime import datetime, timedelta
+import threading
+
+import pytest
+
+from alarm import Alarm
+from alarmComposite import AlarmComposite
+import config
+import database
+import LEDController as LEDControllerModule
+import utilities
+from utilities import Days
+from viewModel import ViewModel
+
+
+@pytest.fixture()
+def view_model(tmp_path, monkeypatch, mocker):
+    mocker.patch.object(LEDControllerModule, "GPIOLib", utilities._MockController)
+    mocker.patch.object(config, "db_watch", False)  # reloaded by hand
+    mocker.patch.object(config, "sleep_between_alarms", True)
+    mocker.patch.object(config, "hardware_fade", False)
+    mocker.patch("scheduler.get_scheduler")  # updates are run by hand
+    monkeypatch.chdir(tmp_path)  # the ViewModel's DB is alarms.json
+    yield ViewModel()
+
+
+@pytest.fixture()
+def other_db(tmp_path, view_model):
+    # another process (such as cli.py) sharing the ViewModel's database file
+    yield database.DB(str(tmp_path / "alarms.json"))
+
+
+def make_alarm(hour, minute=0):
+    alarm = database.DBAlarm(Alarm())
+    alarm.add_target_day(Days.SUNDAY)
+    alarm.set_time(hour, minute)
+    return alarm
+
+
+def held_alarms(view_model):
+    view_model._apply_alarm_events()  # as the next update would
+    return [state.alarm for state in view_model.alarms.evaluate().alarm_states]
+
+
+def test__db_adds_alarm__alarm_added__composite_holds_it_and_update_woken(view_model):
+    view_model._update_job.reset_mock()
+    alarm = make_alarm(6)
+
+    view_model.db.add_alarm(alarm)
+
+    assert [alarm.id] == [held.id for held in held_alarms(view_model)]
+    assert view_model._alarms_changed.is_set()
+    view_model._update_job.reschedule.assert_called_once_with(0)
+
+
+def test__db_adds_alarm__before_update__composite_unchanged(view_model):
+    view_model.db.add_alarm(make_alarm(6))
+
+    assert [] == view_model.alarms.alarms
+    assert 1 == len(view_model._alarm_events)
+
+
+def test__writer_changes_alarm_after_adding__held_alarm_unchanged(view_model):
+    alarm = make_alarm(6)
+    view_model.db.add_alarm(alarm)
+
+    alarm.target_hour = 9  # not stored, the composite mustn't see it either
+
+    assert 6 == held_alarms(view_model)[0].target_hour
+
+
+def test__db_stores_changed_copy__alarm_changed__held_alarm_updated(view_model):
+    view_model.db.add_alarm(make_alarm(6))
+    held = held_alarms(view_model)[0]
+    copy = view_model.db.get_alarm(held.id)
+    copy.target_hour = 7
+
+    view_model.db.add_alarm(copy)
+
+    assert [held] == held_alarms(view_model)
+    assert 7 == held.target_hour
+    assert 7 == view_model.alarms.target_hour
+
+
+def test__db_removes_alarm__alarm_deleted__composite_drops_it(view_model):
+    view_model.db.add_alarm(make_alarm(6))
+    held = held_alarms(view_model)[0]
+    view_model._alarms_changed.clear()
+
+    view_model.db.remove_alarm(held)
+
+    assert [] == held_alarms(view_model)
+    assert view_model._alarms_changed.is_set()
+
+
+def test__unknown_id__alarm_deleted__ignored(view_model):
+    view_model.db.add_alarm(make_alarm(6))
+
+    view_model.alarm_deleted(1)
+
+    assert 1 == len(held_alarms(view_model))
+
+
+def test__other_db_adds_changes_and_deletes__reload__composite_follows(view_model, other_db):
+    alarm = make_alarm(6)
+
+    other_db.add_alarm(alarm)
+    view_model.db.reload()
+    assert [alarm.id] == [held.id for held in held_alarms(view_model)]
+
+    alarm.target_hour = 8
+    other_db.add_alarm(alarm)
+    view_model.db.reload()
+    assert 8 == held_alarms(view_model)[0].target_hour
+    assert 8 == view_model.alarms.target_hour
+
+    other_db.remove_alarm(alarm)
+    view_model.db.reload()
+    assert [] == held_alarms(view_model)
+
+
+def test__before_window__scheduled_update__led_off_and_sleeps_until_window(view_model, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 5, 25))  # Sunday, five minutes before the fade
+    view_model.db.add_alarm(make_alarm(6))
+    view_model._update_job.reset_mock()
+
+    view_model._scheduled_update()
+
+    assert 0 == view_model.led.value
+    view_model._update_job.reschedule.assert_called_once_with(5 * 60)
+    assert 0 == view_model.live.get("brightness")
+    assert "2006-01-01T06:00:00" == view_model.live.get("next_alarm")["time"]
+
+
+def test__in_window__scheduled_update__led_follows_alarm(view_model, freezer):
+    now = datetime(2006, 1, 1, 5, 45)
+    freezer.move_to(now)
+    view_model.db.add_alarm(make_alarm(6))
+    view_model._update_job.reset_mock()
+
+    view_model._scheduled_update()
+
+    expected = view_model.alarms.get_desired_brightness(now)
+    assert 0 < expected < 100
+    assert view_model.led.value == pytest.approx(expected, abs=1)
+    assert round(expected, 1) == view_model.live.get("brightness")
+    delay = view_model._update_job.reschedule.call_args[0][0]
+    assert 0 < delay < 60  # the next visible step
+
+
+def test__alarms_changed_while_updating__scheduled_update__runs_again_now(view_model, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 5, 0))
+    view_model.db.add_alarm(make_alarm(6))
+    evaluate = view_model.alarms.evaluate
+
+    def evaluate_then_change(now=None):
+        state = evaluate(now)
+        view_model._alarms_changed.set()
+        return state
+
+    view_model.alarms.evaluate = evaluate_then_change
+    view_model._update_job.reset_mock()
+
+    view_model._scheduled_update()
+
+    view_model._update_job.reschedule.assert_called_once_with(0)
+
+
+def test__window__start_hardware_fade__ramps_through_each_second(view_model, mocker):
+    view_model.db.add_alarm(make_alarm(6))
+    start_ramp = mocker.patch.object(view_model.led, "start_ramp")
+    now = datetime(2006, 1, 1, 5, 45)
+
+    view_model._start_hardware_fade(now, now + timedelta(seconds=3))
+
+    start_ramp.assert_called_once_with(
+        [
+            view_model.alarms.get_desired_brightness(now + timedelta(seconds=second))
+            for second in range(4)
+        ]
+    )
+
+
+def test__hardware_fade_in_window__scheduled_update__hands_fade_to_daemon(
+    view_model, freezer, mocker
+):
+    mocker.patch.object(config, "hardware_fade", True)
+    now = datetime(2006, 1, 1, 5, 45)
+    freezer.move_to(now)
+    view_model.db.add_alarm(make_alarm(6))
+    start_fade = mocker.patch.object(view_model, "_start_hardware_fade")
+    view_model._update_job.reset_mock()
+
+    view_model._scheduled_update()
+
+    start_fade.assert_called_once_with(now, view_model._window[1])
+    view_model._update_job.reschedule.assert_called_once_with(
+        min((view_model._window[1] - now).total_seconds(), config.max_idle_sleep)
+    )
+
+
+def test__alarms_changed_on_other_thread__scheduled_updates__composite_follows(view_model):
+    alarm = make_alarm(6)
+    view_model.db.add_alarm(alarm)
+    stop = threading.Event()
+
+    def change():
+        for minute in range(60):
+            alarm.target_minute = minute
+            view_model.db.add_alarm(alarm)
+        stop.set()
+
+    writer = threading.Thread(target=change)
+    writer.start()
+    while not stop.is_set():
+        view_model._scheduled_update()
+    writer.join()
+    view_model._scheduled_update()
+
+    assert 59 == view_model.alarms.target_minute
+    expected = AlarmComposite()
+    expected.add_alarm(make_alarm(6, 59))
+    now = datetime(2006, 1, 1, 6, 50)
+    assert expected.get_desired_brightness(now) == view_model.alarms.get_desired_brightness(now)
+
+
+def test__in_window__several_frames__evaluates_once(view_model, freezer, mocker):
+    freezer.move_to(datetime(2006, 1, 1, 5, 45))
+    view_model.db.add_alarm(make_alarm(6))
+    evaluate = mocker.spy(view_model.alarms, "evaluate")
+
+    for second in range(5):
+        freezer.move_to(datetime(2006, 1, 1, 5, 45, second))
+        view_model._scheduled_update()
+
+    assert 1 == evaluate.call_count
+    now = datetime(2006, 1, 1, 5, 45, 4)
+    assert view_model.led.value == pytest.approx(
+        view_model.alarms.get_desired_brightness(now), abs=1
+    )
+
+
+def test__alarm_changed__scheduled_update__evaluates_again(view_model, freezer, mocker):
+    freezer.move_to(datetime(2006, 1, 1, 5, 0))
+    alarm = make_alarm(6)
+    view_model.db.add_alarm(alarm)
+    view_model._scheduled_update()
+    evaluate = mocker.spy(view_model.alarms, "evaluate")
+
+    alarm.target_hour = 7
+    view_model.db.add_alarm(alarm)
+    view_model._scheduled_update()
+
+    assert 1 == evaluate.call_count
+    assert "2006-01-01T07:00:00" == view_model.live.get("next_alarm")["time"]
+
+
+def test__next_alarm_passed__scheduled_update__evaluates_again(view_model, freezer):
+    freezer.move_to(datetime(2006, 1, 1, 5, 59))
+    view_model.db.add_alarm(make_alarm(6))
+    view_model._scheduled_update()
+
+    freezer.move_to(datetime(2006, 1, 1, 6, 1))
+    view_model._scheduled_update()
+
+    assert "2006-01-08T06:00:00" == view_model.live.get("next_alarm")["time"]
+
+
+def test__led_fails__scheduled_update__runs_again_after_retry_delay(view_model, freezer, mocker):
+    freezer.move_to(datetime(2006, 1, 1, 5, 45))
+    view_model.db.add_alarm(make_alarm(6))
+    mocker.patch.object(view_model._fade, "frame", side_effect=ConnectionError("pigpiod"))
+    view_model._update_job.reset_mock()
+
+    with pytest.raises(ConnectionError):
+        view_model._scheduled_update()
+
+    view_model._update_job.reschedule.assert_called_once_with(config.update_retry_delay)
@@ -13,14 +13,82 @@ from datetime import datetime, timedelta, time
 
 
 class Alarm(object):
+    # the stored fields, see to_dict
+    _FIELDS = ("_value", "target_days", "target_hour", "target_minute", "active")
+
+    # every attribute is a slot, so an alarm is a small fixed size record with no per instance dict
+    __slots__ = ("__weakref__", "_observers", "_dirty") + _FIELDS
+
+    # fields that change when (and if) the alarm fires
+    _SCHEDULE_FIELDS = frozenset(("target_days", "target_hour", "target_minute", "active"))
+
+    _MISSING = object()
+
     def __init__(self, **kwargs):
+        self._observers = []
+        self._dirty = set()  # fields changed since mark_clean
         self._value = 0
         self.target_days = utilities.Days(0)
         self.target_hour = 0
         self.target_minute = 0
         self.active = True
         for key in kwargs:
-            self.__dict__[key] = kwargs[key]
+            object.__setattr__(self, key, kwargs[key])
+            self._dirty.add(key)
+
+    def __setattr__(self, key, value):
+        if key not in type(self)._FIELDS:
+            object.__setattr__(self, key, value)
+            return
+        old = getattr(self, key, Alarm._MISSING)
+        if type(old) is type(value) and old == value:
+            return  # nothing changed, nothing to store or notify
+        object.__setattr__(self, key, value)
+        self._dirty.add(key)
+        if key in Alarm._SCHEDULE_FIELDS:
+            for observer in self._observers:
+                observer(self)
+
+    def __getstate__(self):
+        # copies/pickles don't carry the observers along
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        for key, value in state.items():
+            object.__setattr__(self, key, value)
+        self._observers = []
+        self._dirty = set(state)  # not known to be stored
+
+    def to_dict(self):
+        """
+        :return: dict of the stored fields (what is persisted and compared)
+        """
+        return {key: getattr(self, key) for key in type(self)._FIELDS}
+
+    @property
+    def dirty_fields(self):
+        """
+        :return: frozenset of the fields changed since mark_clean (all of them if never marked)
+        """
+        return frozenset(self._dirty)
+
+    def mark_clean(self):
+        """
+        Forget changes made so far (they have been stored)
+        :return: None
+        """
+        self._dirty.clear()
+
+    def add_observer(self, observer):
+        """
+        Register a callback for changes to when this alarm fires
+        :param observer: callable taking the changed alarm
+        :return: None
+        """
+        self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        self._observers.remove(observer)
 
     def add_target_day(self, day):
         self.target_days |= day
@@ -49,47 +117,57 @@ class Alarm(object):
         Get the next target day as a Day enum
         :return: Day enum
         """
-        if self.target_days == utilities.Days(0):
-            raise Exception("No time set")
-
-        # get current date time
-        now = utilities.TestableDateTime.now()
+        return self.next_day_at(utilities.TestableDateTime.now())
 
+    def next_day_at(self, now):
+        """
+        Get the next target day as of now
+        :param now: datetime
+        :return: Day enum
+        """
         today = utilities.convert_datetime_weekday_to_zero_sunday(now.weekday())
+        return utilities.WEEKDAY_FLAGS[(today + self._days_until_next(now)) % 7]
+
+    def _days_until_next(self, now):
+        """
+        Get the number of days from now's date to the next target day
+        :param now: datetime
+        :return: 0 if it is later today, 1-7 otherwise (7 is the same day next week)
+        """
+        days = int(self.target_days)
+        if days == 0:
+            raise Exception("No time set")
 
-        today_as_days_flag = utilities.convert_weekday_to_days_flag(today)
+        today = utilities.convert_datetime_weekday_to_zero_sunday(now.weekday())
 
         # evaluate next target day (if today is a target day, include if not past alarm time)
-        if today_as_days_flag in self.target_days:
-            if (
-                now.hour < self.target_hour
-                or now.hour == self.target_hour
-                and now.minute <= self.target_minute
-            ):
-                return today_as_days_flag
-
-        target_day = original = today_as_days_flag
-        target_day = Days.increment(target_day)
-        while target_day != original:
-            if self.target_days & target_day == target_day:
-                return target_day
-            target_day = Days.increment(target_day)
-        if self.target_days & target_day == target_day:  # if we wrapped, check one more time
-            return target_day
-        raise Exception("Could not find next target day.")
-
-    def get_desired_brightness(self):
+        if days & utilities.WEEKDAY_BITS[today]:
+            if (now.hour, now.minute) <= (self.target_hour, self.target_minute):
+                return 0
+
+        return utilities.DAYS_UNTIL_NEXT[days][today]
+
+    def get_desired_brightness(self, now=None):
         """
 
+        :param now: datetime to evaluate at, defaults to the current time
         :return: desired brightness [0,100]
         """
         if not self.active:
             return 0
 
-        time = utilities.TestableDateTime.now()
-        time_delta = self.target_datetime - time
+        if now is None:
+            now = utilities.TestableDateTime.now()
+        passed_today = self.alarm_passed_at(now)
+        return self._brightness(now, self._target_datetime(now, passed_today), passed_today)
+
+    def _brightness(self, time, target_datetime, passed_today):
+        if not self.active:
+            return 0
+
+        time_delta = target_datetime - time
 
-        if self.alarm_passed_today:
+        if passed_today:
             desired_after_on_time = config.after_wakeup_on_time * 60
             # check if we should still be on
             today_target_time = datetime(
@@ -110,23 +188,60 @@ class Alarm(object):
         else:
             return 0
 
+    def next_window(self, now=None):
+        """
+        Get the next period this alarm wants the LED on for (fade in through after wakeup on time)
+        :param now: datetime to evaluate at, defaults to the current time
+        :return: (start, end) datetimes, the LED is off again from end; None if it never turns on
+        """
+        if not self.active or self.target_days == Days(0):
+            return None
+
+        if now is None:
+            now = utilities.TestableDateTime.now()
+        passed_today = self.alarm_passed_at(now)
+        return self._window(now, self._target_datetime(now, passed_today), passed_today)
+
+    def _window(self, now, target_datetime, passed_today):
+        if not self.active:
+            return None
+
+        fade_time = timedelta(minutes=config.wakeup_time)
+        on_time = timedelta(minutes=config.after_wakeup_on_time)
+
+        if passed_today:
+            # may still be in the after wakeup on time for today's alarm
+            today_target = datetime(
+                now.year, now.month, now.day, self.target_hour, self.target_minute
+            )
+            if now < today_target + on_time:
+                return today_target - fade_time, today_target + on_time
+
+        target = target_datetime.replace(second=0, microsecond=0)
+        return target - fade_time, target + on_time
+
     @property
     def target_datetime(self):
-        time = utilities.TestableDateTime.now()
-        next_day = self.next_day
-        this_day = utilities.convert_datetime_weekday_to_zero_sunday(time.weekday())
-
-        target = time
-        days_delta = utilities.convert_days_flag_to_weekday(next_day) - this_day
-        if days_delta == 0:
-            # this means the alarm is set weekly, and it is that day, bump it a week if it has passed today
-            days_delta += 7 if self.alarm_passed_today else 0
-        elif days_delta < 0:
-            days_delta += (
-                7  # the day of the week has passed, delta should be positive to the next occurrence
-            )
+        return self.target_datetime_at(utilities.TestableDateTime.now())
 
-        target += timedelta(days=days_delta)
+    def target_datetime_at(self, now):
+        """
+        Get the next time this alarm reaches full brightness as of now
+        :param now: datetime
+        :return: datetime
+        """
+        return self._target_datetime(now, self.alarm_passed_at(now))
+
+    def _target_datetime(self, time, passed_today, days_until_next=None):
+        if days_until_next is None:
+            days_until_next = self._days_until_next(time)
+
+        days_delta = days_until_next
+        if days_delta == 0 and passed_today:
+            # the alarm is today but already passed (this minute), bump it a week
+            days_delta = 7
+
+        target = time + timedelta(days=days_delta)
         target = target.replace(
             hour=self.target_hour, minute=self.target_minute
         )  # returns new target time
@@ -135,11 +250,62 @@ class Alarm(object):
 
     @property
     def alarm_passed_today(self):
-        today = utilities.TestableDateTime.now().weekday()
-        today = utilities.convert_datetime_weekday_to_zero_sunday(today)
-        today = utilities.convert_weekday_to_days_flag(today)
+        return self.alarm_passed_at(utilities.TestableDateTime.now())
+
+    def alarm_passed_at(self, now):
+        """
+        Check if today is a target day and now is past its target time
+        :param now: datetime
+        :return: bool
+        """
+        today = utilities.convert_datetime_weekday_to_zero_sunday(now.weekday())
 
-        if today & self.target_days != Days(0):
-            this_time = utilities.TestableDateTime.now().time()
-            return this_time > time(self.target_hour, self.target_minute)
+        if int(self.target_days) & utilities.WEEKDAY_BITS[today]:
+            return now.time() > time(self.target_hour, self.target_minute)
         return False
+
+    def evaluate(self, now):
+        """
+        Evaluate everything about this alarm against a single clock reading
+        :param now: datetime
+        :return: AlarmState
+        """
+        if self.target_days == Days(0):
+            return AlarmState(self)  # never fires
+
+        passed_today = self.alarm_passed_at(now)
+        days_until_next = self._days_until_next(now)
+        today = utilities.convert_datetime_weekday_to_zero_sunday(now.weekday())
+        next_day = utilities.WEEKDAY_FLAGS[(today + days_until_next) % 7]
+        target = self._target_datetime(now, passed_today, days_until_next)
+        return AlarmState(
+            self,
+            passed_today=passed_today,
+            next_day=next_day,
+            target_datetime=target,
+            brightness=self._brightness(now, target, passed_today),
+            window=self._window(now, target, passed_today),
+        )
+
+
+class AlarmState(object):
+    """
+    Snapshot of an alarm evaluated at one point in time (see Alarm.evaluate)
+    next_day, target_datetime and window are None if the alarm has no target days
+    """
+
+    def __init__(
+        self,
+        alarm,
+        passed_today=False,
+        next_day=None,
+        target_datetime=None,
+        brightness=0,
+        window=None,
+    ):
+        self.alarm = alarm
+        self.passed_today = passed_today
+        self.next_day = next_day
+        self.target_datetime = target_datetime
+        self.brightness = brightness
+        self.window = window
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import threading
+
+from alarm import Alarm
+import config
+from configObserver import ConfigObserver
+import database
+from server import actionModes, Response, dumps_json
+import utilities
+
+
+class AlarmAPI(ConfigObserver):
+    """
+    JSON API over a DB:
+
+        GET    /api/alarms              all alarms (also GET /?action=getConfig)
+        POST   /api/alarms              create an alarm from the fields given
+        GET    /api/alarms/<id>         one alarm
+        PUT    /api/alarms/<id>         change the fields given (PATCH is the same)
+        DELETE /api/alarms/<id>         delete an alarm
+        POST   /?action=setConfig       create or change every alarm in {"alarms": [...]}
+
+    An alarm is {"id", "target_days" (Days bitmask), "target_hour", "target_minute", "active"}; ids
+    are strings since they don't fit in a JavaScript number. The list of all alarms is serialized
+    once and kept, with an ETag, until the DB reports a change.
+    """
+
+    PREFIX = "/api/alarms"
+
+    def __init__(self, db):
+        ConfigObserver.__init__(self)
+        self._db = db
+        self._lock = threading.RLock()
+        self._snapshot = None  # (body, etag) of the alarm list, None if it needs rebuilding
+        db.add_observer(self)
+
+    def handle(self, method, path, query, body):
+        """
+        :param method: HTTP method
+        :param path: request path, without the query
+        :param query: dict of query parameter -> list of values
+        :param body: request body (bytes)
+        :return: Response, None if path isn't part of the API
+        """
+        action = query.get("action", [None])[0]
+        if path == "/" and action == actionModes.requestConfig and method in ("GET", "HEAD"):
+            return self.snapshot()
+        if path == "/" and action == actionModes.postConfig and method == "POST":
+            return self._set_config(body)
+
+        if path.rstrip("/") == AlarmAPI.PREFIX:
+            if method in ("GET", "HEAD"):
+                return self.snapshot()
+            if method == "POST":
+                return self._create(body)
+            return Response.error(405, "Method not allowed")
+
+        if path.startswith(AlarmAPI.PREFIX + "/"):
+            try:
+                alarm_id = int(path[len(AlarmAPI.PREFIX) + 1 :].rstrip("/"))
+            except ValueError:
+                return Response.error(404, "No such alarm")
+            if method in ("GET", "HEAD"):
+                return self._get(alarm_id)
+            if method in ("PUT", "PATCH"):
+                return self._update(alarm_id, body)
+            if method == "DELETE":
+                return self._delete(alarm_id)
+            return Response.error(405, "Method not allowed")
+        return None
+
+    def snapshot(self):
+        """
+        Get the (cached) list of all alarms
+        :return: Response
+        """
+        with self._lock:
+            if self._snapshot is None:
+                alarms = sorted(
+                    self._db.get_alarms(),
+                    key=lambda alarm: (alarm.target_hour, alarm.target_minute, alarm.id),
+                )
+                body = dumps_json(
+                    {
+                        "alarms": [to_json(alarm) for alarm in alarms],
+                        "wakeup_time": config.wakeup_time,
+                        "after_wakeup_on_time": config.after_wakeup_on_time,
+                    }
+                )
+                self._snapshot = (body, _etag(body))
+            body, etag = self._snapshot
+        return Response(body=body, etag=etag)
+
+    def alarm_added(self, alarm):
+        self._invalidate()
+
+    def alarm_deleted(self, id):
+        self._invalidate()
+
+    def alarm_changed(self, alarm):
+        self._invalidate()
+
+    def _invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _get(self, alarm_id):
+        alarm = self._db.get_alarm(alarm_id)
+        if alarm is None:
+            return Response.error(404, "No such alarm")
+        body = dumps_json(to_json(alarm))
+        return Response(body=body, etag=_etag(body))
+
+    def _create(self, body):
+        try:
+            with self._lock:
+                alarm = database.DBAlarm(Alarm())
+                apply_json(alarm, _loads(body))
+                self._db.add_alarm(alarm)
+        except Exception as error:
+            return Response.error(400, str(error))
+        return Response.json(
+            to_json(alarm), 201, headers={"Location": "{0}/{1}".format(AlarmAPI.PREFIX, alarm.id)}
+        )
+
+    def _update(self, alarm_id, body):
+        with self._lock:
+            alarm = self._db.get_alarm(alarm_id)
+            if alarm is None:
+                return Response.error(404, "No such alarm")
+            try:
+                apply_json(alarm, _loads(body))
+            except Exception as error:
+                return Response.error(400, str(error))
+            self._db.add_alarm(alarm)
+        return Response.json(to_json(alarm))
+
+    def _delete(self, alarm_id):
+        with self._lock:
+            alarm = self._db.get_alarm(alarm_id)
+            if alarm is None:
+                return Response.error(404, "No such alarm")
+            self._db.remove_alarm(alarm)
+        return Response(204)
+
+    def _set_config(self, body):
+        try:
+            alarms = _loads(body)["alarms"]
+            with self._lock:
+                # check everything before storing anything
+                changes = []
+                for values in alarms:
+                    alarm = None
+                    if "id" in values:
+                        alarm = self._db.get_alarm(int(values["id"]))
+                    if alarm is None:
+                        alarm = database.DBAlarm(Alarm())
+                    apply_json(alarm, values)
+                    changes.append(alarm)
+                for alarm in changes:
+                    self._db.add_alarm(alarm)
+        except Exception as error:
+            return Response.error(400, str(error))
+        return self.snapshot()
+
+
+def to_json(alarm):
+    """
+    :param alarm: DBAlarm
+    :return: dict for the API
+    """
+    return {
+        "id": str(alarm.id),
+        "target_days": int(alarm.target_days),
+        "target_hour": alarm.target_hour,
+        "target_minute": alarm.target_minute,
+        "active": alarm.active,
+    }
+
+
+def apply_json(alarm, values):
+    """
+    Set the alarm fields given in values, checking them first
+    :param alarm: Alarm
+    :param values: dict from the API (other keys are ignored)
+    :return: None
+    """
+    if not isinstance(values, dict):
+        raise Exception("Expected a JSON object")
+    hour = values.get("target_hour", alarm.target_hour)
+    minute = values.get("target_minute", alarm.target_minute)
+    days = values.get("target_days", int(alarm.target_days))
+    active = values.get("active", alarm.active)
+    if type(hour) is not int or type(minute) is not int:
+        raise Exception("target_hour and target_minute must be integers")
+    if type(days) is not int or days < 0 or days > int(utilities.Days.ALL):
+        raise Exception("target_days must be a Days bitmask (0-127)")
+    if not isinstance(active, bool):
+        raise Exception("active must be true or false")
+
+    alarm.set_time(hour, minute)  # raises if out of range
+    alarm.target_days = utilities.Days(days)
+    alarm.active = active
+
+
+def _loads(body):
+    try:
+        return json.loads(body.decode("utf-8"))
+    except ValueError:
+        raise Exception("Body is not valid JSON")
+
+
+def _etag(body):
+    return '"{0}"'.format(hashlib.sha1(body).hexdigest()[:20])
@@ -1,5 +1,10 @@
+import heapq
+import itertools
+
 from alarm import Alarm
+from brightnessTable import BrightnessTable
 
+import utilities
 from utilities import Days
 import unittest
 from unittest.mock import patch
@@ -9,15 +14,35 @@ class AlarmComposite(object):
     def __init__(self):
         self.alarms = []
 
+        # next fire index: heap of (target datetime, sequence, alarm) for alarms with target days.
+        # Entries are invalidated lazily: an entry is only current if it matches _next_fire_entries
+        self._next_fire = []
+        self._next_fire_entries = {}  # id(alarm) -> (target datetime, sequence)
+        self._next_fire_sequence = itertools.count()
+        self._next_fire_changed = {}  # id(alarm) -> alarm, changed since they were indexed
+        self._next_fire_checked = None  # time the index was last known to be valid
+
+        # weekly brightness envelope, built on first use
+        self._brightness_table = None
+        self._brightness_table_changed = {}  # id(alarm) -> alarm, changed since the table update
+
     def add_alarm(self, alarm):
         self.alarms.append(alarm)
+        alarm.add_observer(self._alarm_changed)
+        self._alarm_changed(alarm)
 
     def add_alarms(self, *args):
         for alarm in args:
-            self.alarms.append(alarm)
+            self.add_alarm(alarm)
 
     def remove_alarm(self, alarm):
         self.alarms.remove(alarm)
+        alarm.remove_observer(self._alarm_changed)
+        self._next_fire_changed.pop(id(alarm), None)
+        self._next_fire_entries.pop(id(alarm), None)
+        self._brightness_table_changed.pop(id(alarm), None)
+        if self._brightness_table is not None:
+            self._brightness_table.remove(alarm)
 
     @property
     def active(self):
@@ -42,17 +67,89 @@ class AlarmComposite(object):
     def next_day(self):
         return self._find_nearest_alarm().next_day
 
-    def get_desired_brightness(self):
-        # return greatest brightness
+    def get_desired_brightness(self, now=None):
+        # return greatest brightness, looked up from the weekly table
         if len(self.alarms) == 0:
             return 0
 
-        result = self.alarms[0].get_desired_brightness()
-        for alarm in self.alarms:
-            temp = alarm.get_desired_brightness()
-            if temp > result:
-                result = temp
-        return result
+        if now is None:
+            now = utilities.TestableDateTime.now()
+        return self._get_brightness_table().lookup(now)
+
+    def brightness_slope(self, now=None):
+        """
+        Get how fast the greatest brightness is changing
+        :param now: datetime to evaluate at, defaults to the current time
+        :return: percent per second, 0 unless brightness is rising
+        """
+        if now is None:
+            now = utilities.TestableDateTime.now()
+        return self._get_brightness_table().slope(now)
+
+    def next_brightness_change(self, now=None):
+        """
+        Get when the greatest brightness next starts to change
+        :param now: datetime to evaluate at, defaults to the current time
+        :return: datetime (now if it is changing), None if it never changes
+        """
+        if now is None:
+            now = utilities.TestableDateTime.now()
+        return self._get_brightness_table().next_change(now)
+
+    def _get_brightness_table(self):
+        table = self._brightness_table
+        if table is None or table.settings != BrightnessTable.current_settings():
+            table = self._brightness_table = BrightnessTable()
+            changed = self.alarms
+        else:
+            changed = self._brightness_table_changed.values()
+
+        for alarm in changed:
+            table.update(alarm)
+        self._brightness_table_changed.clear()
+        return table
+
+    def next_window(self, now=None):
+        """
+        Get the soonest period any alarm wants the LED on for
+        :param now: datetime to evaluate at, defaults to the current time
+        :return: (start, end) datetimes, or None if no alarm will turn on
+        """
+        if now is None:
+            now = utilities.TestableDateTime.now()
+        windows = [alarm.next_window(now) for alarm in self.alarms]
+        windows = [window for window in windows if window is not None]
+        if len(windows) == 0:
+            return None
+        return min(windows)
+
+    def evaluate(self, now=None):
+        """
+        Evaluate every alarm in one pass against a single clock reading
+        :param now: datetime to evaluate at, defaults to the current time
+        :return: CompositeState
+        """
+        if now is None:
+            now = utilities.TestableDateTime.now()
+
+        states = [alarm.evaluate(now) for alarm in self.alarms]
+        # the same table get_desired_brightness, and so the LED, uses
+        brightness = 0 if len(states) == 0 else self._get_brightness_table().lookup(now)
+
+        nearest = None
+        window = None
+        for state in states:
+            if state.target_datetime is not None and (
+                nearest is None or state.target_datetime < nearest.target_datetime
+            ):
+                nearest = state
+            if state.window is not None and (window is None or state.window < window):
+                window = state.window
+
+        if nearest is None and len(states) > 0:
+            nearest = states[0]  # no alarm has target days set
+
+        return CompositeState(now, brightness, nearest, window, states)
 
     @property
     def value(self):
@@ -70,11 +167,78 @@ class AlarmComposite(object):
     def _find_nearest_alarm(self):
         if len(self.alarms) == 0:
             raise Exception("Must have at least one alarm")
-        nearest = self.alarms[0]
-        for alarm in self.alarms:
-            if alarm.target_days != Days(0) and alarm.target_datetime < nearest.target_datetime:
-                nearest = alarm
-        return nearest
+
+        now = utilities.TestableDateTime.now()
+        if self._next_fire_checked is not None and now < self._next_fire_checked:
+            # clock went backwards, every cached target may be wrong
+            self._next_fire_changed.update((id(alarm), alarm) for alarm in self.alarms)
+        self._next_fire_checked = now
+
+        for alarm in self._next_fire_changed.values():
+            self._index_alarm(alarm)
+        self._next_fire_changed.clear()
+
+        while len(self._next_fire) > 0:
+            target, sequence, alarm = self._next_fire[0]
+            if self._next_fire_entries.get(id(alarm)) != (target, sequence):
+                heapq.heappop(self._next_fire)  # stale entry
+            elif target < now:
+                # has fired since it was indexed, move it to its next occurrence
+                heapq.heappop(self._next_fire)
+                self._index_alarm(alarm)
+            else:
+                return alarm
+
+        # no alarm has target days set
+        return self.alarms[0]
+
+    def _alarm_changed(self, alarm):
+        self._next_fire_changed[id(alarm)] = alarm
+        self._brightness_table_changed[id(alarm)] = alarm
+
+    def _index_alarm(self, alarm):
+        if alarm.target_days == Days(0):
+            self._next_fire_entries.pop(id(alarm), None)
+            return
+        target = alarm.target_datetime.replace(second=0, microsecond=0)
+        entry = (target, next(self._next_fire_sequence))
+        self._next_fire_entries[id(alarm)] = entry
+        heapq.heappush(self._next_fire, entry + (alarm,))
+
+        if len(self._next_fire) > 2 * len(self._next_fire_entries) + 16:
+            # mostly stale entries, rebuild from the current ones
+            alarms = {id(alarm): alarm for alarm in self.alarms}
+            self._next_fire = [
+                entry + (alarms[alarm_id],) for alarm_id, entry in self._next_fire_entries.items()
+            ]
+            heapq.heapify(self._next_fire)
+
+
+class CompositeState(object):
+    """
+    Snapshot of a whole composite evaluated at one point in time (see AlarmComposite.evaluate)
+    """
+
+    def __init__(self, now, brightness, nearest, window, alarm_states):
+        self.now = now
+        self.brightness = brightness  # greatest brightness of any alarm
+        self.window = window  # soonest (start, end) any alarm wants the LED on for, or None
+        self.alarm_states = alarm_states  # AlarmState for each alarm, in the composite's order
+
+        # AlarmState of the alarm that fires soonest, None if the composite is empty
+        self.nearest = nearest
+
+    @property
+    def nearest_alarm(self):
+        return None if self.nearest is None else self.nearest.alarm
+
+    @property
+    def target_datetime(self):
+        return None if self.nearest is None else self.nearest.target_datetime
+
+    @property
+    def next_day(self):
+        return None if self.nearest is None else self.nearest.next_day
 
 
 class _TestTargetDaysReturnsOrOfAllDays(unittest.TestCase):
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+import asyncio
+import http
+import http.client
+import logging
+import os.path
+from urllib.parse import urlparse, parse_qs
+
+import config
+import scheduler
+from server import AlarmRoutes, FileBody, Response, parse_content_length, prepare_response
+
+logger = logging.getLogger(os.path.basename(os.path.realpath(__name__)))
+
+
+class AsyncAlarmServer(AlarmRoutes):
+    """
+    HTTP/1.1 server for the alarm clock running on an asyncio event loop.
+
+    Requests are answered through the same HandlerObserver calls as AlarmServer, one at a time on
+    the loop, so with scheduler.use_event_loop the brightness updates, DB flushes and requests all
+    share one thread. Connections are kept alive between requests; at most max_connections are
+    served at once (others wait to be accepted) and idle ones are closed after keep_alive_timeout.
+    A connection that turns into a stream (/api/events) gives up its place, so open streams never
+    keep requests waiting.
+    """
+
+    MAX_HEADER_LINES = 100
+
+    def __init__(
+        self,
+        port=1024,
+        api=None,
+        loop=None,
+        max_connections=None,
+        keep_alive_timeout=None,
+        live=None,
+        pages=None,
+        static=None,
+    ):
+        AlarmRoutes.__init__(self, api, live, pages, static)
+        self.port = port
+        self._loop = loop or asyncio.get_event_loop()
+        self.max_connections = (
+            config.server_max_connections if max_connections is None else max_connections
+        )
+        self.keep_alive_timeout = (
+            config.server_keep_alive_timeout if keep_alive_timeout is None else keep_alive_timeout
+        )
+        self._slots = None  # made by start(), on the loop
+        self._server = None
+        self._connections = set()  # tasks serving (or waiting to serve) a connection
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.max_connections)
+        self._server = await asyncio.start_server(self._serve_connection, "0.0.0.0", self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Serving on port {0}".format(self.port))
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        self._server = None
+
+    async def _serve_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            async with _Slot(self._slots) as slot:
+                keep_alive = True
+                while keep_alive:
+                    keep_alive = await self._serve_request(reader, writer, slot)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass  # idle too long, or the client went away
+        except asyncio.CancelledError:
+            pass  # stopping
+        except Exception:
+            logger.exception("Error serving request")
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _serve_request(self, reader, writer, slot):
+        """
+        Read one request and answer it
+        :param slot: _Slot the connection holds, released if the response is a stream
+        :return: True to keep the connection open for another
+        """
+        request_line = await asyncio.wait_for(reader.readline(), self.keep_alive_timeout)
+        if len(request_line) == 0:
+            return False  # closed between requests
+        try:
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            await self._send(writer, Response.error(400, "Bad request line"), False)
+            return False
+
+        # the whole header block has to arrive in time, not just each line
+        headers = await asyncio.wait_for(self._read_headers(reader), self.keep_alive_timeout)
+        if headers is None:
+            await self._send(writer, Response.error(431, "Too many headers"), False)
+            return False
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+
+        length = parse_content_length(headers.get("content-length"))
+        if length is None:
+            await self._send(writer, Response.error(400, "Bad Content-Length"), False)
+            return False
+        if length > config.server_max_body:
+            await self._send(writer, Response.error(413, "Body too large"), False)
+            return False
+        body = b""
+        if length > 0:
+            body = await asyncio.wait_for(reader.readexactly(length), self.keep_alive_timeout)
+
+        response = self._dispatch(method, target, body, headers)
+        code, response_headers, response_body = prepare_response(
+            response, headers.get("if-none-match"), headers.get("if-modified-since")
+        )
+        if response.streaming:
+            # no length, the end of the stream is the end of the body
+            await self._write(writer, version, code, response_headers, b"", False)
+            slot.release()
+            await self._stream(writer, response_body, method != "HEAD")
+            return False
+        if isinstance(response_body, FileBody):
+            await self._write(writer, version, code, response_headers, b"", keep_alive)
+            if method != "HEAD":
+                return await self._send_file(writer, response_body) and keep_alive
+            return keep_alive
+        await self._write(
+            writer,
+            version,
+            code,
+            response_headers,
+            b"" if method == "HEAD" else response_body,
+            keep_alive,
+        )
+        return keep_alive
+
+    @staticmethod
+    async def _read_headers(reader):
+        """
+        :return: http.client.HTTPMessage, None if there are more than MAX_HEADER_LINES
+        """
+        headers = http.client.HTTPMessage()  # case insensitive, as BaseHTTPRequestHandler's
+        for _ in range(AsyncAlarmServer.MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip()] = value.strip()
+        return None
+
+    async def _stream(self, writer, chunks, send_body=True):
+        try:
+            if send_body:
+                async for chunk in chunks:
+                    writer.write(chunk)
+                    await writer.drain()
+        finally:
+            chunks.close()
+
+    async def _send_file(self, writer, body):
+        """
+        :return: False if the whole file couldn't be sent, so the connection must be closed
+        """
+        with open(body.path, "rb") as file:
+            # zero copy with os.sendfile where the loop supports it
+            sent = await self._loop.sendfile(writer.transport, file, 0, body.size)
+        return sent == body.size
+
+    def _dispatch(self, method, target, body, headers=None):
+        url = urlparse(target)
+        path, query = url.path, parse_qs(url.query)
+        if method in ("GET", "HEAD"):
+            return self.handled_Get(path, query, headers)
+        if method == "POST":
+            return self.handled_Post(path, query, body)
+        if method in ("PUT", "PATCH"):
+            return self.handled_Put(path, query, body)
+        if method == "DELETE":
+            return self.handled_Delete(path, query)
+        return Response.error(501, "Method not supported")
+
+    async def _send(self, writer, response, keep_alive):
+        code, headers, body = prepare_response(response)
+        await self._write(writer, "HTTP/1.1", code, headers, body, keep_alive)
+
+    async def _write(self, writer, version, code, headers, body, keep_alive):
+        lines = ["{0} {1} {2}".format(version, code, http.HTTPStatus(code).phrase)]
+        lines.extend("{0}: {1}".format(name, value) for name, value in headers)
+        lines.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+class _Slot(object):
+    """
+    One of the server's max_connections places, held by a connection until it is released (once)
+    """
+
+    def __init__(self, semaphore):
+        self._semaphore = semaphore
+        self._held = False
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        self._held = True
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._semaphore.release()
+
+
+def run(port=1024):
+    import alarmApi
+    import pages
+    import staticFiles
+    from viewModel import ViewModel
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # everything scheduled (LED updates, DB flushes and reloads) runs on the server's loop
+    scheduler.use_event_loop(loop)
+    view_model = ViewModel()
+    server = AsyncAlarmServer(
+        port,
+        api=alarmApi.AlarmAPI(view_model.db),
+        loop=loop,
+        live=view_model.live,
+        pages=pages.Pages(view_model.db),
+        static=staticFiles.StaticFiles(),
+    )
+    loop.run_until_complete(server.start())
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        print("Received shutdown command..")
+    finally:
+        loop.run_until_complete(server.stop())
+        view_model.db.flush()
+
+
+if __name__ == "__main__":
+    from sys import argv
+
+    if len(argv) == 2:
+        run(port=int(argv[1]))
+    else:
+        run()
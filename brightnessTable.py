@@ -0,0 +1,163 @@
+import array
+from datetime import timedelta
+
+import config
+import utilities
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+class BrightnessTable(object):
+    """
+    Greatest brightness of a set of alarms for every minute of the week.
+
+    Each alarm's contribution is kept so a change to one alarm only recomputes the minutes it
+    covered before and after the change. Values match Alarm.get_desired_brightness at the start of
+    each minute; lookups interpolate to the second while brightness is rising, so a fade is a
+    smooth ramp rather than a step per minute.
+
+    An alarm is lit up to and including the start of the last minute of its after wakeup on time
+    and off straight after, so each minute also has the brightness held after its first instant.
+    """
+
+    def __init__(self):
+        self.settings = BrightnessTable.current_settings()
+        self._values = array.array("d", [0.0]) * MINUTES_PER_WEEK  # at the start of each minute
+        self._held = array.array("d", [0.0]) * MINUTES_PER_WEEK  # after the start of each minute
+        # minute of week -> {id(alarm): (brightness at the start, brightness after the start)}
+        self._contributions = {}
+        self._alarm_minutes = {}  # id(alarm) -> minutes of the week that alarm lights
+
+    @staticmethod
+    def current_settings():
+        return config.wakeup_time, config.after_wakeup_on_time
+
+    def update(self, alarm):
+        """
+        Add, or recompute, an alarm's contribution to the table
+        :param alarm: Alarm
+        :return: None
+        """
+        touched = self._remove(alarm)
+        contribution = self._contribution(alarm)
+        for minute, value in contribution.items():
+            self._contributions.setdefault(minute, {})[id(alarm)] = value
+        if len(contribution) > 0:
+            self._alarm_minutes[id(alarm)] = list(contribution)
+        self._recompute(touched.union(contribution))
+
+    def remove(self, alarm):
+        self._recompute(self._remove(alarm))
+
+    def lookup(self, now):
+        """
+        Get the brightness at now
+        :param now: datetime
+        :return: brightness [0,100]
+        """
+        minute = minute_of_week(now)
+        seconds = now.second + now.microsecond / 1000000
+        if seconds == 0:
+            return self._values[minute]
+        value = self._held[minute]
+        next_value = self._values[(minute + 1) % MINUTES_PER_WEEK]
+        if next_value > value:
+            value += (next_value - value) * seconds / 60
+        return value
+
+    def slope(self, now):
+        """
+        Get how fast brightness is changing at now
+        :param now: datetime
+        :return: percent per second, 0 unless brightness is rising
+        """
+        minute = minute_of_week(now)
+        value = self._held[minute]
+        next_value = self._values[(minute + 1) % MINUTES_PER_WEEK]
+        if next_value > value:
+            return (next_value - value) / 60
+        return 0
+
+    def next_change(self, now):
+        """
+        Get when brightness next starts to change
+        :param now: datetime
+        :return: datetime (now if it is changing), None if it never changes
+        """
+        minute = minute_of_week(now)
+        values = self._values
+        held = self._held
+        value = held[minute]
+        if values[(minute + 1) % MINUTES_PER_WEEK] > value:
+            return now
+        if now.second == 0 and now.microsecond == 0 and values[minute] != value:
+            return now  # last instant lit, off straight after
+
+        for ahead in range(1, MINUTES_PER_WEEK):
+            this_minute = (minute + ahead) % MINUTES_PER_WEEK
+            this_value = held[this_minute]
+            if (
+                values[this_minute] != value
+                or this_value != value
+                or values[(this_minute + 1) % MINUTES_PER_WEEK] > this_value
+            ):
+                return now.replace(second=0, microsecond=0) + timedelta(minutes=ahead)
+        return None
+
+    def _remove(self, alarm):
+        minutes = self._alarm_minutes.pop(id(alarm), [])
+        for minute in minutes:
+            contributions = self._contributions[minute]
+            del contributions[id(alarm)]
+            if len(contributions) == 0:
+                del self._contributions[minute]
+        return set(minutes)
+
+    def _recompute(self, minutes):
+        for minute in minutes:
+            contributions = self._contributions.get(minute)
+            if contributions is None:
+                self._values[minute] = self._held[minute] = 0.0
+            else:
+                self._values[minute] = max(start for start, _ in contributions.values())
+                self._held[minute] = max(held for _, held in contributions.values())
+
+    def _contribution(self, alarm):
+        """
+        Get the brightness an alarm wants for each minute of the week it is lit
+        :return: dict of minute of week -> (brightness at the start, brightness after the start)
+        """
+        result = {}
+        if not alarm.active:
+            return result
+
+        wakeup_time, after_wakeup_on_time = self.settings
+        desired_time = wakeup_time * 60  # convert to seconds
+        days = int(alarm.target_days)
+        for weekday in range(7):
+            if not days & utilities.WEEKDAY_BITS[weekday]:
+                continue
+            target = weekday * MINUTES_PER_DAY + alarm.target_hour * 60 + alarm.target_minute
+            for offset in range(1 - wakeup_time, after_wakeup_on_time + 1):
+                if offset < 0:
+                    # same fade in as Alarm.get_desired_brightness
+                    value = held = 100 - (100 * -offset * 60) / desired_time
+                elif offset < after_wakeup_on_time:
+                    value = held = 100
+                else:
+                    # the end of the after wakeup on time, off once it has passed
+                    value, held = 100, 0
+                minute = (target + offset) % MINUTES_PER_WEEK
+                start, current = result.get(minute, (0, 0))
+                result[minute] = (max(start, value), max(current, held))
+        return result
+
+
+def minute_of_week(now):
+    """
+    :param now: datetime
+    :return: minutes since the start of the week (Sunday midnight)
+    """
+    weekday = utilities.convert_datetime_weekday_to_zero_sunday(now.weekday())
+    return weekday * MINUTES_PER_DAY + now.hour * 60 + now.minute
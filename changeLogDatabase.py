@@ -0,0 +1,308 @@
+import contextlib
+import json
+import logging
+import os
+import os.path
+import threading
+
+from tinydb.database import Document
+
+import config
+import scheduler
+import storage
+import utilities
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows, one process at a time
+
+logger = logging.getLogger(os.path.basename(os.path.realpath(__name__)))
+
+
+class ChangeLogDatabase(object):
+    """
+    Database kept as a snapshot file plus an append only log of the changes made since it.
+
+    Every insert, update and remove is one short line appended to path + ".log"; nothing is ever
+    rewritten in place. Every compact_interval seconds (on the shared scheduler) the current
+    contents are written out as a new snapshot and the log is emptied. Opening loads the snapshot
+    then replays the log on top of it.
+
+    Several processes (such as the clock and cli.py) may share the files. Each change is made
+    holding an flock on the log, after first reading any records other processes appended since,
+    so sequence numbers and doc_ids are never handed out twice. A snapshot written by another
+    process (noticed by the file being replaced) means starting again from that snapshot.
+
+    Tables are handed out by table(name) and look like TinyDB tables, as SQLiteDatabase.
+    """
+
+    def __init__(self, path, compact_interval=None, fsync=None):
+        self._snapshot = storage.AtomicJSONStorage(path)
+        self._log_path = path + ".log"
+        self._fsync = config.db_log_fsync if fsync is None else fsync
+        self._lock = threading.RLock()
+        self._tables = {}  # name -> ChangeLogTable
+        self._sequence = 0  # number of the last change made
+        self._log_length = 0  # changes in the log since the snapshot
+        self._log_offset = 0  # bytes of the log read so far
+        self._snapshot_stamp = None  # _stamp() of the snapshot last read
+
+        self._log = open(self._log_path, "a", encoding="utf-8")
+        with self._file_lock(fcntl and fcntl.LOCK_EX):
+            self._load()
+
+        if compact_interval is None:
+            compact_interval = config.db_compact_interval
+        self._compact_job = None
+        if compact_interval > 0:
+            self._compact_job = scheduler.get_scheduler().call_every(compact_interval, self.compact)
+
+    def table(self, name):
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = ChangeLogTable(self, name)
+            return self._tables[name]
+
+    @property
+    def log_length(self):
+        return self._log_length
+
+    def compact(self):
+        """
+        Write the current contents out as a snapshot and empty the log
+        :return: None
+        """
+        with self._file_lock(fcntl and fcntl.LOCK_EX):
+            self._catch_up(repair=True)  # include what other processes have added
+            if self._log_length == 0:
+                return
+            snapshot = {
+                "sequence": self._sequence,
+                "tables": {
+                    name: {str(doc_id): _encode(values) for doc_id, values in table._docs.items()}
+                    for name, table in self._tables.items()
+                },
+            }
+            self._snapshot.write(snapshot)
+            self._snapshot_stamp = self._stamp()
+            # the snapshot holds everything up to self._sequence, so should this truncate be lost
+            # the old records are skipped on replay
+            self._log.truncate(0)
+            self._log.flush()
+            self._log_length = 0
+            self._log_offset = 0
+            logger.debug("Compacted database to change {0}".format(self._sequence))
+
+    def reload(self):
+        """
+        Re-read the snapshot and log, picking up changes made by another process
+        :return: None
+        """
+        with self._file_lock(fcntl and fcntl.LOCK_SH):
+            self._catch_up()
+
+    def close(self):
+        if self._compact_job is not None:
+            self._compact_job.cancel()
+        self.compact()
+        with self._lock:
+            self._log.close()
+
+    @contextlib.contextmanager
+    def _changing(self):
+        """
+        Hold the locks for making a change, with any changes made by other processes read first
+        """
+        with self._file_lock(fcntl and fcntl.LOCK_EX):
+            self._catch_up(repair=True)
+            yield
+
+    @contextlib.contextmanager
+    def _file_lock(self, operation):
+        """
+        :param operation: fcntl.LOCK_EX or fcntl.LOCK_SH (None where there is no fcntl)
+        """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(self._log.fileno(), operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._log.fileno(), fcntl.LOCK_UN)
+
+    def _append(self, table, operation, doc_id, values=None):
+        # called within _changing
+        self._sequence += 1
+        record = {"seq": self._sequence, "table": table, "op": operation, "doc_id": doc_id}
+        if values is not None:
+            record["values"] = _encode(values)
+        line = json.dumps(record) + "\n"
+        self._log.write(line)
+        self._log.flush()
+        if self._fsync:
+            os.fsync(self._log.fileno())
+        self._log_length += 1
+        self._log_offset += len(line.encode("utf-8"))
+
+    def _catch_up(self, repair=False):
+        # called with the file lock held
+        if self._stamp() != self._snapshot_stamp:
+            self._load(repair)  # compacted by another process, start again from its snapshot
+        else:
+            self._read_log(repair)
+
+    def _stamp(self):
+        """
+        :return: identifies the snapshot file, which is replaced (a new inode) on every write
+        """
+        try:
+            status = os.stat(self._snapshot._path)
+        except FileNotFoundError:
+            return None
+        return status.st_ino, status.st_mtime_ns, status.st_size
+
+    def _load(self, repair=True):
+        for table in self._tables.values():
+            table._docs.clear()
+            table._last_doc_id = 0
+        self._log_length = 0
+        self._log_offset = 0
+        self._snapshot_stamp = self._stamp()
+        snapshot = self._snapshot.read() or {}
+        self._sequence = snapshot.get("sequence", 0)
+        for name, docs in snapshot.get("tables", {}).items():
+            table = self.table(name)
+            for doc_id, values in docs.items():
+                table._apply("insert", int(doc_id), _decode(values))
+        self._read_log(repair)
+
+    def _read_log(self, repair):
+        """
+        Replay the records after those already read
+        :param repair: drop an incomplete last record, only safe holding the exclusive lock
+        """
+        try:
+            with open(self._log_path, "rb") as log:
+                log.seek(self._log_offset)
+                contents = log.read()
+        except FileNotFoundError:
+            return
+        lines = contents.split(b"\n")
+        for line in lines[:-1]:
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                raise Exception("Corrupt change log at line {0}".format(self._log_length + 1))
+            self._log_length += 1
+            self._log_offset += len(line) + 1
+            if record["seq"] <= self._sequence:
+                continue  # already in the snapshot
+            self._sequence = record["seq"]
+            self.table(record["table"])._apply(
+                record["op"], record["doc_id"], _decode(record.get("values", {}))
+            )
+        if len(lines[-1]) > 0 and repair:
+            # cut short by a crash part way through the append, the change never happened
+            logger.warning("Dropping incomplete change at the end of the log")
+            self._drop_last_line(len(lines[-1]))
+
+    def _drop_last_line(self, length):
+        """
+        :param length: bytes in the last line
+        """
+        with open(self._log_path, "rb+") as log:
+            log.truncate(os.path.getsize(self._log_path) - length)
+
+
+class ChangeLogTable(object):
+    def __init__(self, database, name):
+        self._database = database
+        self.name = name
+        self._docs = {}  # doc_id -> dict of values
+        self._last_doc_id = 0
+
+    def insert(self, document):
+        """
+        Insert a document
+        :param document: dict of alarm fields
+        :return: doc_id of the new document
+        """
+        with self._database._changing():
+            doc_id = self._last_doc_id + 1
+            self._database._append(self.name, "insert", doc_id, document)
+            self._apply("insert", doc_id, document)
+            return doc_id
+
+    def update(self, fields, doc_ids):
+        """
+        Update the given fields (only) of the given documents
+        :param fields: dict of alarm fields to change
+        :param doc_ids: iterable of doc_id
+        :return: None
+        """
+        with self._database._changing():
+            for doc_id in doc_ids:
+                if doc_id in self._docs:
+                    self._database._append(self.name, "update", doc_id, fields)
+                    self._apply("update", doc_id, fields)
+
+    def remove(self, doc_ids):
+        with self._database._changing():
+            for doc_id in doc_ids:
+                if doc_id in self._docs:
+                    self._database._append(self.name, "remove", doc_id)
+                    self._apply("remove", doc_id, None)
+
+    def all(self):
+        """
+        :return: list of Document (dict with a doc_id), as TinyDB's Table.all
+        """
+        with self._database._lock:
+            return [Document(dict(values), doc_id) for doc_id, values in self._docs.items()]
+
+    def get(self, doc_id):
+        """
+        :return: Document, None if there isn't one with doc_id
+        """
+        with self._database._lock:
+            values = self._docs.get(doc_id)
+            return None if values is None else Document(dict(values), doc_id)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _apply(self, operation, doc_id, values):
+        if operation == "insert":
+            self._docs[doc_id] = dict(values)
+            self._last_doc_id = max(self._last_doc_id, doc_id)
+        elif operation == "update":
+            self._docs.setdefault(doc_id, {}).update(values)
+        elif operation == "remove":
+            self._docs.pop(doc_id, None)
+        else:
+            raise Exception("Unknown change log operation: {0}".format(operation))
+
+
+# Days are written the way tinydb_serialization writes them to the JSON database
+_DAYS_TAG = "{Days}:"
+
+
+def _encode(values):
+    return {
+        key: _DAYS_TAG + utilities.DaysSerializer.encode(value)
+        if isinstance(value, utilities.Days)
+        else value
+        for key, value in values.items()
+    }
+
+
+def _decode(values):
+    return {
+        key: utilities.DaysSerializer.decode(value[len(_DAYS_TAG) :])
+        if isinstance(value, str) and value.startswith(_DAYS_TAG)
+        else value
+        for key, value in values.items()
+    }
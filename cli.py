@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import os
+from datetime import datetime
 
 import sys
 
@@ -39,7 +40,22 @@ def menu(menu_actions):
 
 def add_alarm():
     db = DB("alarms.json")
-    db.add_alarm(Alarm())
+    try:
+        db.add_alarm(Alarm())
+    finally:
+        db.close()
+
+
+def show_status():
+    clear_screen()
+    # as of the ViewModel's last update, its alarms are only touched on the scheduler thread
+    status = vm.live.snapshot()
+    print("Brightness: {0:.0f}%".format(status.get("brightness", 0)))
+    next_alarm = status.get("next_alarm")
+    if next_alarm is None:
+        print("No alarms set")
+    else:
+        print("Next alarm: {0:%A %H:%M}".format(datetime.fromisoformat(next_alarm["time"])))
 
 
 def change_alarm():
@@ -57,6 +73,7 @@ class QuitException(Exception):
 if __name__ == "__main__":
     menu_items = {
         "Add Alarm": add_alarm,
+        "Show Status": show_status,
         "Quit": quit,
     }
     try:
@@ -1,6 +1,38 @@
 LED_pin = 18  # physical pin 12 on RasPi-0W
+LED_PWM_range = 255  # pigpio PWM range (25-40000), higher gives finer steps at the dim end
+LED_gamma_steps = 1000  # gamma table entries between 0 and 100% (1000 is 0.1% resolution)
+LED_dither_below = 0  # brightness percentage to dither between PWM steps below, 0 to disable
+LED_ramp_segment_steps = 200  # brightness changes per pigpio script when fading on the daemon
+LED_resync_interval = 0  # seconds between re-reading the LED duty cycle from pigpiod, 0 to disable
 
 wakeup_time = 30  # number of minutes for LED to fade in over
 after_wakeup_on_time = (
     30  # number of minutes for LED to remain lit (unless turned off) after target time
 )
+
+sleep_between_alarms = True  # only update the LED around alarms, rather than every second all day
+hardware_fade = False  # hand fades to pigpiod as scripts rather than setting the LED every second
+fade_max_rate = 30  # most LED updates a second while fading (when each update is a visible step)
+fade_frame_budget = 0.01  # seconds a fade update may take before it is counted as missed
+max_idle_sleep = 10 * 60  # max number of seconds to sleep between alarms (re-checks the clock)
+update_retry_delay = 5  # seconds before the LED update is tried again after it fails
+
+db_backend = "tinydb"  # "tinydb" (JSON file), "sqlite" or "log" (snapshot plus change log)
+db_format = "json"  # file format for the "tinydb" backend, "json" or "binary" (fixed width records)
+db_write_behind = False  # hold alarm changes in memory and write them to disk in batches
+db_flush_delay = 5  # max seconds a change is held before it is written
+db_flush_count = 20  # max changes held before they are written
+db_watch = True  # reload alarms when another process (e.g. cli.py) changes the database file
+db_watch_delay = 0.5  # seconds to let a burst of changes settle before reloading
+db_log_fsync = True  # fsync the change log after each change ("log" backend)
+db_compact_interval = 60 * 60  # seconds between rewriting the snapshot from the change log
+
+server_max_connections = 8  # most connections the asyncio server (asyncServer.py) serves at once
+server_keep_alive_timeout = 15  # seconds an idle connection is kept open for another request
+server_max_body = 64 * 1024  # largest request body accepted, in bytes
+
+events_buffer_size = 16  # most live state events held for each /api/events client that falls behind
+events_keep_alive = 15  # seconds between keep-alive comments on a quiet /api/events stream
+
+template_cache_dir = ".cache"  # where compiled web UI templates are kept, relative to templates/
+static_recheck_interval = 2  # seconds a static file's size and modification time are trusted for
@@ -1,77 +1,520 @@
+import bisect
+import contextlib
 import functools
+import logging
+import os.path
 
 import copy
-from tinydb import TinyDB, Query
+import random
+import threading
+import weakref
+from tinydb import TinyDB
 from tinydb_serialization import SerializationMiddleware
 
 from alarm import Alarm
+import config
+import fileWatcher
+import scheduler
+import storage
 import utilities
+from configObserver import ConfigObserver
+from changeLogDatabase import ChangeLogDatabase
+from sqliteDatabase import SQLiteDatabase
+
+logger = logging.getLogger(os.path.basename(os.path.realpath(__name__)))
 
 
 class DB(object):
-    def __init__(self, db_path):
+    """
+    The alarms, stored with one of the BACKENDS, with observers told of every change.
+
+    A DB may be used from several threads (the scheduler's reloads, HTTP handlers). Changes,
+    reloads and queries take one lock. Observers are called once it is released, so an observer
+    with a lock of its own can't deadlock against a change on another thread.
+    """
+
+    BACKENDS = ("tinydb", "sqlite", "log")
+
+    def __init__(self, db_path, write_behind=None, backend=None):
         self.__db_path = db_path
+        self._backend = config.db_backend if backend is None else backend
+        if self._backend not in DB.BACKENDS:
+            raise Exception("Unknown database backend: {0}".format(self._backend))
+        # the other backends write each change as it is made, write behind only applies to TinyDB
+        self._write_behind = self._backend == "tinydb" and (
+            config.db_write_behind if write_behind is None else write_behind
+        )
+        self._observers = []
+        self._watcher = None
+        self._reload_job = None
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._events = []  # (event, argument) published while locked, sent once unlocked
+        self._written_stamp = None  # _files_stamp() after this DB's last write, while watching
         self._open()
 
+    def close(self):
+        """
+        Stop watching and close the database, writing any changes held by write behind
+        :return: None
+        """
+        self.stop_watching()
+        with self._changing():
+            self._close()
+
     def _close(self):
         self.db.close()
 
-    def _open(self):
-        serialization = SerializationMiddleware()
-        serialization.register_serializer(utilities.DaysSerializer, "Days")
-        self.db = TinyDB(self.__db_path, indent=4, storage=serialization)
+    def _open(self, tinydb_storage=None):
+        """
+        :param tinydb_storage: storage for TinyDB, defaults to a new one from _tinydb_storage
+        """
+        if self._backend == "sqlite":
+            self.db = SQLiteDatabase(self.__db_path)
+        elif self._backend == "log":
+            self.db = ChangeLogDatabase(self.__db_path)
+        else:
+            self.db = TinyDB(
+                self.__db_path, indent=4, storage=tinydb_storage or self._tinydb_storage()
+            )
         self.table = self.db.table("Alarms")
+        self._build_index()
+
+    def _build_index(self):
+        self._doc_ids = {}  # alarm id -> doc_id
+        self._index = AlarmIndex()
+        for document in self.table.all():
+            assert document["id"] not in self._doc_ids, "Error, conflicting IDs in database!"
+            self._doc_ids[document["id"]] = document.doc_id
+            self._index.add(document)
+            DBAlarm.ids.reserve(document["id"])
+
+    def _tinydb_storage(self):
+        if config.db_format == "binary":
+            # records hold days as a bitmask, no serialization needed
+            file_storage = storage.BinaryAlarmStorage
+        elif config.db_format == "json":
+            if self._write_behind:
+                file_storage = SerializationMiddleware(storage.AtomicJSONStorage)
+            else:
+                file_storage = SerializationMiddleware()
+            file_storage.register_serializer(utilities.DaysSerializer, "Days")
+        else:
+            raise Exception("Unknown database format: {0}".format(config.db_format))
+
+        if self._write_behind:
+            return storage.WriteBehindMiddleware(
+                file_storage, config.db_flush_delay, config.db_flush_count, self._note_write
+            )
+        return file_storage
 
     def add_alarm(self, alarm):
         if not isinstance(alarm, DBAlarm):
             store_alarm = DBAlarm(alarm)
         else:
             store_alarm = alarm
-        alarm = Query()
-        matches = self.table.search(alarm.id == store_alarm.id)
-        assert len(matches) < 2, "Error, conflicting IDs in database!"
-        if len(matches) == 1:
-            # already exist in db, call update
-            self._update_alarm(store_alarm)
+        with self._changing():
+            if store_alarm.id in self._doc_ids:
+                # already exist in db, call update
+                self._update_alarm(store_alarm)
+            else:
+                doc_id = self.table.insert(store_alarm.to_dict())  # store all values
+                self._doc_ids[store_alarm.id] = doc_id
+                self._index.add(store_alarm.to_dict())
+                DBAlarm.ids.reserve(store_alarm.id)
+                store_alarm.mark_clean()
+                self._publish("alarm_added", store_alarm)
+            self._note_write()
+        alarm.mark_clean()
+
+    def remove_alarm(self, alarm):
+        with self._changing():
+            doc_id = self._doc_ids.pop(alarm.id, None)
+            assert doc_id is not None, "Error, alarm is not in the database"
+            self.table.remove(doc_ids=[doc_id])
+            self._index.remove(alarm.id)
+            self._publish("alarm_deleted", alarm.id)
+            self._note_write()
+
+    def add_observer(self, observer):
+        """
+        Register for alarm_added/alarm_changed/alarm_deleted as alarms are stored, or found to have
+        been changed on disk (see watch)
+        :param observer: ConfigObserver
+        :return: None
+        """
+        if not isinstance(observer, ConfigObserver):
+            raise Exception("observer must be of type ConfigObserver")
+        self._observers.append(observer)
+
+    def remove_observer(self, observer):
+        self._observers.remove(observer)
+
+    def watch(self):
+        """
+        Reload (and notify observers of the differences) whenever another process changes the
+        database file. Uses inotify, so does nothing where that isn't available.
+        :return: None
+        """
+        if self._watcher is not None:
+            return
+        if not fileWatcher.available():
+            logger.warning("Can't watch {0} for changes on this platform".format(self.__db_path))
+            return
+        self._reload_job = scheduler.get_scheduler().create_job(self._reload_if_changed)
+        self._written_stamp = self._files_stamp()
+        self._watcher = fileWatcher.FileWatcher(self.__db_path, self._file_changed)
+
+    def stop_watching(self):
+        if self._watcher is None:
+            return
+        self._watcher.stop()
+        self._reload_job.cancel()
+        self._watcher = None
+
+    def reload(self):
+        """
+        Re-read the database, notifying observers of any alarms that were added, changed or
+        deleted by someone else
+        :return: None
+        """
+        with self._changing():
+            self._reload()
+
+    def _reload(self):
+        # called with the lock held
+        old_index = self._index
+        if self._backend == "log":
+            self.db.reload()
+            self._build_index()
+        elif self._write_behind:
+            # closing would flush the stale copy over the other process's changes, so the cache is
+            # re-read with the pending changes kept, and TinyDB reopened on it
+            write_behind = self.db.storage
+            write_behind.reload()
+            self._open(lambda *args, **kwargs: write_behind)
         else:
-            self.table.insert(store_alarm.__dict__)  # store all values
+            self._close()
+            self._open()
+        if self._watcher is not None:
+            self._written_stamp = self._files_stamp()
+
+        old_ids = old_index.ids()
+        new_ids = self._index.ids()
+        for alarm_id in old_ids - new_ids:
+            self._publish("alarm_deleted", alarm_id)
+        for alarm in self._get(self._index.in_time_order(new_ids - old_ids)):
+            self._publish("alarm_added", alarm)
+        changed = [
+            alarm_id
+            for alarm_id in old_ids & new_ids
+            if old_index.entry(alarm_id) != self._index.entry(alarm_id)
+        ]
+        for alarm in self._get(self._index.in_time_order(changed)):
+            self._publish("alarm_changed", alarm)
+
+    def _reload_if_changed(self):
+        with self._changing():
+            if self._files_stamp() == self._written_stamp:
+                return  # the files are as this DB last wrote them, it was our own change
+            self._reload()
+
+    def _file_changed(self):
+        # called on the watcher thread, reload on the scheduler once a burst of writes settles
+        self._reload_job.reschedule(config.db_watch_delay)
+
+    def _note_write(self):
+        # called just after this DB writes, so the watcher's event for it can be told apart
+        if self._watcher is not None:
+            self._written_stamp = self._files_stamp()
+
+    def _files_stamp(self):
+        """
+        :return: name, inode, modification time and size of each of the database's files (those
+            FileWatcher matches)
+        """
+        directory = os.path.dirname(os.path.abspath(self.__db_path))
+        prefix = os.path.basename(self.__db_path)
+        stamp = []
+        for name in sorted(os.listdir(directory)):
+            if not name.startswith(prefix) or name.endswith(".tmp"):
+                continue
+            try:
+                status = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue  # removed since listed
+            stamp.append((name, status.st_ino, status.st_mtime_ns, status.st_size))
+        return stamp
+
+    @contextlib.contextmanager
+    def _changing(self):
+        """
+        Hold the lock, sending the events published meanwhile to the observers after releasing it
+        """
+        events = []
+        with self._lock:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    events, self._events = self._events, []
+        for event, argument in events:
+            for observer in list(self._observers):
+                getattr(observer, event)(argument)
+
+    def _publish(self, event, argument):
+        # called with the lock held (within _changing)
+        self._events.append((event, argument))
+
+    def flush(self):
+        """
+        Write any changes held by the write behind cache to disk now
+        :return: None
+        """
+        if self._write_behind:
+            with self._lock:
+                self.db.storage.flush()
 
     def get_alarms(self):
-        result = []
-        alarms = self.table.all()
-        for alarm_dict in alarms:
-            stored_alarm = DBAlarm()
-            for key in alarm_dict:
-                setattr(stored_alarm, key, alarm_dict[key])
-            result.append(stored_alarm)
-        return result
+        with self._lock:
+            return DBAlarm.from_documents(self.table.all())
+
+    def get_alarm(self, alarm_id):
+        """
+        :param alarm_id: int
+        :return: DBAlarm, None if there isn't one with that id
+        """
+        with self._lock:
+            if alarm_id not in self._doc_ids:
+                return None
+            return self._get([alarm_id])[0]
+
+    def alarms_on(self, days):
+        """
+        Get the alarms set for any of the given days
+        :param days: Days
+        :return: list of DBAlarm, in time of day order
+        """
+        with self._lock:
+            return self._get(self._index.on(days))
+
+    def alarms_between(self, start, end):
+        """
+        Get the alarms with a target time in [start, end), wrapping past midnight if end < start
+        :param start: datetime.time
+        :param end: datetime.time
+        :return: list of DBAlarm, in time of day order from start
+        """
+        with self._lock:
+            return self._get(self._index.between(start, end))
+
+    def active_alarms(self):
+        """
+        :return: list of active DBAlarm, in time of day order
+        """
+        with self._lock:
+            return self._get(self._index.active())
+
+    def _get(self, alarm_ids):
+        doc_ids = [self._doc_ids[alarm_id] for alarm_id in alarm_ids]
+        if self._backend == "tinydb":
+            # TinyDB reads the whole table for every get, so read it once
+            documents = {document.doc_id: document for document in self.table.all()}
+            return DBAlarm.from_documents(documents[doc_id] for doc_id in doc_ids)
+        return DBAlarm.from_documents(self.table.get(doc_id=doc_id) for doc_id in doc_ids)
 
     def _update_alarm(self, store_alarm):
         if not isinstance(store_alarm, DBAlarm):
             raise Exception("Can only update DBAlarm")
-        alarm = Query()
-        matches = self.table.search(alarm.id == store_alarm.id)
-        assert len(matches) == 1, "Error, did not find exactly one match"
-        update_values = {key: value for key, value in store_alarm.__dict__.items()}
-        self.table.update(update_values, alarm.id == store_alarm.id)
+        doc_id = self._doc_ids.get(store_alarm.id)
+        assert doc_id is not None, "Error, did not find exactly one match"
+        changed = store_alarm.dirty_fields
+        if len(changed) == 0:
+            return  # nothing to store
+        update_values = {key: getattr(store_alarm, key) for key in changed}
+        self.table.update(update_values, doc_ids=[doc_id])
+        if not changed.isdisjoint(AlarmIndex.FIELDS):
+            self._index.add(store_alarm.to_dict())
+        store_alarm.mark_clean()
+        self._publish("alarm_changed", store_alarm)
+
+
+class AlarmIndex(object):
+    """
+    Which alarms are set for each day, at each time of day and active, by alarm id.
+
+    Days are a set of ids per weekday bit, times a list of (minute of day, id) kept sorted, so
+    queries only touch the alarms they return.
+    """
+
+    FIELDS = frozenset(("target_days", "target_hour", "target_minute", "active"))
+
+    def __init__(self):
+        self._days = {bit: set() for bit in utilities.WEEKDAY_BITS}  # day bit -> ids
+        self._times = []  # sorted (minute of day, id)
+        self._active = set()
+        self._entries = {}  # id -> (days, minute of day, active) it is indexed under
+
+    def add(self, values):
+        """
+        Index (or re-index) an alarm
+        :param values: dict of the alarm's stored fields
+        :return: None
+        """
+        alarm_id = values["id"]
+        self.remove(alarm_id)
+        days = AlarmIndex._days_mask(values["target_days"])
+        minute = values["target_hour"] * 60 + values["target_minute"]
+        for bit, ids in self._days.items():
+            if days & bit:
+                ids.add(alarm_id)
+        bisect.insort(self._times, (minute, alarm_id))
+        active = bool(values["active"])
+        if active:
+            self._active.add(alarm_id)
+        self._entries[alarm_id] = (days, minute, active)
+
+    def remove(self, alarm_id):
+        entry = self._entries.pop(alarm_id, None)
+        if entry is None:
+            return
+        days, minute, _ = entry
+        for bit, ids in self._days.items():
+            if days & bit:
+                ids.discard(alarm_id)
+        del self._times[bisect.bisect_left(self._times, (minute, alarm_id))]
+        self._active.discard(alarm_id)
+
+    def on(self, days):
+        """
+        :param days: Days
+        :return: list of ids, in time of day order
+        """
+        days = int(days)
+        ids = set()
+        for bit, day_ids in self._days.items():
+            if days & bit:
+                ids.update(day_ids)
+        return self.in_time_order(ids)
+
+    def between(self, start, end):
+        """
+        :param start: datetime.time
+        :param end: datetime.time
+        :return: list of ids with a time in [start, end), in time of day order from start
+        """
+        start = start.hour * 60 + start.minute
+        end = end.hour * 60 + end.minute
+        first = bisect.bisect_left(self._times, (start,))
+        if start <= end:
+            entries = self._times[first : bisect.bisect_left(self._times, (end,))]
+        else:
+            # wraps past midnight
+            entries = self._times[first:] + self._times[: bisect.bisect_left(self._times, (end,))]
+        return [alarm_id for _, alarm_id in entries]
+
+    def active(self):
+        return self.in_time_order(self._active)
+
+    def ids(self):
+        return set(self._entries)
+
+    def entry(self, alarm_id):
+        """
+        :return: (days, minute of day, active) the alarm is indexed under
+        """
+        return self._entries[alarm_id]
+
+    @staticmethod
+    def _days_mask(days):
+        if isinstance(days, (list, tuple)):
+            # a list of days rather than a Days flag
+            return functools.reduce(lambda mask, day: mask | int(day), days, 0)
+        return int(days)
+
+    def in_time_order(self, ids):
+        return sorted(ids, key=lambda alarm_id: (self._entries[alarm_id][1], alarm_id))
+
+
+class IdAllocator(object):
+    """
+    Hands out alarm ids: random 63 bit integers, checked against every id already in use.
+
+    Random rather than counting up, so processes sharing a database file (the CLI and the
+    service) can't hand out the same id. Ids are plain integers, so they persist unchanged in
+    every backend.
+    """
+
+    def __init__(self):
+        self._used = set()
+        self._random = random.SystemRandom()
+
+    def allocate(self):
+        """
+        :return: int id that hasn't been handed out or reserved
+        """
+        while True:
+            value = self._random.getrandbits(63)
+            if value != 0 and value not in self._used:
+                self._used.add(value)
+                return value
+
+    def reserve(self, value):
+        """
+        Mark an id (e.g. one loaded from the database) as in use
+        :param value: int
+        :return: None
+        """
+        self._used.add(value)
+
+    def __contains__(self, value):
+        return value in self._used
 
 
 @functools.total_ordering
 class DBAlarm(Alarm):
-    ids = []
+    _FIELDS = Alarm._FIELDS + ("id",)
+    __slots__ = ("id",)
+
+    ids = IdAllocator()
+    _alarm_ids = weakref.WeakKeyDictionary()  # plain Alarm -> id it is stored under
 
     def __init__(self, alarm=None, id=None):
 
         if alarm is not None:
-            Alarm.__init__(self, **alarm.__dict__)
+            Alarm.__init__(self, **alarm.to_dict())
         else:
             alarm = Alarm()
-            Alarm.__init__(self, **alarm.__dict__)
+            Alarm.__init__(self, **alarm.to_dict())
         # implicitly call base constructor
         if id:
             self.id = id
         else:
             self.id = DBAlarm.get_id(alarm)
+        # only what changed on the original still needs storing
+        self._dirty = set(alarm.dirty_fields)
+
+    @classmethod
+    def from_documents(cls, documents):
+        """
+        Build alarms straight from stored documents, without going through __init__
+        :param documents: iterable of dict (fields the alarm doesn't have are ignored)
+        :return: list of DBAlarm, clean
+        """
+        defaults = Alarm().to_dict()
+        fields = cls._FIELDS
+        set_field = object.__setattr__
+        result = []
+        for document in documents:
+            alarm = cls.__new__(cls)
+            set_field(alarm, "_observers", [])
+            set_field(alarm, "_dirty", set())
+            for key in fields:
+                set_field(alarm, key, document[key] if key in document else defaults[key])
+            result.append(alarm)
+        return result
 
     @staticmethod
     def copy(alarm):
@@ -79,15 +522,22 @@ class DBAlarm(Alarm):
 
     @classmethod
     def get_id(cls, alarm):
-        value = hash(id(alarm))
-        while value in cls.ids:
-            value = hash(value)  # keep hashing till we find one
-            cls.ids.append(value)
+        """
+        Get the id to store an alarm under, the same one every time for the same alarm
+        :param alarm: Alarm or DBAlarm
+        :return: int
+        """
+        if isinstance(alarm, DBAlarm):
+            return alarm.id
+        value = cls._alarm_ids.get(alarm)
+        if value is None:
+            value = cls.ids.allocate()
+            cls._alarm_ids[alarm] = value
         return value
 
     # for comparison between to objects, consider same if values - including id - are the same
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return self.to_dict() == other.to_dict()
 
     def __lt__(self, other):
-        return self.__dict__ < other.__dict__
+        return self.to_dict() < other.to_dict()
@@ -0,0 +1,64 @@
+import logging
+import os.path
+import time
+
+import config
+
+logger = logging.getLogger(os.path.basename(os.path.realpath(__name__)))
+
+
+class FadeEngine(object):
+    """
+    Sets the LED from an AlarmComposite at a rate that follows how fast brightness is changing.
+
+    Each frame sets the LED and works out how long until brightness will have moved by one
+    visible LED step: up to config.fade_max_rate frames a second through the steep part of a
+    fade, and no frames at all while brightness is flat. Frames that take longer than
+    config.fade_frame_budget, or start more than a frame late, are counted as missed.
+    """
+
+    def __init__(self, alarms, led):
+        self._alarms = alarms
+        self._led = led
+        self._frame_due = None  # time.monotonic() the next frame should start at
+        self.frames = 0
+        self.missed_frames = 0
+
+    def frame(self, now):
+        """
+        Set the LED for now
+        :param now: datetime
+        :return: seconds until the next frame, None if brightness won't change again
+        """
+        started = time.monotonic()
+        late = 0 if self._frame_due is None else started - self._frame_due
+
+        brightness = self._alarms.get_desired_brightness(now)
+        self._led.value = brightness
+        delay = self._next_frame_delay(now, brightness)
+
+        self.frames += 1
+        took = time.monotonic() - started
+        if took > config.fade_frame_budget or late > 1 / config.fade_max_rate:
+            self.missed_frames += 1
+            logger.debug("Missed fade frame, took {0:.3f}s, {1:.3f}s late".format(took, late))
+
+        self._frame_due = None if delay is None else time.monotonic() + delay
+        return delay
+
+    def reset(self):
+        # the next frame wasn't scheduled by this engine, don't count it as late
+        self._frame_due = None
+
+    def _next_frame_delay(self, now, brightness):
+        slope = self._alarms.brightness_slope(now)
+        if slope == 0:
+            change = self._alarms.next_brightness_change(now)
+            if change is None:
+                return None
+            return max((change - now).total_seconds(), 1 / config.fade_max_rate)
+
+        delay = self._led.visible_step(brightness) / slope
+        # the slope changes on the minute, so don't sleep past it
+        until_minute = 60 - now.second - now.microsecond / 1000000
+        return max(min(delay, until_minute), 1 / config.fade_max_rate)
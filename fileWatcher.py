@@ -0,0 +1,109 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import os.path
+import select
+import struct
+import threading
+
+logger = logging.getLogger(os.path.basename(os.path.realpath(__name__)))
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length (the name follows)
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    return _libc
+
+
+def available():
+    """
+    :return: True if inotify can be used (Linux)
+    """
+    try:
+        return hasattr(_get_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+class FileWatcher(object):
+    """
+    Calls back when a file (or any file next to it sharing its name as a prefix, such as a
+    journal or log) is changed, using inotify rather than polling.
+
+    The directory is watched rather than the file, so the callback still fires when the file is
+    replaced by a rename. The callback runs on the watcher's thread.
+    """
+
+    EVENTS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, path, callback):
+        if not available():
+            raise Exception("inotify is not available on this platform")
+        self._directory = os.path.dirname(os.path.abspath(path))
+        self._prefix = os.path.basename(path)
+        self._callback = callback
+
+        libc = _get_libc()
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        watch = libc.inotify_add_watch(self._fd, os.fsencode(self._directory), FileWatcher.EVENTS)
+        if watch < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed: " + self._directory)
+
+        self._stop_read, self._stop_write = os.pipe()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        os.write(self._stop_write, b"x")
+        if threading.current_thread() is not self._thread:
+            self._thread.join(1)
+
+    def _run(self):
+        try:
+            while True:
+                ready, _, _ = select.select([self._fd, self._stop_read], [], [])
+                if self._stop_read in ready:
+                    break
+                try:
+                    buffer = os.read(self._fd, 4096)
+                except BlockingIOError:
+                    continue
+                if self._matches(buffer):
+                    try:
+                        self._callback()
+                    except Exception:
+                        logger.exception("File watcher callback raised")
+        finally:
+            os.close(self._fd)
+            os.close(self._stop_read)
+            os.close(self._stop_write)
+
+    def _matches(self, buffer):
+        offset = 0
+        while offset < len(buffer):
+            _, _, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(buffer[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if name.startswith(self._prefix) and not name.endswith(".tmp"):
+                return True
+        return False
@@ -0,0 +1,204 @@
+import asyncio
+import collections
+import json
+import threading
+
+import config
+
+
+class LiveState(object):
+    """
+    Latest values of the clock's live state (brightness, next alarm), for streaming to clients.
+
+    There is one producer, the ViewModel's update, which publishes each value as it works it out.
+    A value is only passed on when it changes, to every Subscription, each with a buffer of its
+    own so a slow client never holds up the producer or the other clients.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = collections.OrderedDict()  # event name -> latest data
+        self._subscriptions = set()
+
+    def publish(self, event, data):
+        """
+        :param event: event name, such as "brightness"
+        :param data: JSON serializable value
+        :return: None
+        """
+        with self._lock:
+            if event in self._values and self._values[event] == data:
+                return
+            self._values[event] = data
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription._put(event, data)
+
+    def get(self, event, default=None):
+        with self._lock:
+            return self._values.get(event, default)
+
+    def snapshot(self):
+        """
+        :return: dict of event name -> latest data
+        """
+        with self._lock:
+            return dict(self._values)
+
+    def subscribe(self, buffer_size=None):
+        """
+        Start receiving changes, beginning with the current value of each event
+        :param buffer_size: most events held for the subscriber, defaults to config.events_buffer_size
+        :return: Subscription, close it when done
+        """
+        subscription = Subscription(
+            self, config.events_buffer_size if buffer_size is None else buffer_size
+        )
+        with self._lock:
+            for event, data in self._values.items():
+                subscription._put(event, data)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+
+class Subscription(object):
+    """
+    One client's view of a LiveState, iterating gives the Server-Sent Events to send it.
+
+    Each event is a whole value rather than a change, so when the buffer is full the oldest event
+    is dropped, or better an older value of the same event, and the client only misses states it
+    would have seen replaced anyway. A comment is sent after keep_alive seconds of quiet so a
+    closed connection is noticed. close() may be called from any thread.
+
+    On an event loop, iterate with "async for" (or await get_async) instead. Waiting then
+    holds no thread, as the producer wakes the loop with call_soon_threadsafe.
+    """
+
+    def __init__(self, state, buffer_size):
+        self._state = state
+        self._buffer_size = max(1, buffer_size)
+        self._events = collections.deque()  # (event, data)
+        self._condition = threading.Condition()
+        self._waiter = None  # (loop, asyncio.Event) of a get_async waiting for an event
+        self._closed = False
+        self.dropped = 0  # events dropped because the client fell behind
+        self.keep_alive = config.events_keep_alive
+
+    def _put(self, event, data):
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._events) >= self._buffer_size:
+                self.dropped += 1
+                for index, (queued, _) in enumerate(self._events):
+                    if queued == event:
+                        del self._events[index]
+                        break
+                else:
+                    self._events.popleft()
+            self._events.append((event, data))
+            self._condition.notify()
+            self._wake_waiter()
+
+    def get(self, timeout=None):
+        """
+        Wait for the next event
+        :param timeout: seconds to wait, None to wait until there is one
+        :return: (event, data), None on timeout or once closed
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._closed or len(self._events) > 0, timeout)
+            if self._closed or len(self._events) == 0:
+                return None
+            return self._events.popleft()
+
+    async def get_async(self, timeout=None):
+        """
+        Wait for the next event without blocking the running event loop
+        :param timeout: seconds to wait, None to wait until there is one
+        :return: (event, data), None on timeout or once closed
+        """
+        while True:
+            with self._condition:
+                if self._closed:
+                    return None
+                if len(self._events) > 0:
+                    return self._events.popleft()
+                ready = asyncio.Event()
+                self._waiter = (asyncio.get_event_loop(), ready)
+            try:
+                await asyncio.wait_for(ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                with self._condition:
+                    self._waiter = None
+
+    def _wake_waiter(self):
+        # called with the condition held, from whichever thread published
+        if self._waiter is None:
+            return
+        loop, ready = self._waiter
+        try:
+            loop.call_soon_threadsafe(ready.set)
+        except RuntimeError:
+            pass  # the loop has been closed
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._events.clear()
+            self._condition.notify_all()
+            self._wake_waiter()
+        self._state._unsubscribe(self)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.get(self.keep_alive)
+        if item is not None:
+            return format_event(*item)
+        if self._closed:
+            raise StopIteration
+        return b": keep-alive\n\n"
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.get_async(self.keep_alive)
+        if item is not None:
+            return format_event(*item)
+        if self._closed:
+            raise StopAsyncIteration
+        return b": keep-alive\n\n"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def format_event(event, data):
+    """
+    :param event: event name
+    :param data: JSON serializable value
+    :return: bytes of one Server-Sent Event
+    """
+    payload = json.dumps(data, separators=(",", ":"))
+    return "event: {0}\ndata: {1}\n\n".format(event, payload).encode("utf-8")
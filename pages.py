@@ -0,0 +1,99 @@
+import hashlib
+import os.path
+import threading
+
+from mako.lookup import TemplateLookup
+
+import config
+from configObserver import ConfigObserver
+from server import AlarmRoutes, Response
+import utilities
+
+TEMPLATE_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates")
+
+
+class Pages(ConfigObserver):
+    """
+    Web UI pages rendered from the Mako templates in templates/.
+
+    Templates are compiled to Python modules in config.template_cache_dir when Pages is created,
+    so a restart loads the modules rather than compiling again (Mako recompiles one only if its
+    template is newer). A rendered page is kept, with an ETag, until the DB reports a change.
+    """
+
+    def __init__(self, db, directory=TEMPLATE_DIRECTORY, module_directory=None):
+        """
+        :param db: DB the pages show the alarms of
+        :param directory: directory of the templates
+        :param module_directory: directory for the compiled templates, defaults to
+            config.template_cache_dir (relative to the templates)
+        """
+        ConfigObserver.__init__(self)
+        if module_directory is None:
+            module_directory = os.path.join(directory, config.template_cache_dir)
+        self._db = db
+        self._lookup = TemplateLookup(
+            directories=[directory],
+            module_directory=module_directory,
+            input_encoding="utf-8",
+            default_filters=["str", "h"],  # escape everything put in a page
+            filesystem_checks=False,  # each template is only looked up once, by compile
+        )
+        self._directory = directory
+        self._lock = threading.RLock()
+        self._templates = {}  # name -> compiled Template
+        self._pages = {}  # name -> (body, etag), dropped when the alarms change
+        self.compile()
+        db.add_observer(self)
+
+    def compile(self):
+        """
+        Compile (or load the compiled module of) every template
+        :return: None
+        """
+        for name in sorted(os.listdir(self._directory)):
+            if name.endswith(".html"):
+                self._templates[name] = self._lookup.get_template("/" + name)
+
+    def page(self, name):
+        """
+        Get a rendered page
+        :param name: template file name, such as "index.html"
+        :return: Response, None if there is no such template
+        """
+        with self._lock:
+            if name not in self._pages:
+                template = self._templates.get(name)
+                if template is None:
+                    return None
+                body = template.render(**self._context()).encode("utf-8")
+                etag = '"{0}"'.format(hashlib.sha1(body).hexdigest()[:20])
+                self._pages[name] = (body, etag)
+            body, etag = self._pages[name]
+        return Response(body=body, content_type="text/html; charset=utf-8", etag=etag)
+
+    def alarm_added(self, alarm):
+        self._invalidate()
+
+    def alarm_deleted(self, id):
+        self._invalidate()
+
+    def alarm_changed(self, alarm):
+        self._invalidate()
+
+    def _invalidate(self):
+        with self._lock:
+            self._pages.clear()
+
+    def _context(self):
+        alarms = sorted(
+            self._db.get_alarms(),
+            key=lambda alarm: (alarm.target_hour, alarm.target_minute, alarm.id),
+        )
+        return {
+            "alarms": alarms,
+            "weekday_bits": utilities.WEEKDAY_BITS,
+            "wakeup_time": config.wakeup_time,
+            "after_wakeup_on_time": config.after_wakeup_on_time,
+            "events_path": AlarmRoutes.EVENTS_PATH,
+        }
@@ -1,10 +1,16 @@
-from threading import Timer
+import scheduler as _scheduler
 
 
-# from: https://stackoverflow.com/a/13151104/8100990
 class RepeatedTimer(object):
-    def __init__(self, interval, function, *args, **kwargs):
-        self._timer = None
+    """
+    Calls function every interval seconds.
+
+    Runs as a periodic job on the shared scheduler thread rather than a new thread per tick.
+    """
+
+    def __init__(self, interval, function, *args, scheduler=None, **kwargs):
+        self._job = None
+        self._scheduler = scheduler if scheduler is not None else _scheduler.get_scheduler()
         self.function = function
         self.interval = interval
         self.args = args
@@ -12,17 +18,13 @@ class RepeatedTimer(object):
         self.is_running = False
         self.start()
 
-    def _run(self):
-        self.is_running = False
-        self.start()
-        self.function(*self.args, **self.kwargs)
-
     def start(self):
         if not self.is_running:
-            self._timer = Timer(self.interval, self._run)
-            self._timer.start()
+            self._job = self._scheduler.call_every(
+                self.interval, self.function, *self.args, **self.kwargs
+            )
             self.is_running = True
 
     def stop(self):
-        self._timer.cancel()
+        self._job.cancel()
         self.is_running = False
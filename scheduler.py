@@ -0,0 +1,217 @@
+import heapq
+import itertools
+import logging
+import os.path
+import threading
+import time
+
+logger = logging.getLogger(os.path.basename(os.path.realpath(__name__)))
+
+
+class Job(object):
+    def __init__(self, scheduler, interval, function, args, kwargs):
+        self._scheduler = scheduler
+        self.interval = interval  # None for one-shot jobs
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self._entry = None  # the (deadline, sequence) currently on the heap, None if not scheduled
+        self._handle = None  # asyncio handle, when run by an EventLoopScheduler
+
+    @property
+    def scheduled(self):
+        return self._entry is not None
+
+    def cancel(self):
+        self._scheduler._cancel(self)
+
+    def reschedule(self, delay):
+        """
+        Move (or re-arm) this job to run delay seconds from now
+        :param delay: seconds from now
+        :return: None
+        """
+        self._scheduler._schedule(self, time.monotonic() + delay)
+
+
+class _BaseScheduler(object):
+    def create_job(self, function, *args, **kwargs):
+        """
+        Create a one-shot job that doesn't run until it is given a time with reschedule
+        :return: Job
+        """
+        return Job(self, None, function, args, kwargs)
+
+    def call_later(self, delay, function, *args, **kwargs):
+        job = self.create_job(function, *args, **kwargs)
+        job.reschedule(delay)
+        return job
+
+    def call_every(self, interval, function, *args, **kwargs):
+        if interval <= 0:
+            raise Exception("Interval must be greater than 0")
+        job = Job(self, interval, function, args, kwargs)
+        job.reschedule(interval)
+        return job
+
+    @staticmethod
+    def _next_deadline(deadline, interval):
+        next_deadline = deadline + interval
+        now = time.monotonic()
+        if next_deadline <= now:
+            # fell behind, skip the missed runs
+            missed = (now - next_deadline) // interval + 1
+            next_deadline += missed * interval
+        return next_deadline
+
+
+class Scheduler(_BaseScheduler):
+    """
+    Runs any number of one-shot and periodic jobs on a single long lived thread.
+
+    Deadlines are kept on time.monotonic(); periodic jobs are re-armed from their previous deadline
+    rather than from when they finished, so they don't drift. If a job falls behind by more than
+    one interval the missed runs are skipped rather than run back to back.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(1)
+
+    def _schedule(self, job, deadline):
+        with self._condition:
+            job._entry = (deadline, next(self._sequence))
+            heapq.heappush(self._heap, job._entry + (job,))
+            self._condition.notify()
+
+    def _cancel(self, job):
+        with self._condition:
+            # the heap entry is left behind and skipped when it comes up
+            job._entry = None
+
+    def _run(self):
+        with self._condition:
+            while self._running:
+                if len(self._heap) == 0:
+                    self._condition.wait()
+                    continue
+
+                deadline, sequence, job = self._heap[0]
+                if job._entry != (deadline, sequence):
+                    # job was cancelled or rescheduled since this entry was pushed
+                    heapq.heappop(self._heap)
+                    continue
+
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                heapq.heappop(self._heap)
+                job._entry = None
+                if job.interval is not None:
+                    self._schedule(job, self._next_deadline(deadline, job.interval))
+
+                self._condition.release()
+                try:
+                    job.function(*job.args, **job.kwargs)
+                except Exception:
+                    logger.exception("Scheduled job raised")
+                finally:
+                    self._condition.acquire()
+
+
+class EventLoopScheduler(_BaseScheduler):
+    """
+    Runs jobs as callbacks on an asyncio event loop instead of a thread of their own, so jobs and
+    whatever else is on the loop (such as the asyncio server) never run at the same time.
+
+    Jobs may be (re)scheduled or cancelled from any thread. They run on the loop's thread, with the
+    same timing rules as Scheduler.
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._sequence = itertools.count()
+
+    def stop(self):
+        pass  # the loop belongs to whoever created it
+
+    def _schedule(self, job, deadline):
+        entry = (deadline, next(self._sequence))
+        job._entry = entry
+        # the loop isn't thread safe, so timers are only ever touched from its own thread
+        self._loop.call_soon_threadsafe(self._arm, job, entry)
+
+    def _cancel(self, job):
+        job._entry = None
+        self._loop.call_soon_threadsafe(self._disarm, job)
+
+    def _disarm(self, job):
+        if job._entry is None and job._handle is not None:
+            job._handle.cancel()
+            job._handle = None
+
+    def _arm(self, job, entry):
+        if job._entry != entry:
+            return  # rescheduled or cancelled again since
+        if job._handle is not None:
+            job._handle.cancel()
+        deadline = entry[0]
+        when = self._loop.time() + (deadline - time.monotonic())
+        job._handle = self._loop.call_at(when, self._run, job, entry)
+
+    def _run(self, job, entry):
+        if job._entry != entry:
+            return
+        job._entry = None
+        job._handle = None
+        if job.interval is not None:
+            self._schedule(job, self._next_deadline(entry[0], job.interval))
+        try:
+            job.function(*job.args, **job.kwargs)
+        except Exception:
+            logger.exception("Scheduled job raised")
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def use_event_loop(loop):
+    """
+    Make the shared scheduler run its jobs on an asyncio event loop rather than its own thread.
+    Must be called before anything uses get_scheduler.
+    :param loop: asyncio event loop
+    :return: EventLoopScheduler
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is not None and not isinstance(_shared, EventLoopScheduler):
+            raise Exception("The shared scheduler is already running on its own thread")
+        _shared = EventLoopScheduler(loop)
+        return _shared
+
+
+def get_scheduler():
+    """
+    Get the scheduler shared by the whole process (started on first use)
+    :return: Scheduler, or EventLoopScheduler after use_event_loop
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Scheduler()
+        return _shared
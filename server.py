@@ -14,8 +14,10 @@ Send a POST request::
 """
 from http.server import ThreadingHTTPServer
 from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, unquote
 
+from email.utils import formatdate, parsedate_to_datetime
+import os
 import os.path
 import json
 import threading
@@ -35,15 +37,136 @@ class actionModes:
     # setTime = 'setTime' # for use with changing the sytem time
 
 
+class Response(object):
+    def __init__(
+        self,
+        code=200,
+        body=b"",
+        content_type="application/json",
+        etag=None,
+        headers=None,
+        last_modified=None,
+    ):
+        self.code = code
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.headers = headers or {}
+        self.last_modified = last_modified  # seconds since the epoch, None if unknown
+
+    @staticmethod
+    def json(value, code=200, etag=None, headers=None):
+        return Response(code, dumps_json(value), etag=etag, headers=headers)
+
+    @staticmethod
+    def error(code, message):
+        return Response.json({"error": message}, code)
+
+    @property
+    def streaming(self):
+        # body is an iterable of chunks (with a close method) sent until it ends, not bytes
+        return not isinstance(self.body, (bytes, FileBody))
+
+
+class FileBody(object):
+    """
+    Body that is the contents of a file, the servers send it straight from the file with sendfile
+    """
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+
+def dumps_json(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def parse_content_length(value):
+    """
+    :param value: the request's Content-Length header, None if it has none
+    :return: int length of the body, None if the header isn't a valid length
+    """
+    if value is None:
+        return 0
+    value = value.strip()
+    if not value.isdigit():
+        return None  # not a number, or negative
+    return int(value)
+
+
+def prepare_response(response, if_none_match=None, if_modified_since=None):
+    """
+    Work out what to send for a response, turning it into a 304 if the client's copy is current
+    :param response: Response
+    :param if_none_match: the request's If-None-Match header, if any
+    :param if_modified_since: the request's If-Modified-Since header, if any (only used without
+        If-None-Match)
+    :return: (status code, list of (header, value), body)
+    """
+    if response.code == 200 and _not_modified(response, if_none_match, if_modified_since):
+        headers = []
+        if response.etag is not None:
+            headers.append(("ETag", response.etag))
+        headers.extend(response.headers.items())
+        return 304, headers, b""
+
+    headers = []
+    body = response.body
+    if response.code in (204, 304):
+        body = b""
+    elif response.streaming:
+        headers.append(("Content-Type", response.content_type))
+        headers.append(("Cache-Control", "no-cache"))
+    else:
+        headers.append(("Content-Type", response.content_type))
+        headers.append(("Content-Length", str(len(body))))
+    if response.etag is not None:
+        headers.append(("ETag", response.etag))
+        headers.append(("Cache-Control", "no-cache"))  # always check the ETag
+    if response.last_modified is not None:
+        headers.append(("Last-Modified", formatdate(response.last_modified, usegmt=True)))
+    headers.extend(response.headers.items())
+    return response.code, headers, body
+
+
+def _not_modified(response, if_none_match, if_modified_since):
+    if if_none_match is not None:
+        if response.etag is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or response.etag in tags
+    if if_modified_since is not None and response.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False  # not a date, ignored
+        return int(response.last_modified) <= since
+    return False
+
+
 class HandlerObserver(object):
+    """
+    Answers the requests Handler receives, each handled_ method returns a Response
+    """
+
     def __init__(self):
         object.__init__(self)
 
-    def handled_Get(self, path):
-        raise NotImplemented("handled_Get not implemented")
+    def handled_Get(self, path, query, headers=None):
+        raise NotImplementedError("handled_Get not implemented")
 
-    def handled_Post(self, path):
-        raise NotImplemented("handled_Get not implemented")
+    def handled_Post(self, path, query, body):
+        raise NotImplementedError("handled_Post not implemented")
+
+    def handled_Put(self, path, query, body):
+        raise NotImplementedError("handled_Put not implemented")
+
+    def handled_Delete(self, path, query):
+        raise NotImplementedError("handled_Delete not implemented")
 
 
 class Handler(BaseHTTPRequestHandler):
@@ -64,28 +187,176 @@ class Handler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def do_GET(self):
-        self._set_headers()
-        self._write("<html><body><h1>hi!</h1></body></html>")
         logger.debug("Received: " + self.path)
-        query_components = parse_qs(urlparse(self.path).query)
-        logger.debug(json.dumps(query_components))
+        self._respond(self._observer.handled_Get(*self._parse_path(), self.headers))
 
     def do_HEAD(self):
-        self._set_headers()
+        self._respond(
+            self._observer.handled_Get(*self._parse_path(), self.headers), send_body=False
+        )
 
     def do_POST(self):
-        # Doesn't do anything with posted data
-        self._set_headers(400, "Post not supported")
+        body = self._read_body()
+        if body is None:
+            self._respond(Response.error(400, "Bad Content-Length"))
+            return
+        self._respond(self._observer.handled_Post(*self._parse_path(), body))
+
+    def do_PUT(self):
+        body = self._read_body()
+        if body is None:
+            self._respond(Response.error(400, "Bad Content-Length"))
+            return
+        self._respond(self._observer.handled_Put(*self._parse_path(), body))
+
+    do_PATCH = do_PUT
+
+    def do_DELETE(self):
+        self._respond(self._observer.handled_Delete(*self._parse_path()))
+
+    def _parse_path(self):
+        """
+        :return: (path, dict of query parameter -> list of values)
+        """
+        url = urlparse(self.path)
+        return url.path, parse_qs(url.query)
+
+    def _read_body(self):
+        """
+        :return: bytes, None if the Content-Length is invalid (the connection is then closed)
+        """
+        length = parse_content_length(self.headers.get("Content-Length"))
+        if length is None:
+            self.close_connection = True  # where the body ends isn't known
+            return None
+        return self.rfile.read(length) if length > 0 else b""
+
+    def _respond(self, response, send_body=True):
+        code, headers, body = prepare_response(
+            response, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since")
+        )
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if response.streaming:
+            self._stream(response.body, send_body)
+        elif isinstance(body, FileBody):
+            if send_body:
+                self._send_file(body)
+        elif send_body:
+            self.wfile.write(body)
+
+    def _send_file(self, body):
+        self.wfile.flush()
+        with open(body.path, "rb") as file:
+            offset = 0
+            while offset < body.size:
+                sent = os.sendfile(
+                    self.connection.fileno(), file.fileno(), offset, body.size - offset
+                )
+                if sent == 0:
+                    break  # file got shorter since it was checked
+                offset += sent
+        if offset < body.size:
+            self.close_connection = True  # can't make up the length promised
+
+    def _stream(self, chunks, send_body=True):
+        self.close_connection = True  # no length, the end of the stream is the end of the body
+        try:
+            for chunk in chunks if send_body else []:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
 
     def _write(self, message):
         self.wfile.write(bytes(message, "UTF-8"))
 
-
-class AlarmServer(HandlerObserver):
-    def __init__(self, server_class=ThreadingHTTPServer, handler_class=Handler, port=1024):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class AlarmRoutes(HandlerObserver):
+    """
+    Answers requests for the alarm clock, whichever server they came in on
+    """
+
+    EVENTS_PATH = "/api/events"
+    STATUS_PATH = "/api/status"
+    STATIC_PATH = "/static/"
+
+    def __init__(self, api=None, live=None, pages=None, static=None):
+        """
+        :param api: AlarmAPI answering /api requests, None to serve only the placeholder page
+        :param live: LiveState served at /api/status and streamed to clients of /api/events, None
+            if there isn't one
+        :param pages: Pages rendering the web UI, None to serve a placeholder page
+        :param static: StaticFiles served under /static/, None to serve no files
+        """
+        HandlerObserver.__init__(self)
+        self.api = api
+        self.live = live
+        self.pages = pages
+        self.static = static
+
+    def handled_Get(self, path, query, headers=None):
+        if path.startswith(AlarmRoutes.STATIC_PATH) and self.static is not None:
+            response = self.static.response(
+                unquote(path[len(AlarmRoutes.STATIC_PATH) :]),
+                None if headers is None else headers.get("Accept-Encoding"),
+            )
+            return response or Response.error(404, "Not found")
+        if path == AlarmRoutes.STATUS_PATH and self.live is not None:
+            # as of the ViewModel's last update (AlarmComposite.evaluate), not worked out again
+            return Response.json(self.live.snapshot())
+        if path == AlarmRoutes.EVENTS_PATH and self.live is not None:
+            # Server-Sent Events, every change to the live state until the client disconnects
+            return Response(body=self.live.subscribe(), content_type="text/event-stream")
+        response = self._api_response("GET", path, query)
+        if response is not None:
+            return response
+        if path == "/":
+            if self.pages is not None:
+                return self.pages.page("index.html")
+            return Response(
+                body=b"<html><body><h1>hi!</h1></body></html>", content_type="text/html"
+            )
+        return Response.error(404, "Not found")
+
+    def handled_Post(self, path, query, body):
+        return self._api_response("POST", path, query, body) or Response.error(404, "Not found")
+
+    def handled_Put(self, path, query, body):
+        return self._api_response("PUT", path, query, body) or Response.error(404, "Not found")
+
+    def handled_Delete(self, path, query):
+        return self._api_response("DELETE", path, query) or Response.error(404, "Not found")
+
+    def _api_response(self, method, path, query, body=b""):
+        if self.api is None:
+            return None
+        return self.api.handle(method, path, query, body)
+
+
+class AlarmServer(AlarmRoutes):
+    def __init__(
+        self,
+        server_class=ThreadingHTTPServer,
+        handler_class=Handler,
+        port=1024,
+        api=None,
+        live=None,
+        pages=None,
+        static=None,
+    ):
+        AlarmRoutes.__init__(self, api, live, pages, static)
         server_address = ("", port)
         self.httpd = server_class(server_address, handler_class)
-        self.worker = threading.Thread(target=self.run_server(), args=())
+        self.worker = threading.Thread(target=self._run_server, args=())
 
         logger.info("Starting httpd...")
         logger.info("127.0.0.1:" + str(port))
@@ -95,11 +366,10 @@ class AlarmServer(HandlerObserver):
     def _cleanup(self):
         if self.httpd is None:
             return
-        self.httpd.shutdown()
+        httpd, self.httpd = self.httpd, None
+        httpd.shutdown()
+        httpd.server_close()
         self.worker.join(1)
-        if self.worker.is_alive():
-            self.worker.abort()
-        self.httpd = None
 
     def _run_server(self):
         try:
@@ -109,7 +379,6 @@ class AlarmServer(HandlerObserver):
             self.httpd.shutdown()
             print("Server shutdown.")
             raise
-        self._cleanup()
 
     def start_server(self):
         self.worker.daemon = True
@@ -121,18 +390,34 @@ class AlarmServer(HandlerObserver):
 
 
 def run(server_class=ThreadingHTTPServer, handler_class=Handler, port=1024):
-    server_address = ("", port)
-    httpd = server_class(server_address, handler_class)
-
-    logger.info("Starting httpd...")
-    logger.info("127.0.0.1:" + str(port))
+    import alarmApi
+    import pages
+    import staticFiles
+    from viewModel import ViewModel
+
+    # the ViewModel's DB watches for other processes' changes, and its live state is what
+    # /api/status and /api/events report. Handler threads may write to the DB while the scheduler
+    # reloads it; the DB serializes the two, and the ViewModel applies the changes it is told of
+    # on the scheduler, so its alarms are never changed under an update
+    view_model = ViewModel()
+    server = AlarmServer(
+        server_class,
+        handler_class,
+        port,
+        api=alarmApi.AlarmAPI(view_model.db),
+        live=view_model.live,
+        pages=pages.Pages(view_model.db),
+        static=staticFiles.StaticFiles(),
+    )
     try:
-        httpd.serve_forever()
+        server.worker.join()
     except KeyboardInterrupt:
         print("Received shutdown command..")
-        httpd.shutdown()
+        server.stop_server()
         print("Server shutdown.")
         raise
+    finally:
+        view_model.db.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,187 @@
+import json
+import sqlite3
+import threading
+
+from tinydb.database import Document
+
+import utilities
+
+
+class SQLiteDatabase(object):
+    """
+    SQLite backed stand in for the parts of TinyDB that DB uses.
+
+    Tables are handed out by table(name) and look like TinyDB tables (insert, update, remove and
+    all by doc_id), so DB works the same on either. The database runs in WAL mode, so a change to
+    one alarm writes a page or two to the log rather than rewriting the whole file.
+    """
+
+    def __init__(self, path):
+        # DB may be used from the scheduler and server threads, the lock keeps it to one at a time
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._tables = {}
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            # with WAL, NORMAL only syncs at checkpoints, a power cut may lose the last change
+            # but never corrupts the file
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+
+    def table(self, name):
+        if name not in self._tables:
+            self._tables[name] = SQLiteTable(self, name)
+        return self._tables[name]
+
+    def execute(self, statement, parameters=()):
+        """
+        Run one statement in its own transaction
+        :return: sqlite3.Cursor
+        """
+        with self._lock, self._connection:
+            return self._connection.execute(statement, parameters)
+
+    def executemany(self, statement, parameters):
+        with self._lock, self._connection:
+            return self._connection.executemany(statement, parameters)
+
+    def query(self, statement, parameters=()):
+        with self._lock:
+            return self._connection.execute(statement, parameters).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class SQLiteTable(object):
+    # alarm fields that get their own (indexed) column, everything else is kept as JSON in extra
+    COLUMNS = ("id", "target_days", "target_hour", "target_minute", "active")
+
+    def __init__(self, database, name):
+        self._database = database
+        self.name = name
+        database.execute(
+            "CREATE TABLE IF NOT EXISTS {0} ("
+            "doc_id INTEGER PRIMARY KEY, "
+            "id INTEGER NOT NULL, "
+            "target_days INTEGER NOT NULL DEFAULT 0, "
+            "target_hour INTEGER NOT NULL DEFAULT 0, "
+            "target_minute INTEGER NOT NULL DEFAULT 0, "
+            "active INTEGER NOT NULL DEFAULT 1, "
+            "extra TEXT NOT NULL DEFAULT '{{}}')".format(self._quoted_name)
+        )
+        for index, columns in (
+            ("id", "id"),
+            ("days", "target_days"),
+            ("time", "target_hour, target_minute"),
+            ("active", "active"),
+        ):
+            unique = "UNIQUE " if index == "id" else ""
+            database.execute(
+                'CREATE {0}INDEX IF NOT EXISTS "{1}_{2}" ON {3} ({4})'.format(
+                    unique, name, index, self._quoted_name, columns
+                )
+            )
+
+    @property
+    def _quoted_name(self):
+        return '"{0}"'.format(self.name.replace('"', '""'))
+
+    def insert(self, document):
+        """
+        Insert a document
+        :param document: dict of alarm fields
+        :return: doc_id of the new row
+        """
+        columns, extra = self._split(document)
+        names = list(columns) + ["extra"]
+        statement = "INSERT INTO {0} ({1}) VALUES ({2})".format(
+            self._quoted_name, ", ".join(names), ", ".join("?" * len(names))
+        )
+        cursor = self._database.execute(statement, list(columns.values()) + [json.dumps(extra)])
+        return cursor.lastrowid
+
+    def update(self, fields, doc_ids):
+        """
+        Update the given fields (only) of the given documents
+        :param fields: dict of alarm fields to change
+        :param doc_ids: iterable of doc_id
+        :return: None
+        """
+        columns, extra = self._split(fields)
+        for doc_id in doc_ids:
+            values = dict(columns)
+            if len(extra) > 0:
+                values["extra"] = json.dumps(dict(self._extra(doc_id), **extra))
+            if len(values) == 0:
+                continue
+            statement = "UPDATE {0} SET {1} WHERE doc_id = ?".format(
+                self._quoted_name, ", ".join("{0} = ?".format(name) for name in values)
+            )
+            self._database.execute(statement, list(values.values()) + [doc_id])
+
+    def remove(self, doc_ids):
+        self._database.executemany(
+            "DELETE FROM {0} WHERE doc_id = ?".format(self._quoted_name),
+            [(doc_id,) for doc_id in doc_ids],
+        )
+
+    def all(self):
+        """
+        :return: list of Document (dict with a doc_id), as TinyDB's Table.all
+        """
+        rows = self._database.query(
+            "SELECT doc_id, {0}, extra FROM {1} ORDER BY doc_id".format(
+                ", ".join(SQLiteTable.COLUMNS), self._quoted_name
+            )
+        )
+        return [self._document(row) for row in rows]
+
+    def get(self, doc_id):
+        """
+        :return: Document, None if there isn't one with doc_id
+        """
+        rows = self._database.query(
+            "SELECT doc_id, {0}, extra FROM {1} WHERE doc_id = ?".format(
+                ", ".join(SQLiteTable.COLUMNS), self._quoted_name
+            ),
+            (doc_id,),
+        )
+        return self._document(rows[0]) if len(rows) > 0 else None
+
+    def __len__(self):
+        return self._database.query("SELECT COUNT(*) FROM {0}".format(self._quoted_name))[0][0]
+
+    def _extra(self, doc_id):
+        rows = self._database.query(
+            "SELECT extra FROM {0} WHERE doc_id = ?".format(self._quoted_name), (doc_id,)
+        )
+        return json.loads(rows[0][0]) if len(rows) > 0 else {}
+
+    @staticmethod
+    def _split(document):
+        columns = {}
+        extra = {}
+        for key, value in document.items():
+            if key == "target_days":
+                columns[key] = int(value)
+            elif key == "active":
+                columns[key] = int(bool(value))
+            elif key in SQLiteTable.COLUMNS:
+                columns[key] = value
+            else:
+                extra[key] = value
+        return columns, extra
+
+    @staticmethod
+    def _document(row):
+        doc_id, alarm_id, days, hour, minute, active, extra = row
+        values = json.loads(extra)
+        values.update(
+            id=alarm_id,
+            target_days=utilities.Days(days),
+            target_hour=hour,
+            target_minute=minute,
+            active=bool(active),
+        )
+        return Document(values, doc_id)
@@ -0,0 +1,120 @@
+import mimetypes
+import os
+import os.path
+import stat
+import threading
+import time
+
+import config
+from server import FileBody, Response
+
+STATIC_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), "AlarmUI")
+
+
+class StaticFiles(object):
+    """
+    Serves the files under a directory (AlarmUI/ by default) for the web UI.
+
+    Bodies are FileBody, which the servers send with sendfile, so file contents never pass through
+    Python. When the client accepts gzip and there is an up to date "<name>.gz" next to a file,
+    that is sent instead. Each file's size, modification time and ETag are kept in memory and
+    only checked on disk again after config.static_recheck_interval seconds.
+    """
+
+    def __init__(self, directory=STATIC_DIRECTORY, recheck_interval=None):
+        self.directory = os.path.realpath(directory)
+        self.recheck_interval = (
+            config.static_recheck_interval if recheck_interval is None else recheck_interval
+        )
+        self._lock = threading.Lock()
+        self._files = {}  # relative path -> _FileInfo
+
+    def response(self, path, accept_encoding=None):
+        """
+        :param path: path of the file, relative to the directory ("/" separated)
+        :param accept_encoding: the request's Accept-Encoding header, if any
+        :return: Response, None if there is no such file
+        """
+        info = self._info(path)
+        if info is None:
+            return None
+        headers = {"Vary": "Accept-Encoding"}
+        variant = info
+        if info.gzip is not None and _accepts_gzip(accept_encoding):
+            variant = info.gzip
+            headers["Content-Encoding"] = "gzip"
+        return Response(
+            body=FileBody(variant.path, variant.size),
+            content_type=info.content_type,
+            etag=variant.etag,
+            last_modified=variant.modified,
+            headers=headers,
+        )
+
+    def _info(self, path):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._files.get(path)
+        if cached is not None and now < cached.checked + self.recheck_interval:
+            return cached
+
+        info = self._stat(path, now)
+        with self._lock:
+            if info is None:
+                self._files.pop(path, None)  # misses aren't kept, any path could be asked for
+            else:
+                self._files[path] = info
+        return info
+
+    def _stat(self, path, now):
+        full_path = os.path.realpath(os.path.join(self.directory, path.lstrip("/")))
+        if not full_path.startswith(self.directory + os.sep):
+            return None  # outside the directory (such as "../")
+        try:
+            info = _FileInfo(full_path, now)
+        except (OSError, ValueError):
+            return None  # missing, a directory, or not a valid file name
+
+        try:
+            gzip = _FileInfo(full_path + ".gz", now, gzip=True)
+        except (OSError, ValueError):
+            gzip = None
+        # one older than the file is left over from a previous version of it
+        if gzip is not None and gzip.modified >= info.modified:
+            info.gzip = gzip
+        return info
+
+
+class _FileInfo(object):
+    __slots__ = ("path", "size", "modified", "etag", "content_type", "gzip", "checked")
+
+    def __init__(self, path, checked, gzip=False):
+        status = os.stat(path)
+        if not stat.S_ISREG(status.st_mode):
+            raise IsADirectoryError(path)
+        self.path = path
+        self.size = status.st_size
+        self.modified = status.st_mtime
+        self.etag = '"{0:x}-{1:x}{2}"'.format(
+            status.st_mtime_ns, status.st_size, "-gz" if gzip else ""
+        )
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.gzip = None
+        self.checked = checked
+
+
+def _accepts_gzip(accept_encoding):
+    if accept_encoding is None:
+        return False
+    for coding in accept_encoding.split(","):
+        name, _, parameters = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = parameters.strip()
+        if quality.startswith("q="):
+            try:
+                return float(quality[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
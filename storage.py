@@ -0,0 +1,272 @@
+import atexit
+import copy
+import json
+import os
+import struct
+import threading
+
+from tinydb.middlewares import Middleware
+from tinydb.storages import Storage
+
+import scheduler
+import utilities
+
+
+class AtomicFileStorage(Storage):
+    """
+    TinyDB file storage that never leaves a half written file behind.
+
+    Each write goes to a temporary file which is fsync'd and then renamed over the original.
+    Subclasses convert between the database and the file's bytes with _encode and _decode.
+    """
+
+    def __init__(self, path, fsync=True, **kwargs):
+        super(AtomicFileStorage, self).__init__()
+        self._path = path
+        self._fsync = fsync
+
+    def read(self):
+        try:
+            with open(self._path, "rb") as handle:
+                contents = handle.read()
+        except FileNotFoundError:
+            return None
+        if len(contents) == 0:
+            return None
+        return self._decode(contents)
+
+    def write(self, data):
+        temp_path = self._path + ".tmp"
+        with open(temp_path, "wb") as handle:
+            handle.write(self._encode(data))
+            handle.flush()
+            if self._fsync:
+                os.fsync(handle.fileno())
+        os.replace(temp_path, self._path)
+        if self._fsync:
+            self._fsync_directory()
+
+    def _encode(self, data):
+        raise NotImplementedError()
+
+    def _decode(self, contents):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+    def _fsync_directory(self):
+        # make the rename itself durable
+        if not hasattr(os, "O_DIRECTORY"):
+            return  # not supported (Windows)
+        directory = os.open(os.path.dirname(os.path.abspath(self._path)), os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+class AtomicJSONStorage(AtomicFileStorage):
+    def __init__(self, path, fsync=True, encoding=None, **kwargs):
+        super(AtomicJSONStorage, self).__init__(path, fsync)
+        self._encoding = encoding or "utf-8"
+        self.kwargs = kwargs  # passed on to json.dumps
+
+    def _encode(self, data):
+        return json.dumps(data, **self.kwargs).encode(self._encoding)
+
+    def _decode(self, contents):
+        return json.loads(contents.decode(self._encoding))
+
+
+class BinaryAlarmStorage(AtomicFileStorage):
+    """
+    TinyDB storage that keeps each alarm as a fixed width binary record.
+
+    The file is a header (magic, format version, table count) then, for each table, its name, its
+    record count and its records. A record is the doc_id, alarm id, day bitmask, hour, minute,
+    flags (active) and value, 18 bytes in all. Records are decoded straight out of the file's
+    buffer with struct.iter_unpack. Days are stored as their bitmask, so this storage is used
+    without the Days serialization middleware.
+    """
+
+    MAGIC = b"SRAB"
+    VERSION = 1
+    HEADER = struct.Struct("<4sBH")  # magic, version, table count
+    TABLE_HEADER = struct.Struct("<BI")  # name length (name follows), record count
+    RECORD = struct.Struct("<IqBBBBh")  # doc_id, id, days, hour, minute, flags, value
+    FIELDS = frozenset(("id", "target_days", "target_hour", "target_minute", "active", "_value"))
+    ACTIVE = 0x01
+
+    def _encode(self, data):
+        parts = [
+            BinaryAlarmStorage.HEADER.pack(
+                BinaryAlarmStorage.MAGIC, BinaryAlarmStorage.VERSION, len(data)
+            )
+        ]
+        for name, documents in data.items():
+            encoded_name = name.encode("utf-8")
+            parts.append(BinaryAlarmStorage.TABLE_HEADER.pack(len(encoded_name), len(documents)))
+            parts.append(encoded_name)
+            for doc_id, document in documents.items():
+                parts.append(BinaryAlarmStorage._encode_record(int(doc_id), document))
+        return b"".join(parts)
+
+    @staticmethod
+    def _encode_record(doc_id, document):
+        unknown = set(document) - BinaryAlarmStorage.FIELDS
+        if len(unknown) > 0:
+            raise Exception("Can't store {0} in a binary alarm record".format(sorted(unknown)))
+        flags = BinaryAlarmStorage.ACTIVE if document.get("active", True) else 0
+        return BinaryAlarmStorage.RECORD.pack(
+            doc_id,
+            document.get("id", 0),
+            int(document.get("target_days", 0)),
+            document.get("target_hour", 0),
+            document.get("target_minute", 0),
+            flags,
+            document.get("_value", 0),
+        )
+
+    def _decode(self, contents):
+        view = memoryview(contents)
+        magic, version, table_count = BinaryAlarmStorage.HEADER.unpack_from(view)
+        if magic != BinaryAlarmStorage.MAGIC:
+            raise Exception("Not a binary alarm file: {0}".format(self._path))
+        if version != BinaryAlarmStorage.VERSION:
+            raise Exception("Unsupported binary alarm file version: {0}".format(version))
+
+        data = {}
+        offset = BinaryAlarmStorage.HEADER.size
+        for _ in range(table_count):
+            name_length, count = BinaryAlarmStorage.TABLE_HEADER.unpack_from(view, offset)
+            offset += BinaryAlarmStorage.TABLE_HEADER.size
+            name = bytes(view[offset : offset + name_length]).decode("utf-8")
+            offset += name_length
+            end = offset + count * BinaryAlarmStorage.RECORD.size
+            data[name] = {
+                str(doc_id): {
+                    "id": alarm_id,
+                    "target_days": utilities.Days(days),
+                    "target_hour": hour,
+                    "target_minute": minute,
+                    "active": bool(flags & BinaryAlarmStorage.ACTIVE),
+                    "_value": value,
+                }
+                for doc_id, alarm_id, days, hour, minute, flags, value in (
+                    BinaryAlarmStorage.RECORD.iter_unpack(view[offset:end])
+                )
+            }
+            offset = end
+        return data
+
+
+class WriteBehindMiddleware(Middleware):
+    """
+    Keeps the database in memory and writes it to the wrapped storage in batches.
+
+    A write is flushed once flush_count writes are pending, or flush_delay seconds after the first
+    pending write (on the shared scheduler), whichever is sooner. Pending writes are also flushed
+    by flush(), close() and at interpreter exit.
+
+    reload() re-reads the wrapped storage for changes made by another process, keeping any pending
+    writes. Each document written or removed since the last flush replaces the stored one.
+    """
+
+    def __init__(self, storage_cls, flush_delay=5, flush_count=20, on_write=None):
+        """
+        :param on_write: called (with no arguments) after each write to the wrapped storage
+        """
+        super(WriteBehindMiddleware, self).__init__(storage_cls)
+        self.flush_delay = flush_delay
+        self.flush_count = flush_count
+        self._on_write = on_write
+        self.cache = None
+        self._stored = None  # copy of what the wrapped storage holds, as last read or written
+        self._pending = 0
+        self._lock = threading.RLock()
+        self._flush_job = None
+
+    def __call__(self, *args, **kwargs):
+        result = super(WriteBehindMiddleware, self).__call__(*args, **kwargs)
+        atexit.register(self.flush)
+        return result
+
+    def read(self):
+        with self._lock:
+            if self.cache is None:
+                self.cache = self.storage.read()
+                self._stored = copy.deepcopy(self.cache)
+            return self.cache
+
+    def write(self, data):
+        with self._lock:
+            self.cache = data
+            self._pending += 1
+            if self._pending >= self.flush_count:
+                self.flush()
+            elif self._flush_job is None:
+                self._flush_job = scheduler.get_scheduler().call_later(self.flush_delay, self.flush)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def flush(self):
+        with self._lock:
+            if self._flush_job is not None:
+                self._flush_job.cancel()
+                self._flush_job = None
+            if self._pending > 0:
+                self.storage.write(self.cache)
+                self._stored = copy.deepcopy(self.cache)
+                self._pending = 0
+                if self._on_write is not None:
+                    self._on_write()
+
+    def reload(self):
+        """
+        Read the wrapped storage again, without flushing, then redo the pending writes on top
+        :return: None
+        """
+        with self._lock:
+            stored = self.storage.read()
+            cache = stored
+            if self._pending > 0:
+                cache = _merge_pending(self._stored or {}, self.cache or {}, stored or {})
+            self._stored = copy.deepcopy(stored)
+            self.cache = cache
+
+    def close(self):
+        self.flush()
+        atexit.unregister(self.flush)
+        self.storage.close()
+
+
+def _merge_pending(before, after, stored):
+    """
+    :param before: tables as last read from or written to the storage
+    :param after: tables with the pending writes
+    :param stored: tables as the storage holds them now
+    :return: stored with every document that differs between before and after set as in after
+    """
+    merged = copy.deepcopy(stored)
+    for name in set(before) | set(after):
+        # doc_ids are ints once TinyDB has written, strings as read back from JSON
+        before_table = {str(doc_id): document for doc_id, document in before.get(name, {}).items()}
+        after_table = {str(doc_id): document for doc_id, document in after.get(name, {}).items()}
+        table = {str(doc_id): document for doc_id, document in merged.get(name, {}).items()}
+        merged[name] = table
+        for doc_id in set(before_table) | set(after_table):
+            document = after_table.get(doc_id)
+            if before_table.get(doc_id) == document:
+                continue  # not changed by this process
+            if document is None:
+                table.pop(doc_id, None)
+            elif doc_id not in before_table and table.get(doc_id, document) != document:
+                # both processes inserted with the same doc_id, this one moves to a free one
+                free_id = max(int(key) for key in set(table) | set(after_table)) + 1
+                table[str(free_id)] = document
+            else:
+                table[doc_id] = document
+    return merged
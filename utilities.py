@@ -1,7 +1,7 @@
-import math
 from flags import Flags
 from datetime import datetime
 import json
+import time
 import uuid
 from tinydb_serialization import Serializer
 
@@ -20,8 +20,17 @@ class TestableDateTime(object):
 
 
 class _MockController:
+    # script states, same values as pigpio's
+    PI_SCRIPT_INITING = 0
+    PI_SCRIPT_HALTED = 1
+    PI_SCRIPT_RUNNING = 2
+    PI_SCRIPT_WAITING = 3
+    PI_SCRIPT_FAILED = 4
+
     def __init__(self):
         self.values = {}
+        self.scripts = {}  # script id -> _MockScript
+        self._next_script_id = 0
 
     @classmethod
     def pi(cls):
@@ -30,12 +39,85 @@ class _MockController:
     def stop(self):
         pass
 
+    def set_PWM_range(self, pin, value):
+        pass
+
     def set_PWM_dutycycle(self, pin, value):
         self.values[pin] = value
 
     def read(self, pin):
         return self.values[pin]
 
+    def get_PWM_dutycycle(self, pin):
+        return self.values[pin]
+
+    def store_script(self, script):
+        script_id = self._next_script_id
+        self._next_script_id += 1
+        self.scripts[script_id] = _MockScript(self, script)
+        return script_id
+
+    def run_script(self, script_id, params=None):
+        self.scripts[script_id].start()
+
+    def script_status(self, script_id):
+        return self.scripts[script_id].status(), [0] * 10
+
+    def stop_script(self, script_id):
+        self.scripts[script_id].stop()
+
+    def delete_script(self, script_id):
+        del self.scripts[script_id]
+
+
+class _MockScript(object):
+    """
+    Runs the pwm/mils subset of pigpio's script language against a _MockController in real time
+    (commands are applied when the script's status is checked)
+    """
+
+    def __init__(self, controller, script):
+        self._controller = controller
+        argument_counts = {"pwm": 2, "mils": 1}
+        tokens = script.split()
+        self.commands = []
+        i = 0
+        while i < len(tokens):
+            command = tokens[i].lower()
+            count = argument_counts[command]
+            self.commands.append((command, [int(arg) for arg in tokens[i + 1 : i + 1 + count]]))
+            i += 1 + count
+        self._started = None
+        self._position = 0
+        self._resume_at = 0  # ms since start the next command runs at
+
+    def start(self):
+        self._started = time.monotonic()
+        self._position = 0
+        self._resume_at = 0
+
+    def stop(self):
+        self._advance()
+        self._started = None
+
+    def status(self):
+        self._advance()
+        if self._started is None or self._position >= len(self.commands):
+            return _MockController.PI_SCRIPT_HALTED
+        return _MockController.PI_SCRIPT_RUNNING
+
+    def _advance(self):
+        if self._started is None:
+            return
+        elapsed = (time.monotonic() - self._started) * 1000
+        while self._position < len(self.commands) and self._resume_at <= elapsed:
+            command, args = self.commands[self._position]
+            if command == "pwm":
+                self._controller.set_PWM_dutycycle(args[0], args[1])
+            else:
+                self._resume_at += args[0]
+            self._position += 1
+
 
 class _MockPWM_LED(object):
     def __init__(self, pin):
@@ -67,14 +149,39 @@ class Days(Flags):
 
     @classmethod
     def increment(cls, object):
-        day_base_value = int(math.log(int(object), 2))
+        day_base_value = int(object).bit_length() - 1  # log2 of the (highest) day set
         next_day_base_value = (day_base_value - 1) % 7
-        return Days(int(math.pow(2, next_day_base_value)))
+        return Days(1 << next_day_base_value)
 
     def __add__(self, other):
         return Days(self | other)
 
 
+# region day bitmask tables
+# Days as plain ints for the hot paths: weekday is Sun = 0, Sat = 6 and masks use the Days bit values.
+
+# bit for each weekday
+WEEKDAY_BITS = tuple(1 << (6 - weekday) for weekday in range(7))
+
+# Days flag for each weekday
+WEEKDAY_FLAGS = tuple(Days(bit) for bit in WEEKDAY_BITS)
+
+# DAYS_UNTIL_NEXT[mask][weekday] - days after weekday until the next day set in mask, 1-7
+# (7 being the same day next week), 0 if mask has no days set
+DAYS_UNTIL_NEXT = tuple(
+    tuple(
+        next(
+            (ahead for ahead in range(1, 8) if mask & WEEKDAY_BITS[(weekday + ahead) % 7]),
+            0,
+        )
+        for weekday in range(7)
+    )
+    for mask in range(128)
+)
+
+# endregion
+
+
 class DaysSerializer(Serializer):
     OBJ_CLASS = Days
 
@@ -102,8 +209,7 @@ def convert_weekday_to_days_flag(weekday):
     :return: Days.{corresponding day}
     """
 
-    inverted_value = 6 - weekday
-    return Days(2 ** inverted_value)
+    return WEEKDAY_FLAGS[weekday]
 
 
 def convert_days_flag_to_weekday(day):
@@ -112,7 +218,7 @@ def convert_days_flag_to_weekday(day):
     :param day: Days flag
     :return: weekday (Sun = 0, Sat = 6)
     """
-    inverted_value = 6 - int(math.log(int(day), 2))
+    inverted_value = 6 - (int(day).bit_length() - 1)
     return inverted_value
 
 
@@ -1,37 +1,243 @@
+import collections
 import database
 import alarmComposite
 from alarm import Alarm
 
+import config
+from configObserver import ConfigObserver
 import LEDController
-import time
+import scheduler
+import threading
+from datetime import datetime, timedelta
+import utilities
+from fadeEngine import FadeEngine
+from liveState import LiveState
 from repeatedTimer import RepeatedTimer
 
 
-class ViewModel(object):
+class ViewModel(ConfigObserver):
     def __init__(self):
+        ConfigObserver.__init__(self)
         self.db = database.DB("alarms.json")
         self.alarms = alarmComposite.AlarmComposite()
         self.led = LEDController.LEDController()
+        # brightness and next alarm as of the last update, for /api/events
+        self.live = LiveState()
 
+        self._alarms_by_id = {}  # the alarms in self.alarms, by DB id
+        # DB changes, made on whichever thread wrote (an HTTP handler, the CLI), wait here to be
+        # applied to self.alarms on the scheduler, the only thread that touches it
+        self._alarm_events = collections.deque()  # (apply, argument)
+        # the last AlarmComposite.evaluate, only worked out again once the alarms change or its
+        # window or next alarm has passed; in between brightness comes from the weekly table
+        self._state = None
+        self._state_due = None
         for alarm in self.db.get_alarms():
+            self._alarms_by_id[alarm.id] = alarm
             self.alarms.add_alarm(alarm)
+        self._scheduler = scheduler.get_scheduler()
+        if config.sleep_between_alarms:
+            self._timer = None
+            self._alarms_changed = threading.Event()
+            self._window = None
+            self._fade = FadeEngine(self.alarms, self.led)
+            self._update_job = self._scheduler.create_job(self._scheduled_update)
+            self._update_job.reschedule(0)
+        else:
+            self._timer = RepeatedTimer(1, self._tick, scheduler=self._scheduler)
 
-        self._timer = RepeatedTimer(1, self._set_brightness)
+        # keep self.alarms in step with the DB, including changes made by other processes
+        self.db.add_observer(self)
+        if config.db_watch:
+            self.db.watch()
 
     def add_alarm(self):
         alarm = Alarm()
-        self.db.add_alarm(alarm)
-        self.alarms.add_alarm(alarm)
+        self.db.add_alarm(alarm)  # added to self.alarms by alarm_added
         # TODO: return db ID for alarm.
 
-    def _set_brightness(self):
-        brightness = self.alarms.get_desired_brightness()
-        self.led.value = brightness
-        # print("Setting brightness to: {0}".format(brightness))
-        time.sleep(1)
+    def alarm_added(self, alarm):
+        # a copy, the writer may go on changing its alarm while the event waits
+        self._queue_alarm_event(self._add_alarm, database.DBAlarm.copy(alarm))
+
+    def alarm_deleted(self, id):
+        self._queue_alarm_event(self._delete_alarm, id)
+
+    def alarm_changed(self, alarm):
+        self._queue_alarm_event(self._change_alarm, database.DBAlarm.copy(alarm))
+
+    def _queue_alarm_event(self, apply, argument):
+        self._alarm_events.append((apply, argument))
+        self._wake()
+
+    def _apply_alarm_events(self):
+        """
+        Apply the DB changes queued by the observer calls to self.alarms, on the scheduler
+        :return: True if there were any
+        """
+        applied = False
+        while True:
+            try:
+                apply, argument = self._alarm_events.popleft()
+            except IndexError:
+                return applied
+            apply(argument)
+            applied = True
+
+    def _add_alarm(self, alarm):
+        if alarm.id in self._alarms_by_id:
+            self._change_alarm(alarm)
+            return
+        self._alarms_by_id[alarm.id] = alarm
+        self.alarms.add_alarm(alarm)
+
+    def _delete_alarm(self, id):
+        alarm = self._alarms_by_id.pop(id, None)
+        if alarm is not None:
+            self.alarms.remove_alarm(alarm)
+
+    def _change_alarm(self, alarm):
+        current = self._alarms_by_id.get(alarm.id)
+        if current is None:
+            self._add_alarm(alarm)
+            return
+        # move the changes onto the alarm self.alarms holds (which updates the composite's
+        # indexes through its observer)
+        for key, value in alarm.to_dict().items():
+            setattr(current, key, value)
+        current.mark_clean()
+
+    def _tick(self):
+        changed = self._apply_alarm_events()
+        now = utilities.TestableDateTime.now()
+        self._refresh_state(now, changed)
+        self.led.value = self.alarms.get_desired_brightness(now)
+        self._publish(now)
+
+    def _refresh_state(self, now, changed):
+        """
+        Evaluate the alarms again if they changed or the last evaluation has passed
+        :param now: datetime
+        :param changed: True if the alarms changed since the last update
+        :return: None
+        """
+        if not changed and self._state is not None and now < self._state_due:
+            return
+        state = self._state = self.alarms.evaluate(now)
+        due = [
+            time
+            for time in (state.target_datetime, state.window and state.window[1])
+            if time is not None
+        ]
+        self._state_due = min(due) if len(due) > 0 else datetime.max
+
+    def _publish(self, now):
+        """
+        Pass the state of an update on to self.live, which only sends what changed
+        :param now: datetime of the update
+        :return: None
+        """
+        self.live.publish("brightness", round(self.alarms.get_desired_brightness(now), 1))
+        state = self._state
+        if state.target_datetime is None:
+            self.live.publish("next_alarm", None)
+        else:
+            alarm = state.nearest_alarm
+            self.live.publish(
+                "next_alarm",
+                {
+                    "id": str(alarm.id),
+                    "time": state.target_datetime.isoformat(),
+                    "active": alarm.active,
+                },
+            )
+
+    def _scheduled_update(self):
+        # the job only runs again if rescheduled, so it is even when the update fails part way
+        # (such as losing pigpiod), or the LED would stay as it is for good
+        delay = config.update_retry_delay
+        try:
+            delay = self._update()
+        finally:
+            self._update_job.reschedule(delay)
+
+    def _update(self):
+        """
+        Set the LED and publish the state for now
+        :return: seconds until the next update
+        """
+        changed = self._alarms_changed.is_set()
+        self._alarms_changed.clear()
+        # after the clear, so a change queued from here on sets it again and is picked up below
+        changed = self._apply_alarm_events() or changed
+
+        now = utilities.TestableDateTime.now()
+        self._refresh_state(now, changed)
+        window_changed = changed or self._state.window != self._window
+        self._window = self._state.window
+
+        if config.hardware_fade and self._window is not None and self._window[0] <= now:
+            if window_changed or not self.led.ramp_running:
+                self._start_hardware_fade(now, self._window[1])
+            # the daemon runs the fade, sleep through it
+            self._fade.reset()
+            delay = min((self._window[1] - now).total_seconds(), config.max_idle_sleep)
+        elif self._window is not None and self._window[0] <= now:
+            self.led.cancel_ramp()
+            delay = self._fade.frame(now)
+            until_end = (self._window[1] - now).total_seconds()
+            delay = until_end if delay is None else min(delay, until_end)
+        else:
+            self.led.cancel_ramp()
+            self._fade.reset()
+            brightness = self.alarms.get_desired_brightness(now)
+            self.led.value = brightness
+            delay = self._seconds_until_next_update(self._window, now)
+            if brightness > 0:
+                delay = min(delay, 1)  # the last instant of a window, off straight after
+        self._publish(now)
+
+        if self._alarms_changed.is_set():
+            delay = 0  # changed while updating, don't wait for the reschedule from _wake
+            self._fade.reset()
+        return delay
+
+    def _start_hardware_fade(self, now, end):
+        seconds = int((end - now).total_seconds())
+        percentages = [
+            self.alarms.get_desired_brightness(now + timedelta(seconds=second))
+            for second in range(seconds + 1)
+        ]
+        self.led.start_ramp(percentages)
+
+    @staticmethod
+    def _seconds_until_next_update(window, now):
+        """
+        Get how long the scheduled loop can sleep before the LED may need to change
+        :param window: (start, end) of the next alarm window, or None
+        :param now: datetime
+        :return: seconds to sleep, 1 while inside an alarm's window
+        """
+        if window is None:
+            return config.max_idle_sleep
+
+        start, end = window
+        until_start = (start - now).total_seconds()
+        if until_start <= 0:
+            return 1
+        return min(until_start, config.max_idle_sleep)
+
+    def _wake(self):
+        # alarms changed, re-evaluate the schedule now rather than at the end of the current sleep
+        if self._timer is None:
+            self._alarms_changed.set()
+            self._update_job.reschedule(0)
 
     def __del__(self):
-        self._timer.stop()
+        if self._timer is None:
+            self._update_job.cancel()
+        else:
+            self._timer.stop()
 
 
 def _main():